@@ -3,7 +3,7 @@ Application package constructor.
 
 Methods
 -------
-create_app(config_name)
+create_app(config_name, **settings)
     Application factory function.
 """
 
@@ -19,7 +19,34 @@ login_manager.login_view = 'auth.login'
 ckeditor = CKEditor()
 db = SQLAlchemy()
 
-def create_app(config_name):
+from .cache import FragmentCache
+fragment_cache = FragmentCache()
+
+from .feeds import FeedCache
+feed_cache = FeedCache()
+
+from .pagination import ListingTotals
+listing_totals = ListingTotals()
+
+from .metrics import Metrics
+metrics = Metrics()
+
+from .instrumentation import Instrumentation
+instrumentation = Instrumentation()
+
+from .compression import Compression
+compression = Compression()
+
+from .slow_queries import SlowQueryLog
+slow_query_log = SlowQueryLog()
+
+from .page_cache import PageCache
+page_cache = PageCache()
+
+from .assets import Assets
+assets = Assets()
+
+def create_app(config_name, **settings):
     """
     Application factory function to launch the application by creating the application instance.
 
@@ -29,19 +56,31 @@ def create_app(config_name):
     must be set in order to access filters without running the blog.py script.
 
     :param str config_name: The configuration to use when creating the app.
+    :param settings: Settings overriding the configuration's, e.g. SQLALCHEMY_DATABASE_URI.
     :return Flask app: The Flask application instance.
     """
 
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.config.update(settings)
     config[config_name].init_app(app)
 
     db.init_app(app)
     ckeditor.init_app(app)
     login_manager.init_app(app)
+    fragment_cache.init_app(app)
+    feed_cache.init_app(app)
+    listing_totals.init_app(app)
+    metrics.init_app(app)
+    instrumentation.init_app(app)
+    compression.init_app(app)
+    slow_query_log.init_app(app)
+    page_cache.init_app(app)
+    assets.init_app(app)
 
     # Filters need to be set as Jinja environment variables to be used during testing
     if app.config['TESTING']:
+        from .text import truncate_html
 
         def time_filter(time, format="%B %-d, %Y at %-I:%M %p"):
             """
@@ -59,15 +98,14 @@ def create_app(config_name):
             """
             Create a preview of a post's body.
 
-            Outside of the post's permalink page, only the first 2000 characters should be
+            Outside of the post's permalink page, only the first 2000 characters of text should be
             displayed. If a post is shorter than 2000 characters, then the entire post can be returned.
+            The text is cut without splitting HTML tags. Posts store a precomputed preview, so this
+            is only needed for posts saved before the body_preview column existed.
             :param str text: The entire body of a post.
             :return str: The first 2000 characters of a post, plus an ellipses to indicate continuation
             """
-            if len(text) < 2000:
-                return text
-            else:
-                return text[0:2000] + '...'
+            return truncate_html(text, app.config['BLOG_PREVIEW_LENGTH'])
         app.jinja_env.filters['preview'] = text_preview
 
     from .main import main as main_blueprint
@@ -0,0 +1,202 @@
+"""
+Fingerprinted static assets with far-future caching.
+
+`flask build-assets` copies every file of the static folder to BLOG_ASSETS_DIR
+under a name containing a hash of its content, e.g. styles.3f2a9c0b71d4.css,
+along with gzip and, if the brotli package is installed, brotli versions of the
+files worth compressing, and writes manifest.json mapping each file's name to
+its fingerprinted name. Templates link files with asset_url(), which returns the
+URL of the fingerprinted copy once assets are built and the plain static URL
+otherwise, so the application works without the build step.
+
+A fingerprinted file never changes: a new version gets a new name. So copies
+are served with a Cache-Control of a year and 'immutable', and browsers never
+revalidate them. Precompressed versions are served as they are to clients that
+accept them, without compressing anything per request.
+
+Classes
+-------
+Assets
+    The application's fingerprinted static assets.
+
+Methods
+-------
+build_assets(source, destination, clean)
+    Write fingerprinted and precompressed copies of static files and their manifest.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+from flask import current_app, request, send_from_directory, url_for
+from .compression import COMPRESSIBLE_TYPES, ENCODINGS, compress
+
+MANIFEST = 'manifest.json'
+
+# The file name suffix of each precompressed encoding
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# The number of hex digits of the content hash in a fingerprinted name
+HASH_LENGTH = 12
+
+
+def _fingerprinted_name(name, data):
+    """
+    Insert a hash of a file's content into its name, before the extension.
+    """
+    root, ext = os.path.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:HASH_LENGTH], ext)
+
+
+def _write(path, data):
+    """
+    Write a file atomically, so a running application never serves half of it.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    # mkstemp() makes files readable by their owner only
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def build_assets(source, destination, clean=False):
+    """
+    Write fingerprinted and precompressed copies of static files and their manifest.
+
+    Copies from earlier builds are kept unless clean is set, so pages rendered
+    before the build, and still cached by browsers, can load their assets.
+
+    :param str source: The static folder.
+    :param str destination: The directory to write the copies to.
+    :param bool clean: Flag indicating that files not part of this build should be deleted.
+    :return dict: The manifest, mapping each file's name, relative to source, to its copy's.
+    """
+    destination = os.path.abspath(destination)
+    manifest = {}
+    written = {MANIFEST}
+    for directory, dirnames, filenames in os.walk(source):
+        # Never copy an earlier build placed inside the static folder
+        dirnames[:] = sorted(d for d in dirnames
+                             if os.path.abspath(os.path.join(directory, d)) != destination)
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            fingerprinted = _fingerprinted_name(name, data)
+            target = os.path.join(destination, *fingerprinted.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                _write(target, data)
+            written.add(fingerprinted)
+            if mimetypes.guess_type(name)[0] in COMPRESSIBLE_TYPES:
+                for encoding in ENCODINGS:
+                    compressed = compress(data, encoding)
+                    if len(compressed) < len(data):
+                        _write(target + SUFFIXES[encoding], compressed)
+                        written.add(fingerprinted + SUFFIXES[encoding])
+            manifest[name] = fingerprinted
+    os.makedirs(destination, exist_ok=True)
+    _write(os.path.join(destination, MANIFEST),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    if clean:
+        for directory, dirnames, filenames in os.walk(destination, topdown=False):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if os.path.relpath(path, destination).replace(os.sep, '/') not in written:
+                    os.remove(path)
+            if directory != destination and not os.listdir(directory):
+                shutil.rmtree(directory)
+    return manifest
+
+
+class Assets:
+    """
+    The application's fingerprinted static assets.
+
+    Methods
+    -------
+    init_app(app)
+        Load the manifest, register the route serving the copies and add asset_url() to templates.
+    load(app)
+        Read the manifest of the built assets.
+    url(filename)
+        Get the URL of a static file, fingerprinted if the assets are built.
+    """
+
+    def init_app(self, app):
+        """
+        Load the manifest, register the route serving the copies and add asset_url() to templates.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        app.extensions['assets'] = self.load(app)
+        app.add_url_rule(app.config['BLOG_ASSETS_URL'] + '/<path:filename>', 'assets',
+                         self._send)
+        app.jinja_env.globals['asset_url'] = self.url
+
+    @staticmethod
+    def load(app):
+        """
+        Read the manifest of the built assets, and find their precompressed versions.
+
+        :param Flask app: The application instance.
+        :return dict: The manifest and, for each copy, the encodings it is precompressed in.
+        """
+        directory = app.config['BLOG_ASSETS_DIR']
+        try:
+            with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        encodings = {}
+        for fingerprinted in manifest.values():
+            encodings[fingerprinted] = tuple(
+                encoding for encoding in ENCODINGS
+                if os.path.exists(os.path.join(directory, fingerprinted + SUFFIXES[encoding])))
+        return {'manifest': manifest, 'encodings': encodings}
+
+    def url(self, filename):
+        """
+        Get the URL of a static file, fingerprinted if the assets are built.
+
+        In debug mode the manifest is read again, so rebuilding takes effect without
+        a restart.
+
+        :param str filename: The file's name in the static folder.
+        :return str: The URL of the file's fingerprinted copy, or its static URL.
+        """
+        app = current_app._get_current_object()
+        if app.debug:
+            app.extensions['assets'] = self.load(app)
+        fingerprinted = app.extensions['assets']['manifest'].get(filename)
+        if fingerprinted is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=fingerprinted)
+
+    @staticmethod
+    def _send(filename):
+        """
+        Serve a fingerprinted copy, precompressed if the client accepts it, cached for good.
+        """
+        app = current_app._get_current_object()
+        directory = app.config['BLOG_ASSETS_DIR']
+        # Copies from earlier builds are served too, just never precompressed
+        encodings = app.extensions['assets']['encodings'].get(filename, ())
+        encoding = request.accept_encodings.best_match(encodings) if encodings else None
+        max_age = app.config['BLOG_ASSETS_MAX_AGE']
+        if encoding is None:
+            response = send_from_directory(directory, filename, max_age=max_age)
+        else:
+            response = send_from_directory(directory, filename + SUFFIXES[encoding], max_age=max_age,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,265 @@
+"""
+Route-level benchmarks over datasets of several sizes.
+
+For each dataset size, a SQLite database is seeded with app.fake.seed() (and kept
+in the data directory, so large datasets are only generated once) and every
+benchmarked route is requested through the Flask test client. For each route, the
+latency of repeated requests, the number of SQL statements per request and the
+peak memory allocated while handling one request are recorded.
+
+Results are plain JSON, so runs can be kept and compared across commits: compare()
+reports every route that got slower, ran more queries or used more memory than in
+a baseline run by more than the given thresholds.
+
+Run with `flask bench`.
+
+Methods
+-------
+run(sizes, repeat, data_dir, progress)
+    Benchmark every route on datasets of the given sizes.
+compare(results, baseline, latency_threshold, memory_threshold)
+    Find the regressions between two benchmark runs.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from urllib.parse import quote
+from sqlalchemy import event
+from . import create_app, db, fake
+from .models import Post, Role, Tag, User
+from .pagination import encode_cursor
+
+# Bumped whenever seeding changes, so stale datasets are generated again
+DATASET_VERSION = 2
+
+ADMIN_PASSWORD = 'benchmark'
+
+
+def _dataset_params(size):
+    """
+    Get the arguments of app.fake.seed() for a dataset of a given size.
+    """
+    return {'posts': size, 'users': max(10, size // 1000), 'tags': min(5000, max(20, size // 100)),
+            'seed': 0}
+
+
+def _create_app(database):
+    """
+    Create an application using a benchmark database.
+
+    The testing configuration is used so that the templates' filters are registered,
+    with CSRF protection off so that forms can be posted.
+    """
+    return create_app('testing', SQLALCHEMY_DATABASE_URI='sqlite:///' + database,
+                      WTF_CSRF_ENABLED=False)
+
+
+def _prepare_dataset(size, data_dir, progress=None):
+    """
+    Get the path of a seeded database with size posts, generating it if needed.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    database = os.path.abspath(os.path.join(data_dir, 'bench-%d.sqlite' % size))
+    marker = database + '.json'
+    params = dict(_dataset_params(size), version=DATASET_VERSION)
+    try:
+        with open(marker) as f:
+            if json.load(f) == params and os.path.exists(database):
+                return database
+    except (OSError, ValueError):
+        pass
+    if os.path.exists(database):
+        os.remove(database)
+    app = _create_app(database)
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(name='Admin', username=app.config['BLOG_ADMIN'],
+                            password=ADMIN_PASSWORD))
+        db.session.commit()
+        seed = dict(params)
+        del seed['version']
+        fake.seed(batch_size=5000, progress=progress, **seed)
+    with open(marker, 'w') as f:
+        json.dump(params, f)
+    return database
+
+
+class _QueryCounter:
+    """
+    Count the SQL statements executed on an engine.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def _measure(app, request, repeat):
+    """
+    Measure one route.
+
+    :param Flask app: The application.
+    :param func request: Makes one request and returns the response.
+    :param int repeat: The number of timed requests. The route is requested twice more,
+        once to warm up and once to measure memory.
+    :return dict: Latency statistics in milliseconds, queries per request and peak memory in KiB.
+    """
+    request()    # Warm up caches and connections
+    latencies = []
+    queries = []
+    for _ in range(repeat):
+        with _QueryCounter(db.engine) as counter:
+            start = time.perf_counter()
+            response = request()
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError('%s returned %s' % (request.__name__, response.status))
+        queries.append(counter.count)
+    tracemalloc.start()
+    try:
+        request()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    latencies.sort()
+    return {'median_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+            'min_ms': round(latencies[0], 3),
+            'queries': max(queries),
+            'peak_kib': round(peak / 1024, 1)}
+
+
+def _benchmark_size(database, repeat):
+    """
+    Benchmark every route against one dataset.
+    """
+    app = _create_app(database)
+    results = {}
+    with app.app_context():
+        total = Post.query.count()
+        deep = db.session.query(Post.time, Post.id).order_by(Post.time.desc(), Post.id.desc()) \
+            .offset(max(0, int(total * 0.9) - 1)).first()
+        middle = db.session.query(Post.id).order_by(Post.id).offset(total // 2).limit(1).scalar()
+        tag = Tag.query.order_by(Tag.post_count.desc()).first().name
+        author = db.session.query(Post.author).group_by(Post.author) \
+            .order_by(db.func.count().desc()).limit(1).scalar()
+
+        reader = app.test_client()
+        writer = app.test_client()
+        writer.post('/auth/login', data={'username': app.config['BLOG_ADMIN'],
+                                         'password': ADMIN_PASSWORD})
+        created = []
+
+        def index():
+            return reader.get('/')
+
+        def index_deep():
+            return reader.get('/?after=%s' % encode_cursor(*deep))
+
+        def tagged():
+            return reader.get('/tagged/%s' % quote(tag))
+
+        def by_author():
+            return reader.get('/author/%s' % quote(author))
+
+        def post():
+            return reader.get('/post/%d' % middle)
+
+        def new_post():
+            response = writer.post('/new_post', data={
+                'title': 'Benchmark post', 'body': '<p>A new post for benchmarking.</p>',
+                'tags': '%s, benchmark' % tag})
+            created.append(int(response.headers['Location'].rstrip('/').rsplit('/', 1)[-1]))
+            return response
+
+        def edit():
+            return writer.post('/edit/%d' % created[-1], data={
+                'title': 'Edited benchmark post', 'body': '<p>Edited %d.</p>' % len(created),
+                'tags': 'benchmark, %s' % tag})
+
+        def delete():
+            return writer.get('/delete/%d' % created.pop())
+
+        # delete is requested as many times as new_post, removing every post it created,
+        # so the dataset is the same for the next run
+        for route in (index, index_deep, tagged, by_author, post, new_post, edit, delete):
+            results[route.__name__] = _measure(app, route, repeat)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=(1000,), repeat=20, data_dir='tmp/benchmarks', progress=None):
+    """
+    Benchmark every route on datasets of the given sizes.
+
+    :param iterable(int) sizes: The numbers of posts in the datasets.
+    :param int repeat: The number of timed requests per route.
+    :param str data_dir: The directory to keep the seeded databases in.
+    :param func progress: Called with a message as each step starts.
+    :return dict: The results, ready to be saved as JSON.
+    """
+    progress = progress or (lambda message: None)
+    results = {'commit': _git_commit(), 'date': datetime.utcnow().isoformat(),
+               'repeat': repeat, 'sizes': {}}
+    for size in sizes:
+        progress('Preparing a dataset of %d posts' % size)
+        database = _prepare_dataset(
+            size, data_dir, lambda created, seconds: progress('  seeded %d posts' % created))
+        progress('Benchmarking %d posts' % size)
+        results['sizes'][str(size)] = _benchmark_size(database, repeat)
+    return results
+
+
+def compare(results, baseline, latency_threshold=0.25, memory_threshold=0.25):
+    """
+    Find the regressions between two benchmark runs.
+
+    A route regressed if its median latency or peak memory grew by more than the
+    given fraction, or if it ran any more queries. Routes and sizes missing from
+    either run are ignored.
+
+    :param dict results: The new results.
+    :param dict baseline: The results to compare with.
+    :param float latency_threshold: The allowed growth in median latency, e.g. 0.25 for 25%.
+    :param float memory_threshold: The allowed growth in peak memory.
+    :return list(str): A description of each regression.
+    """
+    regressions = []
+    for size, routes in results['sizes'].items():
+        for route, new in routes.items():
+            old = baseline.get('sizes', {}).get(size, {}).get(route)
+            if old is None:
+                continue
+            label = '%s (%s posts)' % (route, size)
+            if new['median_ms'] > old['median_ms'] * (1 + latency_threshold):
+                regressions.append('%s: median latency %.2fms -> %.2fms'
+                                   % (label, old['median_ms'], new['median_ms']))
+            if new['queries'] > old['queries']:
+                regressions.append('%s: queries %d -> %d' % (label, old['queries'], new['queries']))
+            if new['peak_kib'] > old['peak_kib'] * (1 + memory_threshold):
+                regressions.append('%s: peak memory %.1fKiB -> %.1fKiB'
+                                   % (label, old['peak_kib'], new['peak_kib']))
+    return regressions
@@ -0,0 +1,98 @@
+"""
+Writing posts in bulk.
+
+Creating posts one at a time through the ORM sanitizes each body in the request's
+process and issues several statements per post. For imports and generated data,
+posts are instead prepared as plain dictionaries, which can be done in other
+processes, and written in chunks: one executemany INSERT for the posts, one for
+their post_tags rows, and one UPDATE per distinct change in a tag's post count.
+Bulk writes go around the ORM, so the search index and the caches are updated
+explicitly.
+
+Methods
+-------
+prepare_post(title, body, author, time, tags, preview_length, body_format)
+    Render and sanitize a post's body and build the row to insert.
+insert_posts(rows)
+    Insert prepared posts and their tags.
+"""
+
+from collections import Counter, defaultdict
+from . import db
+from .cache import mark_changed
+from .models import Post, Tag, post_tags
+from .search import index_posts
+from .text import truncate_html
+
+
+def prepare_post(title, body, author, time, tags, preview_length, body_format='html'):
+    """
+    Render and sanitize a post's body and build the row to insert.
+
+    Needs no application context, so it can run in a pool of worker processes.
+    Bodies the process rendered before are not rendered again.
+
+    :param str title: The post's title.
+    :param str body: The post's body, as HTML or Markdown.
+    :param str author: The post's author.
+    :param DateTime time: The time the post was created.
+    :param iterable(str) tags: The names of the post's tags.
+    :param int preview_length: The number of characters of text in the post's preview.
+    :param str body_format: The format of the body, 'html' or 'markdown'.
+    :return dict: The post's columns, plus its normalized tag names under 'tags'.
+    """
+    body_html = Post.render_body(body, body_format)
+    return {'title': title, 'body': body, 'body_format': body_format, 'body_html': body_html,
+            'body_preview': truncate_html(body_html, preview_length),
+            'time': time, 'updated_at': time, 'author': author,
+            'tags': Tag.normalize_names(tags)}
+
+
+def _insert_rows(rows):
+    """
+    Insert posts with one statement, returning their IDs in the order of rows.
+    """
+    table = Post.__table__
+    dialect = db.session.get_bind().dialect
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = db.session.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), rows)
+        return [id for id, in result]
+    # Without RETURNING for executemany, each row's ID comes from its own INSERT
+    return [db.session.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+
+def insert_posts(rows):
+    """
+    Insert prepared posts and their tags in the current transaction.
+
+    Missing tags are created together, every post_tags row is inserted with one
+    executemany, and tag counts are raised with one UPDATE per distinct increase. The
+    posts are added to the search index and recorded as changed, so caches are
+    invalidated when the caller commits.
+
+    :param list(dict) rows: Posts prepared with prepare_post().
+    :return list(int): The IDs of the new posts, in the same order as rows.
+    """
+    if not rows:
+        return []
+    tags = [row['tags'] for row in rows]
+    columns = [{key: value for key, value in row.items() if key != 'tags'} for row in rows]
+    ids = _insert_rows(columns)
+
+    links = [{'post_id': id, 'tag_id': name, 'post_time': row['time']}
+             for id, row, names in zip(ids, columns, tags) for name in names]
+    counts = Counter(link['tag_id'] for link in links)
+    Tag.create_missing(list(counts))
+    db.session.execute(post_tags.insert(), links)
+    by_increase = defaultdict(list)
+    for name, count in counts.items():
+        by_increase[count].append(name)
+    for count, names in by_increase.items():
+        Tag.adjust_counts(names, count)
+
+    index_posts(db.session.connection(),
+                [(id, row['title'], row['body_html']) for id, row in zip(ids, columns)])
+    mark_changed(db.session, post_ids=ids, tags=counts,
+                 authors=set(row['author'] for row in columns))
+    return ids
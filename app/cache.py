@@ -0,0 +1,303 @@
+"""
+In-process caches and the change tracking used to invalidate them.
+
+Cached data is only ever invalidated by writes. Every flush records which posts,
+tags and authors it touched, and once the transaction commits the content_changed
+signal is sent with everything that changed, so each cache can throw away exactly
+what is stale. Writes that bypass the ORM (bulk Core statements) report what they
+touched with mark_changed().
+
+Classes
+-------
+LRUCache
+    A thread-safe, size-bounded cache with optional expiry.
+ChangeSet
+    The posts, tags and authors touched by a transaction.
+FragmentCache
+    A cache of rendered template fragments, such as the sidebar boxes.
+
+Methods
+-------
+mark_changed(session, post_ids, tags, authors)
+    Record changes made outside of the ORM so they invalidate caches on commit.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from blinker import Namespace
+from flask import current_app, has_app_context, render_template
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+_signals = Namespace()
+
+# Sent with the committing app as the sender and a ChangeSet as 'changes'
+content_changed = _signals.signal('content-changed')
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded, least recently used cache with optional expiry.
+
+    Attributes
+    ----------
+    maxsize : int
+        The maximum number of entries. The least recently used entry is evicted
+        when the cache is full.
+    ttl : float
+        The number of seconds an entry stays valid, or None to keep entries until
+        they are evicted or invalidated.
+    hits : int
+        The number of lookups that found a valid entry.
+    misses : int
+        The number of lookups that did not.
+
+    Methods
+    -------
+    get(key, default)
+        Look up an entry.
+    set(key, value)
+        Add or replace an entry.
+    delete(key)
+        Remove an entry.
+    keys()
+        List the keys of all entries.
+    clear()
+        Remove all entries.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Look up an entry, marking it as recently used.
+
+        :param key: The entry's key.
+        :param default: The value to return if there is no valid entry.
+        :return: The cached value, or default.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        Add or replace an entry, evicting the least recently used entry if the cache is full.
+
+        :param key: The entry's key.
+        :param value: The value to cache.
+        :return: None
+        """
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove an entry, if it exists.
+
+        :param key: The entry's key.
+        :return: None
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self):
+        """
+        Get the keys of all entries, including any that have expired.
+
+        :return list: A snapshot of the keys, from least to most recently used.
+        """
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        """
+        Remove all entries.
+
+        :return: None
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ChangeSet:
+    """
+    The posts, tags and authors touched by a transaction.
+
+    Attributes
+    ----------
+    post_ids : set(int)
+        The IDs of posts that were created, edited or deleted.
+    tags : set(str)
+        The names of tags that were created or deleted, or gained or lost posts.
+    authors : set(str)
+        The authors of the changed posts.
+    """
+
+    def __init__(self):
+        self.post_ids = set()
+        self.tags = set()
+        self.authors = set()
+
+    def update(self, post_ids=(), tags=(), authors=()):
+        """
+        Add to the set of changes.
+
+        :param iterable(int) post_ids: IDs of changed posts.
+        :param iterable(str) tags: Names of changed tags.
+        :param iterable(str) authors: Authors of changed posts.
+        :return: None
+        """
+        self.post_ids.update(post_ids)
+        self.tags.update(tags)
+        self.authors.update(a for a in authors if a is not None)
+
+    def __bool__(self):
+        return bool(self.post_ids or self.tags or self.authors)
+
+
+def _pending_changes(session):
+    """
+    Get the ChangeSet collecting a session's uncommitted changes.
+
+    :param Session session: The session.
+    :return ChangeSet: The session's pending changes.
+    """
+    return session.info.setdefault('blog_changes', ChangeSet())
+
+
+def mark_changed(session, post_ids=(), tags=(), authors=()):
+    """
+    Record changes made outside of the ORM so they invalidate caches on commit.
+
+    Flushed ORM objects are recorded automatically; this is for bulk statements
+    executed directly against the tables.
+
+    :param Session session: The session the statements were executed in.
+    :param iterable(int) post_ids: IDs of changed posts.
+    :param iterable(str) tags: Names of changed tags.
+    :param iterable(str) authors: Authors of changed posts.
+    :return: None
+    """
+    _pending_changes(session).update(post_ids, tags, authors)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_changes(session, flush_context):
+    """
+    Record the posts and tags written by a flush.
+
+    Only attributes that are already loaded are read, so recording never issues
+    queries of its own.
+    """
+    from .models import Post, Tag
+
+    changes = None
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Post):
+            changes = changes or _pending_changes(session)
+            state = inspect(obj)
+            changes.update(post_ids=[obj.id], authors=[state.dict.get('author')])
+            # Tags the post gained or lost, plus its current tags if they are loaded
+            history = state.attrs.tags.history
+            tags = list(history.added or ()) + list(history.deleted or ())
+            tags += state.dict.get('tags') or []
+            changes.update(tags=[t.name for t in tags])
+        elif isinstance(obj, Tag):
+            changes = changes or _pending_changes(session)
+            changes.update(tags=[obj.name])
+
+
+@event.listens_for(Session, 'after_commit')
+def _send_changes(session):
+    """
+    Send content_changed once a transaction with recorded changes commits.
+    """
+    changes = session.info.pop('blog_changes', None)
+    if changes and has_app_context():
+        content_changed.send(current_app._get_current_object(), changes=changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    """
+    Forget the changes recorded in a transaction that was rolled back.
+    """
+    session.info.pop('blog_changes', None)
+
+
+class FragmentCache:
+    """
+    A cache of rendered template fragments, such as the sidebar boxes.
+
+    Fragments are rendered once and reused until a commit changes posts or tags,
+    or until BLOG_FRAGMENT_CACHE_TTL seconds have passed. Each application gets its
+    own cache, sized by BLOG_FRAGMENT_CACHE_SIZE.
+
+    Methods
+    -------
+    init_app(app)
+        Create the application's fragment cache.
+    render(template_name)
+        Render a fragment template, reusing the cached output if there is one.
+    """
+
+    def init_app(self, app):
+        """
+        Create the application's fragment cache.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        app.extensions['fragment_cache'] = LRUCache(
+            maxsize=app.config['BLOG_FRAGMENT_CACHE_SIZE'],
+            ttl=app.config['BLOG_FRAGMENT_CACHE_TTL'])
+
+    def render(self, template_name):
+        """
+        Render a fragment template, reusing the cached output if there is one.
+
+        :param str template_name: The name of the fragment's template.
+        :return Markup: The rendered fragment.
+        """
+        cache = current_app.extensions['fragment_cache']
+        fragment = cache.get(template_name)
+        if fragment is None:
+            fragment = Markup(render_template(template_name))
+            cache.set(template_name, fragment)
+        return fragment
+
+
+@content_changed.connect
+def _invalidate_fragments(app, changes):
+    """
+    Drop every cached fragment after posts or tags change.
+
+    The sidebar boxes list recent posts and all tags, so any change can affect them.
+    """
+    cache = app.extensions.get('fragment_cache')
+    if cache is not None:
+        cache.clear()
@@ -0,0 +1,148 @@
+"""
+Compression of responses negotiated on Accept-Encoding.
+
+Pages, stylesheets, scripts and feeds are sent compressed with brotli if the
+brotli package is installed and the client accepts it, or gzip otherwise.
+Responses smaller than BLOG_COMPRESSION_MIN_SIZE bytes are sent as they are,
+since compressing them saves less than it costs.
+
+Responses with an ETag, which covers the post pages, the listings and static
+files, have the same body for the same ETag and URL, so their compressed bodies
+are kept in a small per-application cache and a popular page is only compressed
+once. The ETag does not cover flashed messages, so responses that showed some,
+or that change the session, are compressed but never cached. A compressed response's ETag is made weak, since its bytes
+differ from the uncompressed ones, and every compressible response varies on
+Accept-Encoding so shared caches keep the encodings apart.
+
+Compression runs after the page cache has stored a page, so the page cache keeps
+the uncompressed page and pages served from it are compressed like the others.
+
+Classes
+-------
+Compression
+    Compression of the application's responses.
+
+Methods
+-------
+compress(data, encoding)
+    Compress a response body.
+"""
+
+import gzip
+from flask import current_app, request, session
+from .cache import LRUCache
+from .instrumentation import timer
+
+try:
+    import brotli
+except ImportError:     # gzip is always available
+    brotli = None
+
+# The encodings offered, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# The content types worth compressing; images and fonts are compressed already
+COMPRESSIBLE_TYPES = frozenset(['text/html', 'text/css', 'text/plain', 'text/xml',
+                                'text/javascript', 'application/javascript', 'application/json',
+                                'application/xml', 'application/atom+xml', 'image/svg+xml'])
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def compress(data, encoding):
+    """
+    Compress a response body.
+
+    :param bytes data: The body.
+    :param str encoding: The content coding, 'br' or 'gzip'.
+    :return bytes: The compressed body.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # A fixed mtime, so the same body always compresses to the same bytes
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+class Compression:
+    """
+    Compression of the application's responses.
+
+    Methods
+    -------
+    init_app(app)
+        Create the application's cache of compressed bodies and register its request hook.
+    """
+
+    def init_app(self, app):
+        """
+        Create the application's cache of compressed bodies and register its request hook.
+
+        The hook does nothing unless BLOG_COMPRESSION is on. It should be registered
+        after the instrumentation's, so compression is timed, and before the page
+        cache's, so the page cache stores pages uncompressed.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        app.extensions['compression_cache'] = LRUCache(
+            maxsize=app.config['BLOG_COMPRESSION_CACHE_SIZE'])
+        app.after_request(self._compress)
+
+    @staticmethod
+    def _compressible(response):
+        """
+        Check whether a response may be compressed, before reading its body.
+        """
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype not in COMPRESSIBLE_TYPES or response.cache_control.no_transform:
+            return False
+        # Streamed bodies are left alone, except for static files
+        if response.is_streamed and not response.direct_passthrough:
+            return False
+        length = response.content_length
+        return length is None or length >= current_app.config['BLOG_COMPRESSION_MIN_SIZE']
+
+    def _compress(self, response):
+        """
+        Compress a response if the client accepts one of the offered encodings.
+        """
+        if not current_app.config['BLOG_COMPRESSION'] or not self._compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None or request.method == 'HEAD':
+            return response
+        etag, weak = response.get_etag()
+        cache = current_app.extensions['compression_cache']
+        key = (request.full_path, etag, encoding) if etag else None
+        # Showing flashed messages pops them from the session, so this also catches
+        # pages that showed some
+        if session.modified or session.get('_flashes') or 'Set-Cookie' in response.headers:
+            key = None
+        compressed = cache.get(key) if key else None
+        if compressed is None:
+            if response.direct_passthrough:
+                # A static file: read it so it can be compressed
+                response.direct_passthrough = False
+            data = response.get_data()
+            if len(data) < current_app.config['BLOG_COMPRESSION_MIN_SIZE']:
+                return response
+            with timer('compress'):
+                compressed = compress(data, encoding)
+            if len(compressed) >= len(data):
+                return response
+            if key:
+                cache.set(key, compressed)
+        elif hasattr(response.response, 'close'):
+            # The body is not needed, e.g. a static file's; close it before replacing it
+            response.response.close()
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # Ranges would be of the uncompressed file
+        response.headers.pop('Accept-Ranges', None)
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,138 @@
+"""
+Conditional GET for post pages and listings.
+
+A page is identified by an ETag hashed from what it shows: the posts on it, as
+(id, updated_at) and, for a post's own page, its tags, plus the rendered sidebar
+boxes and the identity of the viewer, since the navigation and the post options
+differ between users. The ETag is computed from a few small queries before any
+post body is loaded or any template is rendered, so a client that already has
+the current page gets a 304 Not Modified for almost no work.
+
+Pages are never answered with a 304 while flashed messages are waiting, because
+the full page is needed to show them.
+
+Methods
+-------
+page_etag(parts)
+    Compute the ETag of a page showing the given data.
+post_etag(id)
+    Compute the ETag and Last-Modified time of a post's permalink page.
+listing_etag(pagination)
+    Compute the ETag of a page of a post listing.
+not_modified(etag)
+    Get a 304 Not Modified response if the client already has the page.
+conditional(body, etag, last_modified)
+    Make a page's response, carrying its validators.
+"""
+
+import hashlib
+from flask import abort, current_app, make_response, request, session
+from flask_login import current_user
+from . import db, fragment_cache
+from .models import Post, post_tags
+
+# The sidebar boxes shown on every page
+SIDEBAR_FRAGMENTS = ('_sidebar_posts.html', '_sidebar_categories.html')
+
+
+def _viewer():
+    """
+    Identify the viewer, as far as it changes how a page is rendered.
+
+    :return tuple: The user's ID and permissions, or (None, None) for anonymous users.
+    """
+    if not current_user.is_authenticated:
+        return None, None
+    role = current_user.role
+    return current_user.get_id(), role.permissions if role is not None else None
+
+
+def page_etag(*parts):
+    """
+    Compute the ETag of a page showing the given data.
+
+    The sidebar boxes come from the fragment cache, so including them is cheap and
+    the ETag changes whenever they do.
+
+    :param parts: Values identifying what the page shows. Must have a stable repr().
+    :return str: The page's ETag.
+    """
+    sidebar = tuple(str(fragment_cache.render(name)) for name in SIDEBAR_FRAGMENTS)
+    data = repr((parts, sidebar, _viewer())).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+def post_etag(id):
+    """
+    Compute the ETag and Last-Modified time of a post's permalink page.
+
+    Only the post's times and tag names are read; its body is not loaded.
+
+    :param int id: The ID of the post.
+    :raises HTTPException: 404 if there is no post with the given ID.
+    :return tuple(str, DateTime): The page's ETag and the time the post last changed.
+    """
+    row = db.session.query(Post.time, Post.updated_at).filter(Post.id == id).first()
+    if row is None:
+        abort(404)
+    tags = sorted(name for name, in db.session.query(post_tags.c.tag_id)
+                  .filter(post_tags.c.post_id == id))
+    return page_etag('post', id, row.updated_at, tags), row.updated_at or row.time
+
+
+def listing_etag(pagination):
+    """
+    Compute the ETag of a page of a post listing.
+
+    :param KeysetPagination pagination: The page, whose items are posts loaded with Post.listing().
+    :return str: The page's ETag.
+    """
+    posts = [(post.id, post.updated_at) for post in pagination.items]
+    return page_etag('listing', posts, pagination.has_next, pagination.has_prev,
+                     pagination.total)
+
+
+def _set_validators(response, etag, last_modified=None):
+    """
+    Add a page's validators and caching policy to its response.
+
+    Clients must revalidate before reusing a page, and pages rendered for a
+    logged-in user may only be stored by that user's browser.
+    """
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+    response.vary.add('Cookie')
+    return response
+
+
+def not_modified(etag):
+    """
+    Get a 304 Not Modified response if the client already has the page.
+
+    Only If-None-Match is checked. Last-Modified does not cover the sidebar or the
+    viewer, so If-Modified-Since alone is never enough for a 304.
+
+    :param str etag: The page's current ETag.
+    :return Response: An empty 304 response, or None if the page must be sent.
+    """
+    if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+        return None
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return _set_validators(current_app.response_class(status=304), etag)
+
+
+def conditional(body, etag, last_modified=None):
+    """
+    Make a page's response, carrying its validators.
+
+    :param str body: The rendered page.
+    :param str etag: The page's ETag.
+    :param DateTime last_modified: The time the page's content last changed, if known.
+    :return Response: The response.
+    """
+    return _set_validators(make_response(body), etag, last_modified)
@@ -0,0 +1,362 @@
+"""
+Export of the blog as a static site.
+
+Every page a logged-out reader can browse - each page of the home page, every post,
+and each page of every tag and author listing - is rendered through the normal
+views and templates and written to a directory as <path>/index.html, so the site
+can be served by any web server or CDN. Links between the pages are rewritten to
+the exported paths; pagination cursors become /page/<n>/ paths.
+
+Rendering is spread across a pool of worker processes, each with its own
+application instance. A manifest next to the export directory, <directory>.manifest.json,
+holds a hash of every post and every page, so an incremental export only renders
+the pages showing posts that changed since the last export and only rewrites files
+whose content changed. It is kept outside the directory so it is not published.
+
+Tags whose names contain a slash have no page a static server could serve at their
+URL, so their listings are skipped with a warning.
+
+Classes
+-------
+ExportResult
+    The numbers of pages rendered, written and removed by an export.
+
+Methods
+-------
+plan_site(posts)
+    List every page of the site and the links to rewrite.
+export_site(directory, config_name, workers, incremental)
+    Render the site to a directory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from collections import namedtuple, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+from flask import current_app, url_for
+from jinja2.defaults import DEFAULT_FILTERS
+from . import db
+from .models import Post, post_tags
+from .page_cache import sidebar_fingerprint
+from .pagination import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# The suffix added to an export directory's path to name its manifest, kept next to it
+MANIFEST_SUFFIX = '.manifest.json'
+
+# Bumped when the manifest's layout changes, forcing a full export
+MANIFEST_VERSION = 1
+
+# The largest number of pages a worker renders per task
+BATCH_SIZE = 50
+
+# A page of the site: the URL it is rendered from, where it is written, and what it shows
+Page = namedtuple('Page', ['url', 'path', 'group'])
+
+# The numbers of pages rendered, written and removed by an export
+ExportResult = namedtuple('ExportResult', ['rendered', 'written', 'removed'])
+
+_HREF = re.compile(r'href="([^"]*)"')
+
+
+def _manifest_path(directory):
+    """
+    Get the path of an export directory's manifest, next to the directory.
+    """
+    return os.path.abspath(directory).rstrip('/\\') + MANIFEST_SUFFIX
+
+
+def _file_path(static_url):
+    """
+    Get the file a page is written to, relative to the export directory.
+
+    :param str static_url: The page's exported URL, ending in a slash.
+    :return str: The path of the page's index.html file.
+    """
+    return unquote(static_url).lstrip('/') + 'index.html'
+
+
+def _listing_pages(group, keys, per_page, endpoint, **kwargs):
+    """
+    Plan the pages of a paginated listing.
+
+    The pages are cut from the listing's sort keys the same way the views cut them,
+    so page n is the page reached from page n - 1 by its 'after' cursor, and page
+    n - 1 is the page reached from page n by its 'before' cursor.
+
+    :param tuple group: What the listing shows, e.g. ('tag', name).
+    :param list(tuple) keys: The (time, id) sort keys of the listing's posts, newest first.
+    :param int per_page: The number of posts on a page.
+    :param str endpoint: The listing's view.
+    :param kwargs: The view's arguments.
+    :return tuple(list(Page), dict): The pages, and the exported URL of each live URL.
+    """
+    base = url_for(endpoint, **kwargs)
+    first = base.rstrip('/') + '/'
+    chunks = [keys[i:i + per_page] for i in range(0, len(keys), per_page)] or [[]]
+    pages = [Page(base, _file_path(first), group)]
+    links = {base: first}
+    previous = first
+    for n in range(1, len(chunks)):
+        static = '%spage/%d/' % (first, n + 1)
+        url = url_for(endpoint, after=encode_cursor(*chunks[n - 1][-1]), **kwargs)
+        pages.append(Page(url, _file_path(static), group))
+        links[url] = static
+        links[url_for(endpoint, before=encode_cursor(*chunks[n][0]), **kwargs)] = previous
+        previous = static
+    return pages, links
+
+
+def _post_versions():
+    """
+    Read every post's sort key, author and tags, and hash what its pages show.
+
+    :return dict: (time, id), author, tags and hash for each post ID.
+    """
+    tags = defaultdict(list)
+    for tag, post_id in db.session.query(post_tags.c.tag_id, post_tags.c.post_id):
+        tags[post_id].append(tag)
+    posts = {}
+    for id, time, updated_at, title, author in db.session.query(
+            Post.id, Post.time, Post.updated_at, Post.title, Post.author):
+        version = repr((time, updated_at, title, author, sorted(tags[id])))
+        posts[id] = {'key': (time, id), 'author': author, 'tags': sorted(tags[id]),
+                     'hash': hashlib.sha1(version.encode('utf-8')).hexdigest()}
+    return posts
+
+
+def plan_site(posts=None):
+    """
+    List every page of the site and the links to rewrite.
+
+    Must be called with a request context, so URLs can be built.
+
+    :param dict posts: The posts, as returned by _post_versions(). Read if not given.
+    :return tuple(list(Page), dict): The pages, and the exported URL of each live URL.
+    """
+    posts = _post_versions() if posts is None else posts
+    per_page = current_app.config['BLOG_POSTS_PER_PAGE']
+    newest_first = lambda ids: sorted((posts[id]['key'] for id in ids), reverse=True)
+
+    by_tag = defaultdict(list)
+    by_author = defaultdict(list)
+    for id, post in posts.items():
+        for tag in post['tags']:
+            by_tag[tag].append(id)
+        by_author[post['author']].append(id)
+
+    pages, links = _listing_pages(('index',), newest_first(posts), per_page, 'main.index')
+    for id in sorted(posts):
+        url = url_for('main.post', id=id)
+        pages.append(Page(url, _file_path(url + '/'), ('post', id)))
+        links[url] = url + '/'
+    for tag, ids in sorted(by_tag.items()):
+        if '/' in tag:
+            logger.warning('Skipping the pages of tag %r: its name contains a slash.', tag)
+            continue
+        more, more_links = _listing_pages(('tag', tag), newest_first(ids), per_page,
+                                          'main.tagged', tag=tag)
+        pages += more
+        links.update(more_links)
+    for author, ids in sorted(by_author.items()):
+        more, more_links = _listing_pages(('author', author), newest_first(ids), per_page,
+                                          'main.author', author=author)
+        pages += more
+        links.update(more_links)
+    return pages, links
+
+
+# The application and links used by the current process to render pages
+_renderer = {}
+
+
+def _init_renderer(config_name, links, settings=None, filters=None, app=None):
+    """
+    Set up the current process to render pages.
+
+    Worker processes create their own application instance with the exporting
+    application's blog settings, so pages are cut and rendered the same way, and with
+    the template filters that were registered on it after it was created. The page
+    cache is turned off, since the workers' requests are not real readers.
+    """
+    if app is None:
+        from . import assets, create_app
+        app = create_app(config_name)
+        app.config.update(settings or {})
+        app.config['BLOG_PAGE_CACHE'] = False
+        # The manifest of the built assets may be in a directory set by the settings
+        app.extensions['assets'] = assets.load(app)
+        for name, f in (filters or {}).items():
+            app.jinja_env.filters.setdefault(name, f)
+    _renderer.update(client=app.test_client(), links=links)
+
+
+def _module_filters(app):
+    """
+    Get the template filters defined at module level, such as the ones registered by
+    blog.py, which can be handed to worker processes.
+    """
+    return {name: f for name, f in app.jinja_env.filters.items()
+            if name not in DEFAULT_FILTERS and '<locals>' not in getattr(f, '__qualname__', '<locals>')}
+
+
+def _rewrite_links(html, links):
+    """
+    Point the links in a page at the exported pages.
+    """
+    return _HREF.sub(lambda m: 'href="%s"' % links.get(m.group(1), m.group(1)), html)
+
+
+def _render_pages(directory, tasks):
+    """
+    Render pages and write the ones whose content changed.
+
+    :param str directory: The export directory.
+    :param list(tuple) tasks: (url, path, previous hash) for each page.
+    :return list(tuple): (path, hash, written) for each page.
+    """
+    client = _renderer['client']
+    results = []
+    for url, path, previous in tasks:
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError('Rendering %s returned %s' % (url, response.status))
+        data = _rewrite_links(response.get_data(as_text=True), _renderer['links']).encode('utf-8')
+        digest = hashlib.sha1(data).hexdigest()
+        target = os.path.join(directory, path)
+        written = digest != previous or not os.path.exists(target)
+        if written:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = target + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, target)
+        results.append((path, digest, written))
+    return results
+
+
+def _load_manifest(directory):
+    try:
+        with open(_manifest_path(directory)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def _affected_groups(old_posts, posts):
+    """
+    Find the listings and posts whose pages show posts that changed.
+
+    :param dict old_posts: The hash, author and tags of each post at the last export.
+    :param dict posts: The current posts, from _post_versions().
+    :return set(tuple): The groups of the pages to render again.
+    """
+    groups = set()
+    for id in set(old_posts) | set(posts):
+        old = old_posts.get(id)
+        new = posts.get(id)
+        if old is not None and new is not None and old['hash'] == new['hash']:
+            continue
+        groups.add(('index',))
+        groups.add(('post', id))
+        for version in (old, new):
+            if version is not None:
+                groups.add(('author', version['author']))
+                groups.update(('tag', tag) for tag in version['tags'])
+    return groups
+
+
+def export_site(directory, config_name, workers=1, incremental=False):
+    """
+    Render the site to a directory.
+
+    A full export renders every page. An incremental export reads the manifest left
+    by the last export and only renders the pages of posts, tags and authors whose
+    posts changed since, along with the home page; if the sidebar, the number of
+    posts per page or the manifest's layout changed, every page is rendered. Either
+    way, only files whose content changed are written, and the files of pages that
+    no longer exist are removed. The static files, and their fingerprinted copies if
+`flask build-assets` was run, are copied every time.
+
+    With more than one worker, pages are rendered by a pool of processes that each
+    create an application with config_name; otherwise they are rendered by the
+    current application.
+
+    :param str directory: The export directory.
+    :param str config_name: The configuration worker processes create their application with.
+    :param int workers: The number of processes to render pages with.
+    :param bool incremental: Only render the pages affected by changed posts.
+    :return ExportResult: The numbers of pages rendered, written and removed.
+    """
+    app = current_app._get_current_object()
+    posts = _post_versions()
+    sidebar = sidebar_fingerprint()
+    with app.test_request_context():
+        pages, links = plan_site(posts)
+
+    manifest = _load_manifest(directory)
+    old_pages = manifest['pages'] if manifest is not None else {}
+    if (not incremental or manifest is None or manifest['sidebar'] != sidebar or
+            manifest['per_page'] != app.config['BLOG_POSTS_PER_PAGE']):
+        todo = pages
+    else:
+        old_posts = {int(id): version for id, version in manifest['posts'].items()}
+        groups = _affected_groups(old_posts, posts)
+        todo = [page for page in pages if page.group in groups or page.path not in old_pages]
+
+    os.makedirs(directory, exist_ok=True)
+    tasks = [(page.url, page.path, old_pages.get(page.path)) for page in todo]
+    # Small exports are split evenly between the workers; large ones in batches of BATCH_SIZE
+    size = max(1, min(BATCH_SIZE, -(-len(tasks) // max(workers, 1))))
+    batches = [tasks[i:i + size] for i in range(0, len(tasks), size)]
+    results = []
+    if workers > 1 and len(batches) > 1:
+        settings = {key: value for key, value in app.config.items() if key.startswith('BLOG_')}
+        # Connections must not be shared with the forked workers
+        db.engine.dispose()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_renderer,
+                                 initargs=(config_name, links, settings, _module_filters(app))) as pool:
+            for batch in pool.map(_render_pages, [directory] * len(batches), batches):
+                results += batch
+    else:
+        _init_renderer(config_name, links, app=app)
+        for batch in batches:
+            results += _render_pages(directory, batch)
+
+    # Remove the pages of posts, tags and authors that no longer exist
+    current = set(page.path for page in pages)
+    removed = [path for path in old_pages if path not in current]
+    for path in removed:
+        try:
+            os.remove(os.path.join(directory, path))
+            os.removedirs(os.path.dirname(os.path.join(directory, path)))
+        except OSError:
+            pass
+
+    if app.static_folder is not None:
+        shutil.copytree(app.static_folder, os.path.join(directory, 'static'), dirs_exist_ok=True)
+    # Pages link the fingerprinted copies of the static files once they are built
+    if app.extensions['assets']['manifest']:
+        shutil.copytree(app.config['BLOG_ASSETS_DIR'],
+                        os.path.join(directory, app.config['BLOG_ASSETS_URL'].strip('/')),
+                        dirs_exist_ok=True)
+
+    new_pages = {path: digest for path, digest in old_pages.items() if path in current}
+    new_pages.update((path, digest) for path, digest, written in results)
+    manifest = {'version': MANIFEST_VERSION, 'sidebar': sidebar,
+                'per_page': app.config['BLOG_POSTS_PER_PAGE'],
+                'posts': {id: {'hash': post['hash'], 'author': post['author'],
+                               'tags': post['tags']} for id, post in posts.items()},
+                'pages': new_pages}
+    path = _manifest_path(directory)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+    return ExportResult(len(results), sum(1 for r in results if r[2]), len(removed))
@@ -1,8 +1,18 @@
-from random import randint
+from datetime import datetime, timedelta
+from itertools import accumulate
+from random import Random, randint
+from time import perf_counter
 from sqlalchemy.exc import IntegrityError
 from faker import Faker
+from flask import current_app
+from werkzeug.security import generate_password_hash
 from . import db
-from .models import Post, User
+from .bulk import insert_posts
+from .models import Post, Role, User
+from .text import truncate_html
+
+# The time of the newest seeded post, fixed so seeding is repeatable
+SEED_END = datetime(2024, 1, 1)
 
 def posts(count=100):
     fake = Faker()
@@ -33,3 +43,110 @@ def users(count=100):
         db.session.add(u)
 
     db.session.commit()
+
+
+def _zipf_weights(count, exponent):
+    """
+    Cumulative weights making the item at rank r about r ** -exponent as likely as the first.
+    """
+    return list(accumulate(1.0 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def _sentence(rng, words):
+    sentence = ' '.join(rng.choices(words, k=rng.randint(6, 16)))
+    return sentence[0].upper() + sentence[1:] + '.'
+
+
+def _seed_users(count, fake):
+    """
+    Insert users with one executemany INSERT per call and return their names.
+
+    Hashing a password is deliberately slow, so every generated user gets the same
+    hash, of the password 'password'.
+    """
+    if count <= 0:
+        return []
+    role = Role.query.filter_by(default=True).first()
+    if role is None:
+        Role.insert_roles()
+        role = Role.query.filter_by(default=True).first()
+    first = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    password_hash = generate_password_hash('password')
+    rows = [{'name': fake.name(), 'username': '%s%d' % (fake.user_name(), first + i),
+             'password_hash': password_hash, 'role_id': role.id} for i in range(count)]
+    db.session.execute(User.__table__.insert(), rows)
+    db.session.commit()
+    return [row['name'] for row in rows]
+
+
+def seed(posts=1000, users=10, tags=500, seed=0, batch_size=5000, progress=None, end=SEED_END):
+    """
+    Generate a large, repeatable set of users and posts for benchmarks.
+
+    The same arguments always generate the same data. Post times are spread over the
+    three years before end in ID order, like a real blog's. Authors and tags follow Zipf
+    distributions, so a few prolific authors write most posts and a few popular tags
+    are on most posts, while the long tail of tags each have only a handful. Every
+    post has one to four tags.
+
+    Users are written with one INSERT and posts in chunks of batch_size with
+    app.bulk.insert_posts(), committing after each chunk, so memory use does not
+    grow with the number of posts. The bodies are made of generated paragraphs of
+    plain words, which need no sanitizing.
+
+    :param int posts: The number of posts to create.
+    :param int users: The number of users to create. Posts are written by them, or by
+        the existing users if there are none.
+    :param int tags: The number of distinct tags to use.
+    :param int seed: The seed of the random number generators.
+    :param int batch_size: The number of posts to insert per transaction.
+    :param func progress: Called with the number of posts created so far and the
+        seconds taken after every chunk.
+    :param datetime end: The time around which the newest posts are written.
+    :return int: The number of posts created.
+    """
+    rng = Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    words = sorted(set(fake.words(nb=3000)))
+
+    authors = _seed_users(users, fake) or \
+        [name for name, in db.session.query(User.name).order_by(User.id)] or ['Anonymous Blogger']
+    rng.shuffle(authors)
+    author_weights = _zipf_weights(len(authors), 1.0)
+
+    # Single words first, then pairs of words, until there are enough distinct tags
+    tag_names = list(words[:tags])
+    while len(tag_names) < tags:
+        name = '%s-%s' % (rng.choice(words), rng.choice(words))
+        if name not in tag_names:
+            tag_names.append(name)
+    rng.shuffle(tag_names)
+    tag_weights = _zipf_weights(len(tag_names), 1.07)
+
+    # Bodies are put together from a pool of paragraphs, which is much faster than
+    # generating every sentence
+    paragraphs = ['<p>%s</p>' % ' '.join(_sentence(rng, words) for _ in range(rng.randint(3, 8)))
+                  for _ in range(2000)]
+    preview_length = current_app.config['BLOG_PREVIEW_LENGTH']
+    time = end - timedelta(days=3 * 365)
+    gap = 3 * 365 * 24 * 3600 / max(posts, 1)
+    began = perf_counter()
+    created = 0
+    while created < posts:
+        rows = []
+        for _ in range(min(batch_size, posts - created)):
+            time += timedelta(seconds=rng.expovariate(1 / gap))
+            body = ''.join(rng.choices(paragraphs, k=rng.randint(2, 8)))
+            names = set(rng.choices(tag_names, cum_weights=tag_weights, k=rng.randint(1, 4)))
+            rows.append({'title': _sentence(rng, words)[:-1][:60], 'body': body,
+                         'body_html': body, 'body_preview': truncate_html(body, preview_length),
+                         'time': time, 'updated_at': time,
+                         'author': rng.choices(authors, cum_weights=author_weights)[0],
+                         'tags': sorted(names)})
+        insert_posts(rows)
+        db.session.commit()
+        created += len(rows)
+        if progress is not None:
+            progress(created, perf_counter() - began)
+    return created
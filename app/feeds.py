@@ -0,0 +1,134 @@
+"""
+Atom feeds of the newest posts, for the whole blog and for each tag.
+
+Feeds are polled far more often than they change, so each feed is serialized once
+and the bytes are kept in a per-application cache along with an ETag and a
+Last-Modified time. The Last-Modified time is that of the latest edit to a post
+in the feed, or of the latest change to the blog's posts seen by this process if
+that is later, so deleting a post moves it forward too. Cached feeds are dropped when a commit in the same process
+changes the posts they contain, and expire after BLOG_FEED_CACHE_TTL seconds so
+changes made by other workers or by command-line imports show up too. Clients that
+already have the current feed get a 304 Not Modified.
+
+Classes
+-------
+FeedCache
+    Serialized feeds, invalidated when posts change.
+
+Methods
+-------
+feed_response(tag)
+    Get the response for the blog's feed or a tag's feed.
+"""
+
+import hashlib
+from datetime import datetime
+from flask import current_app, render_template, request, url_for
+from . import db
+from .cache import LRUCache, content_changed
+from .models import Post, Tag, post_tags
+
+
+class FeedCache:
+    """
+    Serialized feeds, invalidated when posts change.
+
+    Each application gets its own cache of up to BLOG_FEED_CACHE_SIZE feeds, kept for
+    at most BLOG_FEED_CACHE_TTL seconds. Entries
+    are (body, etag, last_modified) tuples keyed by the feed's tag (None for the
+    whole blog) and the URL root the feed was built for.
+
+    Methods
+    -------
+    init_app(app)
+        Create the application's feed cache.
+    """
+
+    def init_app(self, app):
+        """
+        Create the application's feed cache.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        app.extensions['feed_cache'] = LRUCache(maxsize=app.config['BLOG_FEED_CACHE_SIZE'],
+                                                ttl=app.config['BLOG_FEED_CACHE_TTL'])
+
+
+@content_changed.connect
+def _invalidate_feeds(app, changes):
+    """
+    Drop the cached feeds that include changed posts.
+
+    Any post change may alter the blog's feed. Tag feeds are only dropped for the
+    tags the changed posts had or have.
+    """
+    cache = app.extensions.get('feed_cache')
+    if cache is None:
+        return
+    if changes.post_ids or changes.tags:
+        # Deleted posts leave no time behind in the feed, so the change is remembered
+        app.extensions['feed_changed'] = datetime.utcnow()
+        for key in list(cache.keys()):
+            if key[0] is None or key[0] in changes.tags:
+                cache.delete(key)
+
+
+def _build_feed(tag):
+    """
+    Serialize a feed of the newest BLOG_FEED_SIZE posts.
+
+    :param str tag: The name of the tag to build the feed for, or None for the whole blog.
+    :return tuple(bytes, str, DateTime): The feed, its ETag and the time it last changed.
+    """
+    size = current_app.config['BLOG_FEED_SIZE']
+    query = Post.with_body().options(db.selectinload(Post.tags))
+    if tag is None:
+        posts = query.order_by(Post.time.desc(), Post.id.desc()).limit(size).all()
+        feed_url = url_for('main.feed', _external=True)
+        site_url = url_for('main.index', _external=True)
+        title = current_app.config['BLOG_TITLE']
+    else:
+        keys = Tag.query.get_or_404(tag).get_post_keys() \
+            .order_by(post_tags.c.post_time.desc(), post_tags.c.post_id.desc()).limit(size).all()
+        by_id = {p.id: p for p in query.filter(Post.id.in_([key.id for key in keys]))}
+        posts = [by_id[key.id] for key in keys if key.id in by_id]
+        feed_url = url_for('main.tag_feed', tag=tag, _external=True)
+        site_url = url_for('main.tagged', tag=tag, _external=True)
+        title = '%s: %s' % (current_app.config['BLOG_TITLE'], tag)
+    updated = max((p.updated_at or p.time for p in posts), default=None)
+    changed = current_app.extensions.get('feed_changed')
+    if changed is not None and (updated is None or changed > updated):
+        updated = changed
+    body = render_template('feed.xml', posts=posts, title=title, feed_url=feed_url,
+                           site_url=site_url, updated=updated).encode('utf-8')
+    return body, hashlib.sha1(body).hexdigest(), updated
+
+
+def feed_response(tag=None):
+    """
+    Get the response for the blog's feed or a tag's feed.
+
+    The feed is served from the cache if possible and built otherwise. The response
+    carries the feed's ETag and Last-Modified time and is turned into a 304 Not
+    Modified if the request's If-None-Match or If-Modified-Since headers show that
+    the client already has it. A cached feed is served without touching the database.
+
+    :param str tag: The name of the tag, or None for the whole blog's feed.
+    :raises HTTPException: 404 if the tag does not exist.
+    :return Response: The feed response.
+    """
+    cache = current_app.extensions['feed_cache']
+    key = (tag, request.url_root)
+    entry = cache.get(key)
+    if entry is None:
+        entry = _build_feed(tag)
+        cache.set(key, entry)
+    body, etag, updated = entry
+    response = current_app.response_class(body, mimetype='application/atom+xml')
+    response.set_etag(etag)
+    if updated is not None:
+        response.last_modified = updated
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['BLOG_FEED_MAX_AGE']
+    return response.make_conditional(request)
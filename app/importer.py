@@ -0,0 +1,302 @@
+"""
+Import of posts from files.
+
+Posts can be imported from a JSON Lines file with one post per line, e.g.
+
+    {"title": "Hello", "body": "<p>Hi!</p>", "author": "Ann",
+     "time": "2020-01-31T12:00:00", "tags": ["news", "python"]}
+
+where tags may also be a comma-separated string and "format": "markdown" marks a
+Markdown body, or from a directory of .html and .md files. A file may start with
+a front matter block of "key: value" lines between two "---" lines, setting its
+title, author, date and tags; otherwise its title is the file's name.
+
+Posts are read as a stream, their bodies converted and sanitized in a pool of
+worker processes while the previous chunk is written, and each chunk is inserted
+with app.bulk.insert_posts() and committed on its own. After every chunk, the
+position of its last post in the source - a line number, or a file's path relative
+to the directory - is saved to a checkpoint file, so an interrupted import
+continues after it when it is run again. Files are read in order of their paths,
+so adding or removing files does not move the checkpoint, and the next run
+imports the files that sort after the last one imported.
+
+Classes
+-------
+Checkpoint
+    The position an import of a source has reached.
+ImportResult
+    The outcome of an import.
+
+Methods
+-------
+read_posts(source)
+    Read the posts in a JSON Lines file or a directory of files.
+import_posts(source, checkpoint_path, batch_size, workers, restart, author, progress)
+    Import posts from a file or directory.
+"""
+
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import dropwhile, islice
+from flask import current_app
+from . import db
+from .bulk import insert_posts, prepare_post
+from .models import Post
+
+# File extensions read from a directory, and whether they hold Markdown
+FILE_FORMATS = {'.html': 'html', '.htm': 'html', '.md': 'markdown', '.markdown': 'markdown'}
+
+# The outcome of an import: posts imported, posts skipped because earlier runs imported
+# them, and seconds taken
+ImportResult = namedtuple('ImportResult', ['imported', 'skipped', 'seconds'])
+
+
+class Checkpoint:
+    """
+    The position an import of a source has reached, saved in a JSON file.
+
+    Before a chunk is committed, the position of its last post in the source and
+    that post are saved as pending; once the commit succeeds, the position is saved
+    as reached. If the import stops in between, the pending chunk counts as
+    imported only if its last post exists.
+
+    Methods
+    -------
+    resume()
+        Get the position of the last post imported.
+    begin(position, count, post_id, title)
+        Record a chunk that is about to be committed.
+    reach(position, count)
+        Record that a chunk was committed.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.position = None
+        self.imported = 0
+
+    def resume(self):
+        """
+        Get the position of the last post imported.
+
+        :return int|str: The position of the last post imported from the source, or
+            None if none was.
+        """
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get('source') != self.source:
+            return None
+        self.position = saved['position']
+        self.imported = saved.get('imported', 0)
+        pending = saved.get('pending')
+        if pending is not None and db.session.query(
+                Post.query.filter_by(id=pending['id'], title=pending['title']).exists()).scalar():
+            self.position = pending['position']
+            self.imported += pending['count']
+        return self.position
+
+    def begin(self, position, count, post_id, title):
+        """
+        Record a chunk that is about to be committed.
+
+        :param int|str position: The position of the last post in the chunk.
+        :param int count: The number of posts in the chunk.
+        :param int post_id: The ID of the last post in the chunk.
+        :param str title: The title of the last post in the chunk.
+        :return: None
+        """
+        self._save(pending={'position': position, 'count': count, 'id': post_id,
+                            'title': title})
+
+    def reach(self, position, count):
+        """
+        Record that a chunk was committed.
+
+        :param int|str position: The position of the last post in the chunk.
+        :param int count: The number of posts in the chunk.
+        :return: None
+        """
+        self.position = position
+        self.imported += count
+        self._save()
+
+    def _save(self, pending=None):
+        # Replace the file in one step, so a crash never leaves half a checkpoint
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'source': self.source, 'position': self.position,
+                       'imported': self.imported, 'pending': pending}, f)
+        os.replace(tmp, self.path)
+
+
+def _parse_time(value):
+    """
+    Parse an ISO 8601 date or time, converting times with an offset to naive UTC.
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _split_front_matter(text):
+    """
+    Split a file into its front matter, as a dictionary, and its body.
+    """
+    if not text.startswith('---\n'):
+        return {}, text
+    end = text.find('\n---\n', 3)
+    if end == -1:
+        return {}, text
+    meta = {}
+    for line in text[4:end].splitlines():
+        key, sep, value = line.partition(':')
+        if sep:
+            meta[key.strip().lower()] = value.strip()
+    return meta, text[end + 5:]
+
+
+def _read_lines(source):
+    with open(source, encoding='utf-8') as f:
+        for number, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError('Line %d of %s is not valid JSON: %s' % (number + 1, source, e))
+            yield number, record
+
+
+def _order(position):
+    """
+    Get the sort key of a position, so a directory's files sort by their path's parts.
+    """
+    return position.split('/') if isinstance(position, str) else position
+
+
+def _read_files(source):
+    names = []
+    for root, dirs, files in os.walk(source):
+        names += [os.path.relpath(os.path.join(root, name), source).replace(os.sep, '/')
+                  for name in files if os.path.splitext(name)[1].lower() in FILE_FORMATS]
+    for relative in sorted(names, key=_order):
+        with open(os.path.join(source, *relative.split('/')), encoding='utf-8') as f:
+            meta, body = _split_front_matter(f.read())
+        name, extension = os.path.splitext(os.path.basename(relative))
+        yield relative, {'title': meta.get('title') or name, 'body': body,
+                       'author': meta.get('author'), 'time': meta.get('date') or meta.get('time'),
+                       'tags': meta.get('tags', ''), 'format': FILE_FORMATS[extension.lower()]}
+
+
+def read_posts(source):
+    """
+    Read the posts in a JSON Lines file or a directory of files.
+
+    Posts are read lazily, one at a time, each with its position in the source: its
+    line number in a file, or its file's path relative to a directory, with '/'
+    separators. Files are read in order of their paths.
+
+    :param str source: The path of the file or directory.
+    :raises ValueError: If a line of a JSON Lines file is not valid JSON.
+    :return generator(tuple(int|str, dict)): The position and fields of each post.
+    """
+    if os.path.isdir(source):
+        return _read_files(source)
+    return _read_lines(source)
+
+
+def _prepare(record, author, now, preview_length):
+    """
+    Render and sanitize a post read from a source. Runs in a worker process.
+    """
+    body_format = 'markdown' if record.get('format') == 'markdown' else 'html'
+    tags = record.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    return prepare_post(record.get('title') or '', record.get('body') or '',
+                        record.get('author') or author, _parse_time(record.get('time')) or now,
+                        tags, preview_length, body_format)
+
+
+def import_posts(source, checkpoint_path, batch_size=500, workers=1, restart=False,
+                 author='Anonymous Blogger', progress=None):
+    """
+    Import posts from a JSON Lines file or a directory of files.
+
+    Posts are imported in chunks of batch_size, each committed in its own
+    transaction, and bodies are sanitized by a pool of worker processes while the
+    previous chunk is written. The import continues after the last post recorded
+    in the checkpoint file, unless restart is set.
+
+    :param str source: The path of the file or directory.
+    :param str checkpoint_path: The path of the checkpoint file.
+    :param int batch_size: The number of posts to insert per transaction.
+    :param int workers: The number of processes to sanitize bodies with.
+    :param bool restart: Ignore the checkpoint and import the whole source.
+    :param str author: The author of posts that do not name one.
+    :param func progress: Called with the number of posts imported so far and the
+        seconds taken after every chunk.
+    :raises ValueError: If the source cannot be parsed.
+    :return ImportResult: The numbers of posts imported and skipped, and the time taken.
+    """
+    checkpoint = Checkpoint(checkpoint_path, source)
+    last = None if restart else checkpoint.resume()
+    preview_length = current_app.config['BLOG_PREVIEW_LENGTH']
+    now = datetime.utcnow()
+    skipped = checkpoint.imported
+    records = read_posts(source)
+    if last is not None:
+        # Positions only increase, so everything up to the checkpoint is at the start
+        records = dropwhile(lambda item: _order(item[0]) <= _order(last), records)
+    began = time.perf_counter()
+    imported = 0
+
+    pool = None
+    if workers > 1:
+        # Connections must not be shared with the forked workers
+        db.engine.dispose()
+        pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        def submit(chunk):
+            args = ([record for _, record in chunk], [author] * len(chunk), [now] * len(chunk),
+                    [preview_length] * len(chunk))
+            if pool is None:
+                return map(_prepare, *args)
+            return pool.map(_prepare, *args, chunksize=max(1, len(chunk) // (workers * 4)))
+
+        def write(chunk, prepared):
+            rows = list(prepared)
+            ids = insert_posts(rows)
+            position = chunk[-1][0]
+            checkpoint.begin(position, len(ids), ids[-1], rows[-1]['title'])
+            db.session.commit()
+            checkpoint.reach(position, len(ids))
+            return len(ids)
+
+        pending = None
+        while True:
+            chunk = list(islice(records, batch_size))
+            # The next chunk is sanitized by the workers while this one is written
+            prepared = submit(chunk) if chunk else None
+            if pending is not None:
+                imported += write(*pending)
+                if progress is not None:
+                    progress(imported, time.perf_counter() - began)
+            if not chunk:
+                break
+            pending = (chunk, prepared)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return ImportResult(imported, skipped, time.perf_counter() - began)
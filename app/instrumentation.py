@@ -0,0 +1,214 @@
+"""
+Per-request timing of SQL, templates and sanitization.
+
+When BLOG_INSTRUMENTATION is on, every request records how many SQL statements it
+executed and how long they took, the slowest of them, how long its templates took
+to render and how long bleach took to sanitize post bodies. The timings are sent
+back in a Server-Timing header, which browsers show in their developer tools next
+to the request, and written as one JSON line per request to the
+'app.instrumentation' logger, a child of the application's logger, whose level
+is set from BLOG_INSTRUMENTATION_LOG_LEVEL by the configuration's init_app().
+
+Statements are timed with SQLAlchemy's cursor events and templates with Flask's
+template signals. The times overlap: queries run while a template renders, e.g.
+to load a relationship, count towards both the SQL and the render time. The
+cursor events are shared: on_query() gives the metrics and the slow-query log the
+same timing of each statement, instead of each listening to every engine.
+
+Classes
+-------
+Instrumentation
+    Timing of each request's SQL, templates and sanitization.
+
+Methods
+-------
+timer(name)
+    Time a block of code as part of the current request.
+on_query(listener)
+    Call a function with the time every statement took.
+"""
+
+import heapq
+import json
+import logging
+import re
+import time
+from contextlib import contextmanager
+from flask import before_render_template, current_app, g, has_app_context, has_request_context, \
+    request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# The functions called with the time each statement took, see on_query()
+_query_listeners = []
+
+# The number of characters of a slow statement that are logged
+STATEMENT_LENGTH = 500
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _stats():
+    """
+    Get the timings of the current request, or None if it is not being timed.
+    """
+    if not has_request_context():
+        return None
+    return g.get('_instrumentation')
+
+
+@contextmanager
+def timer(name):
+    """
+    Time a block of code as part of the current request.
+
+    The time is added to the request's timing under name, and shown in its
+    Server-Timing header. Outside a timed request, the block just runs.
+
+    :param str name: The name of the timing, e.g. 'sanitize'.
+    """
+    stats = _stats()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats['timers'][name] = stats['timers'].get(name, 0.0) + time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        conn.info.setdefault('blog.query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('blog.query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if not has_app_context():
+        return
+    for listener in _query_listeners:
+        listener(conn, statement, parameters, executemany, elapsed)
+
+
+def on_query(listener):
+    """
+    Call a function with the time every statement run in an application context took.
+
+    Every engine's statements are timed once, by a single pair of cursor events, and
+    the time is passed to each listener, which is called with the connection, the
+    statement, its parameters, whether it ran once per set of parameters and the
+    seconds it took. Registering a listener again does nothing.
+
+    :param func listener: The function to call.
+    :return: None
+    """
+    if listener not in _query_listeners:
+        _query_listeners.append(listener)
+    # Engines are created per application, so every engine is listened to
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _record_query(conn, statement, parameters, executemany, elapsed):
+    stats = _stats()
+    if stats is None:
+        return
+    stats['queries'] += 1
+    stats['sql'] += elapsed
+    # Keep the slowest statements in a small min-heap; the counter breaks ties
+    entry = (elapsed, stats['queries'], statement)
+    if len(stats['slowest']) < current_app.config['BLOG_INSTRUMENTATION_SLOWEST']:
+        heapq.heappush(stats['slowest'], entry)
+    elif stats['slowest'] and elapsed > stats['slowest'][0][0]:
+        heapq.heapreplace(stats['slowest'], entry)
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats['rendering'].append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is None or not stats['rendering']:
+        return
+    start = stats['rendering'].pop()
+    stats['templates'] += 1
+    # Templates rendered inside another one, like the sidebar fragments, are already
+    # part of its time
+    if not stats['rendering']:
+        stats['render'] += time.perf_counter() - start
+
+
+class Instrumentation:
+    """
+    Timing of each request's SQL, templates and sanitization.
+
+    Methods
+    -------
+    init_app(app)
+        Register the request hooks, signal receivers and query listener.
+    """
+
+    def init_app(self, app):
+        """
+        Register the request hooks, signal receivers and query listener.
+
+        Everything does nothing unless BLOG_INSTRUMENTATION is on. It should be
+        initialized before the page cache, so that pages served from the cache are
+        timed too.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        app.extensions['instrumentation'] = self
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+        on_query(_record_query)
+
+    @staticmethod
+    def _start():
+        if current_app.config['BLOG_INSTRUMENTATION']:
+            g._instrumentation = {'start': time.perf_counter(), 'queries': 0, 'sql': 0.0,
+                                  'slowest': [], 'templates': 0, 'render': 0.0,
+                                  'rendering': [], 'timers': {}}
+
+    @staticmethod
+    def _finish(response):
+        """
+        Add the request's timings to its response and log them.
+        """
+        stats = _stats()
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats['start']
+        timings = [('sql', stats['sql'], '%d queries' % stats['queries']),
+                   ('render', stats['render'], '%d templates' % stats['templates'])]
+        timings += [(name, seconds, None) for name, seconds in sorted(stats['timers'].items())]
+        timings.append(('total', total, None))
+        response.headers.add('Server-Timing', ', '.join(
+            '%s;dur=%.1f' % (name, seconds * 1000) + (';desc="%s"' % desc if desc else '')
+            for name, seconds, desc in timings))
+
+        slowest = sorted(stats['slowest'], reverse=True)
+        logger.info(json.dumps({
+            'method': request.method, 'path': request.path, 'endpoint': request.endpoint,
+            'status': response.status_code, 'total_ms': round(total * 1000, 2),
+            'queries': stats['queries'], 'sql_ms': round(stats['sql'] * 1000, 2),
+            'templates': stats['templates'], 'render_ms': round(stats['render'] * 1000, 2),
+            'timers_ms': {name: round(seconds * 1000, 2)
+                          for name, seconds in stats['timers'].items()},
+            'slowest': [{'ms': round(elapsed * 1000, 2),
+                         'statement': _WHITESPACE.sub(' ', statement).strip()[:STATEMENT_LENGTH]}
+                        for elapsed, _, statement in slowest]}))
+        return response
@@ -13,12 +13,13 @@ inject_permissions()
 
 """
 
-from flask import Blueprint
+from flask import Blueprint, current_app
 
 main = Blueprint('main', __name__)
 
 from . import views
 from ..models import Post, Tag, Permission
+from .. import fragment_cache
 
 @main.app_context_processor
 def inject_globals():
@@ -34,6 +35,8 @@ def inject_globals():
         Get the five most recent posts so they can be displayed in the sidebar.
     sidebar_tags()
         Get all tags in the Tag database so they can be displayed in the sidebar.
+    cached_fragment(template_name)
+        Render a sidebar box, reusing the cached output until posts or tags change.
 
     :return dict(func): A dictionary of functions that can be called from a Jinja template.
     """
@@ -44,25 +47,29 @@ def inject_globals():
 
         The Post database is queried with results returned in descending time order.
         The first five elements from the returned list are sliced and returned
-        by the function.
+        by the function. Only the columns needed to link to the posts are loaded.
 
         :return BaseQuery: A query object containing the five most recent posts.
         """
 
-        return Post.query.order_by(Post.time.desc())[0:5]
+        return Post.sidebar().order_by(Post.time.desc(), Post.id.desc())[0:5]
 
     def sidebar_tags():
         """
         Get all tags in the Tag database so they can be displayed in the sidebar.
 
-        The Tag database is queried for all entries and a list is created from the tags'
-        names.
-        :return list(str): A list of all tag names.
+        The Tag database is queried for all entries, sorted by name or, if
+        BLOG_SIDEBAR_TAG_ORDER is 'popularity', by post count with the most used
+        tags first.
+        :return list(Tag): A list of all tags.
         """
 
-        return sorted(Tag.query.all(), key=lambda tag: tag.name)
+        if current_app.config['BLOG_SIDEBAR_TAG_ORDER'] == 'popularity':
+            return Tag.query.order_by(Tag.post_count.desc(), Tag.name).all()
+        return Tag.query.order_by(Tag.name).all()
 
-    return {'recent' : recent, 'sidebar_tags' : sidebar_tags}
+    return {'recent' : recent, 'sidebar_tags' : sidebar_tags,
+            'cached_fragment' : fragment_cache.render}
 
 @main.app_context_processor
 def inject_permissions():
@@ -4,16 +4,17 @@ Contains forms related to creating blog posts.
 
 from flask_wtf import FlaskForm
 from flask_ckeditor import CKEditorField
-from wtforms import StringField, SubmitField, FieldList, TextAreaField
+from wtforms import StringField, SubmitField, FieldList, TextAreaField, SelectField
 from wtforms.validators import DataRequired
+from ..models import BODY_FORMATS
 
 class PostForm(FlaskForm):
     """
     A form for the post editor, used on the new_post and edit pages.
 
     Extends the FlaskForm class from flask_wtf. Contains fields for the post title,
-    post, body, and tags as well as a submit field. The body field is a CKEditor post
-    editor. The tags field is a string field that is parsed elsewhere as a comma-separated
+    post, body, body format and tags as well as a submit field. The body field is a
+    CKEditor post editor, which becomes a plain text area when Markdown is chosen. The tags field is a string field that is parsed elsewhere as a comma-separated
     list of tags. The title and body fields cannot be empty.
 
     Attributes
@@ -22,6 +23,8 @@ class PostForm(FlaskForm):
         A field for the post title.
     body : CKEditorField(label='Body', validators=[DataRequired())
         A field for editing the body of the text.
+    body_format : SelectField(label='Format')
+        A field for choosing whether the body is rich text or Markdown.
     tags : StringField(label='Tags')
         A field for the post's tags.
     submit : SubmitField(label='Submit')
@@ -30,6 +33,7 @@ class PostForm(FlaskForm):
 
     title = StringField('Title', validators=[DataRequired()])
     body = CKEditorField('Body', validators=[DataRequired()])
+    body_format = SelectField('Format', choices=BODY_FORMATS, default='html')
     tags = StringField('Tags')
     submit = SubmitField('Submit')
 
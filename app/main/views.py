@@ -11,6 +11,14 @@ tagged(tag)
     Render a page displaying all posts with a given tag.
 author(author)
     Render a page displaying all posts with a given author.
+search()
+    Render a page of posts matching a search.
+feed()
+    Serve an Atom feed of the newest posts.
+tag_feed(tag)
+    Serve an Atom feed of the newest posts with a given tag.
+metrics()
+    Serve the application's request metrics.
 new_post()
     Render a page for creating a new post.
 edit(id)
@@ -20,12 +28,35 @@ delete(id)
 """
 
 from . import main
-from .. import db
+from .. import db, metrics as request_metrics
 from ..models import *
 from flask import render_template, request, session, current_app, redirect, abort, flash
 from .forms import PostForm
 from flask_login import login_required, current_user
 from app.decorators import permission_required
+from ..pagination import paginate
+from ..search import find_posts
+from ..feeds import feed_response
+from ..conditional import conditional, listing_etag, not_modified, post_etag
+from ..metrics import CONTENT_TYPE
+from ..sanitizer import SanitizeTimeout
+
+# Shown when a post's body takes too long to sanitize
+TOO_LARGE_MESSAGE = 'This post is too large or complex to save. Please shorten it and try again.'
+
+
+def _paginate(query, total_key, **kwargs):
+    """
+    Paginate a listing query using the cursors in the request's query string.
+
+    :param BaseQuery query: The unordered listing query.
+    :param tuple total_key: A key under which to cache the listing's approximate total.
+    :param kwargs: Further arguments for app.pagination.paginate().
+    :return KeysetPagination: The requested page of the listing.
+    """
+    return paginate(query, per_page=current_app.config['BLOG_POSTS_PER_PAGE'],
+                    after=request.args.get('after'), before=request.args.get('before'),
+                    total_key=total_key, **kwargs)
 
 
 @main.route('/', methods=['GET', 'POST'])
@@ -35,15 +66,17 @@ def index():
 
     The homepage lists all blog posts, paginated and sorted from newest to oldest.
     The number of posts to display per page is set in the configuration file.
+    Pages are reached with the ?after= and ?before= cursors rendered by the
+    pagination widget. A client that already has the current page gets a 304 Not
+    Modified without the page being rendered.
 
-    :return str: A Jinja template for the blog homepage.
+    :return Response: The blog homepage.
     """
-    page = request.args.get('page', 1, type=int)
-    pagination = Post.query.order_by(Post.time.desc()).paginate(
-        page, per_page=current_app.config['BLOG_POSTS_PER_PAGE'],
-        error_out=False)
+    pagination = _paginate(Post.listing(), total_key=('index',))
+    etag = listing_etag(pagination)
     posts = pagination.items
-    return render_template('index.html', posts=posts, pagination=pagination)
+    return not_modified(etag) or conditional(
+        render_template('index.html', posts=posts, pagination=pagination), etag)
 
 
 @main.route('/post/<int:id>', methods=['GET', 'POST'])
@@ -52,15 +85,24 @@ def post(id):
     Render the permalink page of a post, with a URL created from the post ID.
 
     The Post table is queried using the given post ID; if no post with said ID
-    is found, a 404 error is returned. The post's tags are retrieved using the post's
+    is found, a 404 error is returned. The post's full body is loaded along with the rest
+    of the post; listings only load its preview. The post's tags are retrieved using the post's
     get_tags() method so they can be displayed on the permalink page.
 
-    :return str: A Jinja template for a post's permalink page.
-    """
+    The page's ETag is computed first, from the post's updated_at time and tags, and a
+    client that already has the current page gets a 304 Not Modified before the body
+    is loaded.
 
-    post = Post.query.get_or_404(id)
+    :return Response: A post's permalink page.
+    """
+    etag, last_modified = post_etag(id)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    post = Post.with_body().get_or_404(id)
     post_tags = post.get_tags()
-    return render_template('post.html', post=post, post_tags=post_tags)
+    return conditional(render_template('post.html', post=post, post_tags=post_tags),
+                       etag, last_modified)
 
 
 @main.route('/tagged/<tag>', methods=['GET', 'POST'])
@@ -69,22 +111,22 @@ def tagged(tag):
     Render a page displaying all posts with a given tag, with a URL created from the tag name.
 
     To retrieve posts with the given tag, the Tag table is queried with the given
-    tag name and its get_posts() method is called.
+    tag name. If no tag with the given name exists, a 404 error is returned. A page of
+    the tag's posts is found from the post_tags index with the tag's get_post_keys()
+    method, and only the posts on that page are then loaded.
 
-    As with the home page, posts are paginated and sorted from newest to oldest.
+    As with the home page, posts are paginated and sorted from newest to oldest, and
+    a client that already has the current page gets a 304 Not Modified.
     :param str tag: The name of the target tag
     :return str: A Jinja template for the results page.
     """
-    # Might need to ensure they are sorted by date?
-    page = request.args.get('page', 1, type=int)
-    tagged = Tag.query.get(tag).get_posts()
-
-    pagination = tagged.order_by(Post.time.desc()).paginate(
-        page, per_page=current_app.config['BLOG_POSTS_PER_PAGE'],
-        error_out=False)
-    posts = pagination.items
-
-    return render_template('tagged.html', posts=posts, pagination=pagination, tag=tag)
+    keys = Tag.query.get_or_404(tag).get_post_keys()
+    pagination = _paginate(keys, total_key=('tagged', tag),
+                           time_column=post_tags.c.post_time, id_column=post_tags.c.post_id)
+    pagination.items = posts = Post.from_keys(pagination.items)
+    etag = listing_etag(pagination)
+    return not_modified(etag) or conditional(
+        render_template('tagged.html', posts=posts, pagination=pagination, tag=tag), etag)
 
 
 @main.route('/author/<author>')
@@ -95,22 +137,80 @@ def author(author):
     To retrieve posts with the given author, the Post table is queried with the author's
     name as a filter.
 
-    As with the home page, posts are paginated and sorted from newest to oldest.
+    As with the home page, posts are paginated and sorted from newest to oldest, and
+    a client that already has the current page gets a 304 Not Modified.
 
     :param str author: The name of the target author
     :return str: A Jinja template for the results page.
     """
-    # Might need to ensure they are sorted by date?
-    posts_by = Post.query.filter_by(author=author)
-    page = request.args.get('page', 1, type=int)
+    posts_by = Post.listing().filter_by(author=author)
+    pagination = _paginate(posts_by, total_key=('author', author))
+    etag = listing_etag(pagination)
+    posts = pagination.items
+    return not_modified(etag) or conditional(
+        render_template('author.html', posts=posts, pagination=pagination, author=author), etag)
 
-    ##could this be moved to a context processor?
-    pagination = posts_by.order_by(Post.time.desc()).paginate(
-        page, per_page=current_app.config['BLOG_POSTS_PER_PAGE'],
-        error_out=False)
+@main.route('/search')
+def search():
+    """
+    Render a page of posts matching the search in the q query string argument.
+
+    Posts are searched with app.search.find_posts(), which ranks matches from best
+    to worst and highlights the matching words in a snippet of each post. Results
+    are paginated with cursors in the same way as the home page.
+
+    :return str: A Jinja template for the search results page.
+    """
+    q = request.args.get('q', '').strip()
+    pagination = None
+    if q:
+        pagination = find_posts(q, per_page=current_app.config['BLOG_POSTS_PER_PAGE'],
+                                after=request.args.get('after'),
+                                before=request.args.get('before'))
+    return render_template('search.html', q=q, pagination=pagination)
+
+
+@main.route('/feed.atom')
+def feed():
+    """
+    Serve an Atom feed of the newest posts.
+
+    Feeds are cached until a post changes, and requests with a matching
+    If-None-Match or If-Modified-Since header get a 304 Not Modified.
+
+    :return Response: The feed, or an empty 304 response.
+    """
+    return feed_response()
+
+
+@main.route('/feed/tag/<tag>.atom')
+def tag_feed(tag):
+    """
+    Serve an Atom feed of the newest posts with a given tag.
+
+    :param str tag: The name of the tag.
+    :return Response: The feed, or an empty 304 response.
+    """
+    return feed_response(tag)
+
+
+@main.route('/metrics')
+@login_required
+@permission_required(Permission.ADMIN)
+def metrics():
+    """
+    Serve the request latency, SQL time, in-flight request and cache metrics.
+
+    The metrics are in the Prometheus text format. Accessing this page requires the
+    user to be logged in and have the ADMIN permission.
+
+    :return Response: The metrics as plain text.
+    """
+    response = current_app.response_class(request_metrics.render(current_app),
+                                          content_type=CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
-    posts = pagination.items
-    return render_template('author.html', posts=posts, pagination=pagination, author=author, page=page)
 
 @main.route('/new_post', methods=['GET', 'POST'])
 @login_required
@@ -123,7 +223,8 @@ def new_post():
     the form data must pass the validation defined the the PostForm class.
     When the data is submitted, a new Post instance is created from the form data
     and added to the database. After the post is created, the user is redirected
-    to the post's permalink page.
+    to the post's permalink page. If the body is too large to sanitize in time, the
+    form is shown again with a message.
 
     Accessing this page requires the user to be logged in and have the WRITE permission.
 
@@ -132,10 +233,15 @@ def new_post():
     form = PostForm()
 
     if form.validate_on_submit():
-        post = Post(body=form.body.data, title=form.title.data, author=current_user.name)
-        for t in form.tags.data.split(', '):
-            post.tag(t)
+        try:
+            # The format is set first, so the body is rendered once in the right format
+            post = Post(body_format=form.body_format.data, body=form.body.data,
+                        title=form.title.data, author=current_user.name)
+        except SanitizeTimeout:
+            flash(TOO_LARGE_MESSAGE)
+            return render_template('new_post.html', form=form)
         db.session.add(post)
+        post.set_tags(Tag.parse_names(form.tags.data))
         db.session.commit()
         return redirect(url_for('.post', id=post.id))
     return render_template('new_post.html', form=form)
@@ -152,7 +258,9 @@ def edit(id):
     will already be filled in with the title, body, and tags of an existing post.
     Before rendering the page, the Post database table is queried for a post with the
     given post ID. The data from that post, if it exists, is used to fill in the forms.
+    When the form is submitted, the post's tags are replaced by the tags in the form.
     After the post is updated, the user is redirected to the post's permalink page.
+    If the body is too large to sanitize in time, the form is shown again with a message.
 
     Accessing this page requires the user to be logged in and have the WRITE permission.
 
@@ -160,28 +268,24 @@ def edit(id):
     :return str: A Jinja template for the edit post page
     """
     # TODO: verify that logged in user is the author of the post
-    post = Post.query.get_or_404(id)
+    post = Post.with_body().get_or_404(id)
     form = PostForm()
 
     if form.validate_on_submit():
-        post.body = form.body.data
+        try:
+            post.set_body(form.body.data, form.body_format.data)
+        except SanitizeTimeout:
+            flash(TOO_LARGE_MESSAGE)
+            return render_template('edit.html', form=form)
         post.title = form.title.data
-        for t in form.tags.data.split(', '):
-            # Only add new tags to a post to avoid duplicates in the post_tags table
-            if t not in [tag.name for tag in post.get_tags()]:
-                post.tag(t)
-        db.session.add(post)
+        post.set_tags(Tag.parse_names(form.tags.data))
         db.session.commit()
         return redirect(url_for('.post', id=post.id))
 
-    # should find a better way to get the tags
-    tag_list = []
-    for t in post.get_tags():
-        tag_list.append(t.name)
-    tags = ', '.join(tag_list).strip(',')
     form.body.data = post.body
+    form.body_format.data = post.body_format
     form.title.data = post.title
-    form.tags.data = tags
+    form.tags.data = ', '.join(t.name for t in post.get_tags())
 
     return render_template('edit.html', form=form)
 
@@ -195,10 +299,10 @@ def delete(id):
 
     Unlike the other views, delete does not render a page. It is only called from a post's
     permalink page, and redirects the user to the blog home page after deleting the post.
+    The post counts of the post's tags are decremented.
     If the post was the only post with a tag, that tag must also be deleted from the tag
-    database. Each of the now deleted post's tags is used to query the Tag database table
-    and retrieve the posts that have said tag. If no such posts are returned by the query,
-    the Tag is deleted from the database.
+    database. Post.remove() does all of this with a handful of set-based statements, and
+    the whole deletion is committed as a single transaction.
 
     Accessing this page requires the user to be logged in and have the WRITE permission.
 
@@ -208,14 +312,8 @@ def delete(id):
 
     # TODO: verify that logged in user is the author of the post
     post = Post.query.get_or_404(id)
-    tags = post.get_tags()
-    db.session.delete(post)
+    post.remove()
     db.session.commit()
-    # If necessary, delete orphaned tags after deleting the post
-    for tag in tags:
-        if Tag.query.get(tag.name).get_posts().first() is None:
-            db.session.delete(tag)
-            db.session.commit()
     flash('Post successfully deleted.')
 
     return redirect(url_for('.index'))
@@ -0,0 +1,224 @@
+"""
+Aggregated request metrics in the Prometheus text format.
+
+Requests to the main and auth blueprints are counted in histograms of their
+latency and of the time spent in SQL, per endpoint, and gauges track how many
+requests are in flight per blueprint. Along with the hit and miss counts of the
+in-process caches, they are exposed at /metrics for administrators, in the
+format Prometheus scrapes.
+
+Recording a request takes a few microseconds: two perf_counter() calls, a bisect
+over the buckets and increments under an uncontended lock. Each process has its
+own metrics, so with several workers each is scraped separately, or their sums
+are taken.
+
+Classes
+-------
+Histogram
+    A thread-safe histogram with fixed buckets.
+Metrics
+    The application's request metrics.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, has_request_context, request
+from .cache import LRUCache
+from .instrumentation import on_query
+
+# The blueprints whose requests are measured
+BLUEPRINTS = ('main', 'auth')
+
+# The content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """
+    A thread-safe histogram with fixed buckets.
+
+    Attributes
+    ----------
+    buckets : tuple(float)
+        The upper bounds of the buckets, in increasing order.
+    counts : list(int)
+        The number of observations in each bucket, and above the last one.
+    sum : float
+        The sum of all observations.
+
+    Methods
+    -------
+    observe(value)
+        Count an observation.
+    snapshot()
+        Get consistent copies of the counts and the sum.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Count an observation.
+
+        :param float value: The observed value.
+        :return: None
+        """
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self):
+        """
+        Get consistent copies of the counts and the sum.
+
+        :return tuple(list(int), float): The count in each bucket, not cumulative, and the sum.
+        """
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _record_query(conn, statement, parameters, executemany, elapsed):
+    if not has_request_context():
+        return
+    measured = request.environ.get('blog.metrics')
+    if measured is not None:
+        measured[1] += elapsed
+
+
+class Metrics:
+    """
+    The application's request metrics.
+
+    Methods
+    -------
+    init_app(app)
+        Create the application's metrics and register their request hooks.
+    render(app)
+        Write out every metric in the Prometheus text format.
+    """
+
+    def init_app(self, app):
+        """
+        Create the application's metrics and register their request hooks.
+
+        The hooks do nothing unless BLOG_METRICS is on. They should be registered
+        before the page cache's, so that pages served from it are measured too.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        app.extensions['metrics'] = {
+            'lock': threading.Lock(),
+            'latency': {},
+            'sql': {},
+            'in_flight': dict.fromkeys(BLUEPRINTS, 0),
+        }
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+        on_query(_record_query)
+
+    @staticmethod
+    def _histogram(state, family, endpoint):
+        histogram = state[family].get(endpoint)
+        if histogram is None:
+            with state['lock']:
+                histogram = state[family].setdefault(
+                    endpoint, Histogram(current_app.config['BLOG_METRICS_BUCKETS']))
+        return histogram
+
+    @staticmethod
+    def _start():
+        # The proxies are resolved once, since each lookup costs about as much as recording
+        app = current_app._get_current_object()
+        req = request._get_current_object()
+        blueprint = req.blueprint
+        if not app.config['BLOG_METRICS'] or blueprint not in BLUEPRINTS:
+            return
+        state = app.extensions['metrics']
+        with state['lock']:
+            state['in_flight'][blueprint] += 1
+        # The request's start time, the seconds it has spent in SQL so far and its blueprint
+        req.environ['blog.metrics'] = [time.perf_counter(), 0.0, blueprint]
+
+    def _finish(self, exc=None):
+        """
+        Record a finished request. Runs even if the view raised an exception.
+        """
+        req = request._get_current_object()
+        measured = req.environ.pop('blog.metrics', None)
+        if measured is None:
+            return
+        elapsed = time.perf_counter() - measured[0]
+        state = current_app.extensions['metrics']
+        with state['lock']:
+            state['in_flight'][measured[2]] -= 1
+        endpoint = req.endpoint
+        self._histogram(state, 'latency', endpoint).observe(elapsed)
+        self._histogram(state, 'sql', endpoint).observe(measured[1])
+
+    def render(self, app):
+        """
+        Write out every metric in the Prometheus text format.
+
+        :param Flask app: The application instance.
+        :return str: The metrics.
+        """
+        state = app.extensions['metrics']
+        lines = []
+
+        def family(name, kind, help):
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+        def sample(name, labels, value):
+            label_text = ','.join('%s="%s"' % (key, _escape(v)) for key, v in labels)
+            lines.append('%s{%s} %s' % (name, label_text, _format_value(value)))
+
+        for key, name, help in (
+                ('latency', 'blog_request_duration_seconds', 'Time taken to handle requests.'),
+                ('sql', 'blog_request_sql_seconds', 'Time spent executing SQL per request.')):
+            family(name, 'histogram', help)
+            for endpoint, histogram in sorted(state[key].items()):
+                counts, total = histogram.snapshot()
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    sample(name + '_bucket', [('endpoint', endpoint), ('le', le)], cumulative)
+                sample(name + '_sum', [('endpoint', endpoint)], total)
+                sample(name + '_count', [('endpoint', endpoint)], cumulative)
+
+        family('blog_requests_in_flight', 'gauge', 'Requests being handled.')
+        with state['lock']:
+            in_flight = dict(state['in_flight'])
+        for blueprint, count in sorted(in_flight.items()):
+            sample('blog_requests_in_flight', [('blueprint', blueprint)], count)
+
+        caches = sorted((name, cache) for name, cache in app.extensions.items()
+                        if isinstance(cache, LRUCache))
+        family('blog_cache_hits_total', 'counter', 'Lookups that found a cached entry.')
+        for name, cache in caches:
+            sample('blog_cache_hits_total', [('cache', name)], cache.hits)
+        family('blog_cache_misses_total', 'counter', 'Lookups that found no cached entry.')
+        for name, cache in caches:
+            sample('blog_cache_misses_total', [('cache', name)], cache.misses)
+        family('blog_cache_hit_ratio', 'gauge', 'Fraction of lookups that found a cached entry.')
+        for name, cache in caches:
+            hits, misses = cache.hits, cache.misses
+            sample('blog_cache_hit_ratio', [('cache', name)],
+                   float(hits) / (hits + misses) if hits + misses else 0.0)
+        return '\n'.join(lines) + '\n'
@@ -1,18 +1,37 @@
+import hashlib
 from datetime import datetime
 from markdown import markdown
-import bleach
-from flask import current_app, request, url_for
+from flask import current_app, has_app_context, request, url_for
+from sqlalchemy.orm.attributes import set_committed_value
 from . import db, login_manager
+from .text import truncate_html
+from .cache import LRUCache, mark_changed
+from .instrumentation import timer
+from .sanitizer import markdown_sanitizer, post_sanitizer
+from .types import CompressedText
+from config import Config
 from flask_login import UserMixin, AnonymousUserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # Association table to relate tags to posts.
+# post_time is a copy of the post's time, so a tag's posts can be listed in time order
+# from the ix_post_tags_tag_time index alone. Rows are written by Post.set_tags().
 post_tags = db.Table('post_tags',
-                     db.Column('tag_id', db.String(), db.ForeignKey('tag.name')),
-                     db.Column('post_id', db.Integer, db.ForeignKey('posts.id'))
+                     db.Column('tag_id', db.String(), db.ForeignKey('tag.name'), primary_key=True),
+                     db.Column('post_id', db.Integer, db.ForeignKey('posts.id'), primary_key=True),
+                     db.Column('post_time', db.DateTime),
+                     db.Index('ix_post_tags_post_id_tag_id', 'post_id', 'tag_id'),
+                     db.Index('ix_post_tags_tag_time', 'tag_id', 'post_time', 'post_id')
                      )
 
 
+# Sanitized HTML of recently rendered bodies, by format and hash of the body
+_rendered_bodies = LRUCache(maxsize=128)
+
+# The formats a post's body can be written in, with their names in the post editor
+BODY_FORMATS = (('html', 'Rich text'), ('markdown', 'Markdown'))
+
+
 class Post(db.Model):
     """
     Represents a blog post and the Post database table.
@@ -29,12 +48,18 @@ class Post(db.Model):
         the primary key for the table, assigned automatically.
     title : Column(str)
         the title of the blog post.
-    body : Column(UnicodeText)
-        the formatted body of the blog post, stored as unicode.
-    body_html : Column(Text)
-        the body of the test after the HTML is cleaned for security.
+    body : Column(CompressedText)
+        the formatted body of the blog post, compressed if it is long. Deferred.
+    body_format : Column(String)
+        the format the body is written in, 'html' or 'markdown'.
+    body_html : Column(CompressedText)
+        the body of the test after the HTML is cleaned for security, compressed if it is long. Deferred.
+    body_preview : Column(Text)
+        the start of body_html, cut without splitting tags, displayed in post listings.
     time : Column(DateTime)
         the time and date that the post was created.
+    updated_at : Column(DateTime)
+        the time and date that the post, or its set of tags, last changed.
     author : Column(String)
         the author of the blog post.
     tags : relationship
@@ -44,17 +69,45 @@ class Post(db.Model):
     -------
     tag(tag)
         Add a tag to a post.
+    set_tags(names)
+        Set all of a post's tags at once.
+    remove()
+        Delete a post and any tags left without posts.
     on_changed_body(target, value, oldvalue, initiator)
         Sanitize a post's body before storing it in the database.
+    on_changed_body_format(target, value, oldvalue, initiator)
+        Render a post's body again when its format changes.
+    render_body(body, body_format, sanitize)
+        Convert a body to HTML and sanitize it, reusing earlier results.
+    sanitize(body)
+        Remove disallowed HTML tags from a post's body.
+    make_preview(body_html)
+        Create the preview of a post's sanitized body.
+    listing(query)
+        Load only the columns needed to list posts.
+    from_keys(keys)
+        Load the posts for a page of sort keys.
+    sidebar(query)
+        Load only the columns needed to link to posts.
+    with_body(query)
+        Load posts together with their full bodies.
 
     """
 
     __tablename__ = 'posts'
+    # Listings are paginated on (time, id), newest first
+    __table_args__ = (db.Index('ix_posts_time_id', 'time', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String())
-    body = db.Column(db.UnicodeText)
-    body_html = db.Column(db.Text)
+    # The full body is only needed on a post's own pages, so it is not loaded with the
+    # rest of the row. Accessing either column loads both in one query.
+    # Both are stored compressed once they are long enough; see app.types.
+    body = db.deferred(db.Column(CompressedText()), group='body')
+    body_html = db.deferred(db.Column(CompressedText()), group='body')
+    body_format = db.Column(db.String(16), nullable=False, default='html', server_default='html')
+    body_preview = db.Column(db.Text)
     time = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     author = db.Column(db.String(), default="Anonymous Blogger")
     tags = db.relationship('Tag', secondary=post_tags,
                            backref=db.backref('posts', lazy='dynamic'))
@@ -64,54 +117,292 @@ class Post(db.Model):
         """
         Sanitize rich text in a post's body before storing it in the database.
 
-        Only HTML tags in allowed_tags will be permitted; all others will be removed by bleach.clean.
+        Only HTML tags in ALLOWED_TAGS will be permitted; all others will be removed by bleach.
         The allowed tags are all HTML tags used by CKEditior's available formatting options;
-        all other HTML tags will be removed.
+        all other HTML tags will be removed. A Markdown body is converted to HTML first,
+        and sanitized keeping the tags in MARKDOWN_TAGS.
         The cleaned HTML will be stored in the posts' body_html column whenever the body
         of the post is changed by registering this method as an event listener of
-        SQLALchemy's 'set' event for the Post's body field.
+        SQLALchemy's 'set' event for the Post's body field. The post's preview is
+        created from the cleaned HTML at the same time, so listings never need to
+        load or cut the full body.
+        Setting a body equal to the loaded one, as saving an edit without changing
+        the body does, keeps the stored HTML. Bodies longer than
+        BLOG_SANITIZE_POOL_THRESHOLD are sanitized by a worker process with a timeout.
 
         :param target: The target post.
         :param value: The target post's body, which will be cleaned.
-        :param oldvalue:
+        :param oldvalue: The post's previous body, if it was loaded.
         :param initiator:
+        :raises SanitizeTimeout: If a large body took longer than BLOG_SANITIZE_TIMEOUT to clean.
+        :return: None
+        """
+
+        if value == oldvalue and target.body_html is not None:
+            return
+        target._render(value, target.body_format)
+
+    @staticmethod
+    def on_changed_body_format(target, value, oldvalue, initiator):
+        """
+        Render a post's body again when its format changes.
+
+        A body that has not been set or loaded is rendered when it is.
+
+        :param target: The target post.
+        :param value: The post's new body format.
+        :param oldvalue: The post's previous body format.
+        :param initiator:
+        :raises SanitizeTimeout: If a large body took longer than BLOG_SANITIZE_TIMEOUT to clean.
+        :return: None
+        """
+
+        body = target.__dict__.get('body')
+        if value != oldvalue and body is not None and not target.__dict__.get('_setting_body'):
+            target._render(body, value)
+
+    def set_body(self, body, body_format):
+        """
+        Change a post's body and its format, rendering the body once.
+
+        Setting the format first would render the old body in the new format, and
+        setting the body first would render the new body in the old format.
+
+        :param str body: The post's new body.
+        :param str body_format: The format of the new body.
+        :raises SanitizeTimeout: If a large body took longer than BLOG_SANITIZE_TIMEOUT to clean.
         :return: None
         """
+        if body == self.body:
+            self.body_format = body_format
+            return
+        self._setting_body = True
+        try:
+            self.body_format = body_format
+        finally:
+            del self._setting_body
+        self.body = body
+
+    @staticmethod
+    def sanitizer_for(body_format):
+        """
+        Get the sanitizer for bodies written in a format.
+
+        :param str body_format: 'html' or 'markdown'.
+        :return Sanitizer: The sanitizer.
+        """
+        return markdown_sanitizer if body_format == 'markdown' else post_sanitizer
+
+    def _render(self, body, body_format):
+        """
+        Store the sanitized HTML and the preview of a body.
+        """
+        config = current_app.config
+        sanitize = None
+        if len(body) > config['BLOG_SANITIZE_POOL_THRESHOLD']:
+            sanitizer = Post.sanitizer_for(body_format)
+            sanitize = lambda html: sanitizer.clean_isolated(
+                html, config['BLOG_SANITIZE_TIMEOUT'], config['BLOG_SANITIZE_WORKERS'])
+        with timer('sanitize'):
+            self.body_html = Post.render_body(body, body_format, sanitize)
+        self.body_preview = Post.make_preview(self.body_html)
+
+    @staticmethod
+    def render_body(body, body_format=None, sanitize=None):
+        """
+        Convert a body to HTML, if it is Markdown, and sanitize it.
+
+        Results are kept in memory by a hash of the format and body, so saving or
+        importing a body that was rendered before costs a hash instead of a render.
+        Bodies longer than BLOG_SANITIZE_POOL_THRESHOLD are not kept, so a few huge
+        posts cannot fill memory. Needs no application context, so bodies can be
+        rendered in other processes.
+
+        :param str body: The post's body.
+        :param str body_format: 'html' or 'markdown'. None means 'html'.
+        :param func sanitize: The function to sanitize HTML with. The format's sanitizer by default.
+        :return str: The body's sanitized HTML.
+        """
+
+        body_format = body_format or 'html'
+        threshold = current_app.config['BLOG_SANITIZE_POOL_THRESHOLD'] if has_app_context() \
+            else Config.BLOG_SANITIZE_POOL_THRESHOLD
+        remember = len(body) <= threshold
+        key = (body_format, hashlib.sha1(body.encode('utf-8')).hexdigest())
+        body_html = _rendered_bodies.get(key) if remember else None
+        if body_html is None:
+            html = markdown(body) if body_format == 'markdown' else body
+            body_html = (sanitize or Post.sanitizer_for(body_format).clean)(html)
+            if remember:
+                _rendered_bodies.set(key, body_html)
+        return body_html
+
+    @staticmethod
+    def sanitize(body):
+        """
+        Remove all HTML tags that are not in app.sanitizer.ALLOWED_TAGS from a post's body.
+
+        Needs no application context, so bodies can be sanitized in other processes.
+        The current thread's Cleaner is reused, so the policy is only compiled once.
+
+        :param str body: The post's body.
+        :return str: The sanitized body.
+        """
+
+        return post_sanitizer.clean(body)
+
+    @staticmethod
+    def make_preview(body_html):
+        """
+        Create the preview of a post's sanitized body.
+
+        The preview is the first BLOG_PREVIEW_LENGTH characters of text in the body.
+        Tags are never split and any left open are closed, so the preview can be
+        rendered on its own.
+
+        :param str body_html: The post's sanitized body.
+        :return str: The HTML of the post's preview.
+        """
+        return truncate_html(body_html, current_app.config['BLOG_PREVIEW_LENGTH'])
+
+    @staticmethod
+    def listing(query=None):
+        """
+        Load only the columns needed to display posts in a listing.
+
+        Listings show a post's title, author, time and stored preview, so the deferred
+        body columns and anything else are left unloaded. The time the post was last
+        updated is loaded too, to validate cached copies of the listing.
+
+        :param BaseQuery query: A query for posts. Post.query by default.
+        :return BaseQuery: The query, loading only the columns used by listings.
+        """
+        query = Post.query if query is None else query
+        return query.options(db.load_only(Post.id, Post.title, Post.author,
+                                          Post.time, Post.updated_at, Post.body_preview))
 
-        # Permitted HTML tags
-        allowed_tags = ['a', 'em', 'strong', 'h1', 'h2', 'h3,', 'pre',
-                        'table', 'tbody', 'tr', 'td', 'img', 'anchor',
-                        'li', 'ol', 'ul', 'p', 'blockquote', 's',
-                        'cite', 'span', 'div', 'big', 'samp', 'kbd',
-                        'q', 'ins', 'del', 'tt', 'small', 'var']
-        # Strip all other HTML tags from the body
-        target.body_html = bleach.clean(value, tags=allowed_tags, strip=True)
+    @staticmethod
+    def sidebar(query=None):
+        """
+        Load only the columns needed to link to posts, e.g. from the sidebar.
+
+        :param BaseQuery query: A query for posts. Post.query by default.
+        :return BaseQuery: The query, loading only the post's ID, title and time.
+        """
+        query = Post.query if query is None else query
+        return query.options(db.load_only(Post.id, Post.title, Post.time))
+
+    @staticmethod
+    def from_keys(keys):
+        """
+        Load the listing columns of posts given their sort keys, keeping the keys' order.
+
+        :param list keys: Rows with an id attribute, e.g. from Tag.get_post_keys().
+        :return list(Post): The posts, in the same order as keys.
+        """
+        ids = [key.id for key in keys]
+        if not ids:
+            return []
+        posts = {p.id: p for p in Post.listing().filter(Post.id.in_(ids))}
+        return [posts[id] for id in ids if id in posts]
+
+    @staticmethod
+    def with_body(query=None):
+        """
+        Load posts together with their full bodies.
+
+        Used by the pages that display or edit a whole post, so the deferred body
+        columns are fetched in the same query as the rest of the row.
+
+        :param BaseQuery query: A query for posts. Post.query by default.
+        :return BaseQuery: The query, loading the body columns up front.
+        """
+        query = Post.query if query is None else query
+        return query.options(db.undefer_group('body'))
 
     def tag(self, tag):
         """
-        Add a tag to a post by appending it to a post's list of tags. If necessary,
-        create new Tag object and add it to the Tag database. If the tag already
-        exists, query the Tag database and append the returned Tag to the post's
-        list of tags.
+        Add a tag to a post, creating the tag if it does not exist yet.
+
+        Adding a tag the post already has does nothing. An empty tag name adds the
+        "uncategorized" tag. See set_tags() for setting all of a post's tags at once.
 
         :param str tag: The name of the tag to be added.
         :return: None
         """
         # If a post is created without tags, assign it the "uncategorized" tag
         if tag == '':
-            if Tag.query.get("uncategorized") is None:
-                t = Tag(name="uncategorized")
-                self.tags.append(t)
-                db.session.add(t)
-            else:
-                self.tags.append(Tag.query.get("uncategorized"))
+            tag = "uncategorized"
+        self.set_tags([t.name for t in self.tags] + [tag])
+
+    def set_tags(self, names):
+        """
+        Set a post's tags, creating any tags that do not exist yet.
+
+        Names are normalized with Tag.normalize_names(), so a post with no tags gets
+        the "uncategorized" tag. The post's current tags are read once and compared
+        with the new ones, and only the difference is written: one DELETE for the tags
+        the post lost and one INSERT for the tags it gained. Tags that are new to the
+        blog are created with an insert that ignores tags created concurrently by
+        another writer. The post counts of the changed tags are updated, and tags
+        left without posts are deleted, all in the current transaction. If the tags of
+        an existing post change, its updated_at time is bumped.
+
+        :param iterable(str) names: The names of the post's tags.
+        :return: None
+        """
+        names = Tag.normalize_names(names)
+        db.session.add(self)
+        new = db.inspect(self).pending
+        if new:
+            # A new post has no tags yet; flushing it gives it an ID to attach them to
+            db.session.flush()
+            current = set()
         else:
-            if Tag.query.get(tag) is None:
-                t = Tag(name=tag)
-                self.tags.append(t)
-                db.session.add(t)
-            else:
-                self.tags.append(Tag.query.get(tag))
+            current = set(name for name, in db.session.query(post_tags.c.tag_id)
+                          .filter(post_tags.c.post_id == self.id))
+        added = [n for n in names if n not in current]
+        removed = list(current.difference(names))
+
+        if removed:
+            db.session.execute(post_tags.delete().where(post_tags.c.post_id == self.id)
+                               .where(post_tags.c.tag_id.in_(removed)))
+            Tag.adjust_counts(removed, -1)
+        if added:
+            Tag.create_missing(added)
+            db.session.execute(post_tags.insert(),
+                               [{'post_id': self.id, 'tag_id': n, 'post_time': self.time}
+                                for n in added])
+            Tag.adjust_counts(added, 1)
+        if added or removed:
+            # The tags collection no longer matches the table, so reload it when next used
+            db.session.expire(self, ['tags'])
+            Tag.delete_orphans(removed)
+            if not new:
+                self.updated_at = datetime.utcnow()
+        # Pages and feeds for all of the post's tags, old and new, show the post
+        mark_changed(db.session, post_ids=[self.id], tags=names + removed,
+                     authors=[self.author])
+
+    def remove(self):
+        """
+        Delete a post and any tags left without posts.
+
+        The post's tag names are read once, its post_tags rows are deleted with one
+        statement, the tags' post counts are decremented with another, and orphaned
+        tags are deleted with a single DELETE ... WHERE NOT EXISTS. Everything happens
+        in the current transaction; the caller commits.
+
+        :return: None
+        """
+        names = [name for name, in db.session.query(post_tags.c.tag_id)
+                 .filter(post_tags.c.post_id == self.id)]
+        db.session.execute(post_tags.delete().where(post_tags.c.post_id == self.id))
+        # The association rows are gone, so there is nothing for the ORM to load or delete
+        set_committed_value(self, 'tags', [])
+        Tag.adjust_counts(names, -1)
+        db.session.delete(self)
+        Tag.delete_orphans(names)
 
     def get_tags(self):
         """
@@ -120,8 +411,9 @@ class Post(db.Model):
         """
         return self.tags
 
-# Register on_changed_body as an event listener
+# Register on_changed_body and on_changed_body_format as event listeners
 db.event.listen(Post.body, 'set', Post.on_changed_body)
+db.event.listen(Post.body_format, 'set', Post.on_changed_body_format)
 
 class Tag(db.Model):
     """
@@ -136,15 +428,34 @@ class Tag(db.Model):
     ----------
     name : Column(String)
         The name of the tag and primary key of the Tag table, specified when creating a Tag.
+    post_count : Column(Integer)
+        The number of posts with the tag, kept up to date as posts are tagged and deleted.
 
     Methods
     -------
     ___repr___
         String representation of a Tag.
+    normalize_names(names)
+        Clean up a list of tag names.
+    parse_names(text)
+        Parse a comma-separated list of tag names.
+    create_missing(names)
+        Create several tags at once, skipping any that exist.
+    get_or_create(names)
+        Get several tags at once, creating any that are missing.
+    delete_orphans(names)
+        Delete tags that no longer have any posts.
     get_posts
         Get a list of posts associated with a tag.
+    get_post_keys
+        Get the IDs and times of the posts associated with a tag.
+    adjust_counts(names, delta)
+        Add to the post counts of several tags.
+    recount()
+        Recompute every tag's post count from the post_tags table.
     """
     name = db.Column(db.String(), primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
 
     def __repr__(self):
         """
@@ -153,6 +464,117 @@ class Tag(db.Model):
         """
         return '<Tag %s>' % self.name
 
+    @staticmethod
+    def normalize_names(names):
+        """
+        Clean up a list of tag names.
+
+        Surrounding whitespace is removed, runs of whitespace are collapsed to one
+        space, and empty and duplicate names are dropped. The order of the remaining
+        names is kept. If no names are left, the list is ["uncategorized"].
+
+        :param iterable(str) names: The tag names to clean up.
+        :return list(str): The normalized tag names.
+        """
+        normalized = []
+        for name in names:
+            name = ' '.join(name.split())
+            if name and name not in normalized:
+                normalized.append(name)
+        return normalized or ["uncategorized"]
+
+    @staticmethod
+    def parse_names(text):
+        """
+        Parse the comma-separated list of tags entered in the post editor.
+
+        :param str text: The tags, e.g. "python, flask".
+        :return list(str): The normalized tag names.
+        """
+        return Tag.normalize_names((text or '').split(','))
+
+    @staticmethod
+    def create_missing(names):
+        """
+        Create the tags with the given names that do not exist yet.
+
+        All names are inserted with a single INSERT that skips names that already
+        exist (ON CONFLICT DO NOTHING, or INSERT IGNORE on MySQL), so two writers
+        creating the same tag at once cannot fail with an IntegrityError. New tags
+        start with a post count of 0.
+
+        :param list(str) names: The names of the tags, already normalized.
+        :return: None
+        """
+        if not names:
+            return
+        table = Tag.__table__
+        missing = names
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table).on_conflict_do_nothing()
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table).on_conflict_do_nothing()
+        elif dialect == 'mysql':
+            stmt = table.insert().prefix_with('IGNORE')
+        else:
+            # No way to skip existing rows, so only insert the tags missing right now
+            existing = set(name for name, in db.session.query(Tag.name).filter(Tag.name.in_(names)))
+            missing = [n for n in names if n not in existing]
+            stmt = table.insert()
+        if missing:
+            db.session.execute(stmt, [{'name': n, 'post_count': 0} for n in missing])
+
+    @staticmethod
+    def get_or_create(names):
+        """
+        Get the tags with the given names, creating any that do not exist yet.
+
+        Missing tags are created with create_missing(), then all tags are loaded with
+        one IN query.
+
+        :param list(str) names: The names of the tags, already normalized.
+        :return list(Tag): The tags, in the same order as names.
+        """
+        if not names:
+            return []
+        Tag.create_missing(names)
+        tags = {t.name: t for t in Tag.query.filter(Tag.name.in_(names))}
+        return [tags[n] for n in names]
+
+    @staticmethod
+    def delete_orphans(names=None):
+        """
+        Delete tags that no longer have any posts.
+
+        Orphans are found by one SELECT ... WHERE NOT EXISTS against post_tags and
+        deleted by one DELETE, so tags are never loaded one by one. The names of the
+        deleted tags are recorded so caches listing them are invalidated on commit.
+        The caller commits.
+
+        :param iterable(str) names: If given, only consider the tags with these names.
+        :return int: The number of tags deleted.
+        """
+        orphaned = ~db.exists().where(post_tags.c.tag_id == Tag.name)
+        query = db.select(Tag.name).where(orphaned)
+        if names is not None:
+            names = list(names)
+            if not names:
+                return 0
+            query = query.where(Tag.name.in_(names))
+        names = db.session.execute(query).scalars().all()
+        if not names:
+            return 0
+        # The DELETE checks again, in case a tag gained a post in between.
+        # 'fetch' also removes the deleted tags from the session, if they are loaded
+        deleted = Tag.query.filter(Tag.name.in_(names), orphaned) \
+            .delete(synchronize_session='fetch')
+        if deleted:
+            mark_changed(db.session, tags=names)
+        return deleted
+
     def get_posts(self):
         """
         Retrieve posts with a given tag.
@@ -165,6 +587,59 @@ class Tag(db.Model):
         """
         return Post.query.join(post_tags, post_tags.c.post_id == Post.id).filter(post_tags.c.tag_id == self.name)
 
+    def get_post_keys(self):
+        """
+        Retrieve the sort keys of the posts with a given tag.
+
+        Only the post_tags table is queried, selecting each post's ID and time, so a
+        page of a tag's posts can be found from the ix_post_tags_tag_time index
+        without reading the posts table. Load the posts themselves with
+        Post.from_keys() once the page is known.
+
+        :return Query: A query for (id, time) rows of the tag's posts.
+        """
+        return db.session.query(post_tags.c.post_id.label('id'), post_tags.c.post_time.label('time')) \
+            .filter(post_tags.c.tag_id == self.name)
+
+    @staticmethod
+    def adjust_counts(names, delta):
+        """
+        Add to the post counts of several tags in a single UPDATE statement.
+
+        The count is incremented in SQL rather than in Python so that concurrent
+        writers cannot overwrite each other's changes.
+
+        :param iterable(str) names: The names of the tags to update.
+        :param int delta: The amount to add to each count; negative to subtract.
+        :return: None
+        """
+        names = list(names)
+        if not names:
+            return
+        Tag.query.filter(Tag.name.in_(names)).update(
+            {Tag.post_count: Tag.post_count + delta}, synchronize_session='fetch')
+        mark_changed(db.session, tags=names)
+
+    @staticmethod
+    def recount():
+        """
+        Recompute every tag's post count from the post_tags table.
+
+        Used to repair counts that have drifted, e.g. after rows were written to
+        post_tags outside of the application. The caller commits.
+
+        :return int: The number of tags whose count was wrong.
+        """
+        actual = db.select(db.func.count()).select_from(post_tags) \
+            .where(post_tags.c.tag_id == Tag.name).scalar_subquery()
+        stale = Tag.query.filter(Tag.post_count != actual)
+        names = [t.name for t in stale.with_entities(Tag.name)]
+        if names:
+            Tag.query.filter(Tag.name.in_(names)).update(
+                {Tag.post_count: actual}, synchronize_session='fetch')
+            mark_changed(db.session, tags=names)
+        return len(names)
+
 
 class User(UserMixin, db.Model):
     """
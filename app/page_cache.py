@@ -0,0 +1,336 @@
+"""
+A cache of whole pages for anonymous readers.
+
+Logged-out readers all see the same page for a URL, so when BLOG_PAGE_CACHE is on,
+the home page, post pages, tag pages and author pages rendered for them are stored
+and served again without running any queries or templates. A request is anonymous
+if its session has no logged-in user, it has no remember-me cookie and no flashed
+messages are waiting to be shown.
+
+Each worker keeps recently used pages in memory. If BLOG_PAGE_CACHE_DIR is set,
+pages are also written to that directory so every worker can serve them, and a
+page in memory is only served while its file still exists. Pages are grouped by
+what they depend on: the home page, one post, one tag or one author. When a commit
+changes posts or tags, only the groups showing them are purged, unless the sidebar
+(the recent posts and the tags with their post counts) changed too, in which case
+every page is.
+
+Classes
+-------
+PageCache
+    Whole pages rendered for anonymous readers.
+
+Methods
+-------
+sidebar_fingerprint()
+    Fingerprint the data shown in the sidebar.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from flask import current_app, request, session
+from . import db
+from .cache import LRUCache, content_changed
+from .models import Post, Tag
+
+# The pages that are cached, and the view argument naming the group each page belongs to
+CACHED_ENDPOINTS = {
+    'main.index': ('index', None),
+    'main.post': ('post', 'id'),
+    'main.tagged': ('tag', 'tag'),
+    'main.author': ('author', 'author'),
+}
+
+# Response headers stored along with a page's body
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+# The file touched whenever pages are purged, and the file holding the sidebar fingerprint
+PURGED_FILE = '.purged'
+SIDEBAR_FILE = '.sidebar'
+
+
+def _group_name(kind, value=None):
+    """
+    Get the name of a group of pages, e.g. 'index' or 'tag-<hash of the tag name>',
+    safe to use as a directory name.
+    """
+    if value is None:
+        return kind
+    return '%s-%s' % (kind, hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:20])
+
+
+def sidebar_fingerprint():
+    """
+    Fingerprint the data shown in the sidebar.
+
+    The sidebar is on every page, so if it changes every page is stale. It is
+    fingerprinted from the five newest posts and all tags with their post counts,
+    read on a connection of its own so that it can be called after a commit, when
+    the session cannot be used.
+
+    :return str: The fingerprint.
+    """
+    with db.engine.connect() as connection:
+        recent = connection.execute(
+            db.select(Post.id, Post.title).order_by(Post.time.desc(), Post.id.desc())
+            .limit(5)).all()
+        tags = connection.execute(
+            db.select(Tag.name, Tag.post_count).order_by(Tag.name)).all()
+    data = repr(([tuple(row) for row in recent], [tuple(row) for row in tags]))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    Whole pages rendered for anonymous readers.
+
+    Methods
+    -------
+    init_app(app)
+        Create the application's page cache and register its request hooks.
+    purge(app, groups)
+        Drop the cached pages in some groups.
+    clear(app)
+        Drop every cached page.
+    """
+
+    def init_app(self, app):
+        """
+        Create the application's page cache and register its request hooks.
+
+        The hooks do nothing unless BLOG_PAGE_CACHE is on.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        app.extensions['page_cache'] = self
+        app.extensions['page_cache_memory'] = LRUCache(maxsize=app.config['BLOG_PAGE_CACHE_SIZE'],
+                                                       ttl=app.config['BLOG_PAGE_CACHE_TTL'])
+        app.extensions['page_cache_state'] = {'purged_at': 0.0, 'sidebar': None}
+        app.before_request(self._serve)
+        app.after_request(self._store)
+
+    @staticmethod
+    def _directory(app):
+        return app.config['BLOG_PAGE_CACHE_DIR']
+
+    @staticmethod
+    def _page():
+        """
+        Identify the requested page, if it may be cached.
+
+        :return tuple(str, str): The page's group and key, or None if the page must be rendered.
+        """
+        if not current_app.config['BLOG_PAGE_CACHE'] or request.method != 'GET':
+            return None
+        if request.endpoint not in CACHED_ENDPOINTS:
+            return None
+        if '_user_id' in session or '_flashes' in session:
+            return None
+        if current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token') in request.cookies:
+            return None
+        kind, arg = CACHED_ENDPOINTS[request.endpoint]
+        group = _group_name(kind, None if arg is None else request.view_args[arg])
+        page = repr((request.host, request.path, sorted(request.args.items(multi=True))))
+        return group, hashlib.sha1(page.encode('utf-8')).hexdigest()
+
+    def _serve(self):
+        """
+        Serve the requested page from the cache, if it is there.
+        """
+        page = self._page()
+        if page is None:
+            return None
+        request.environ['blog.page_cache'] = (page, time.time())
+        entry = self._load(current_app, *page)
+        if entry is None:
+            return None
+        headers, body = entry
+        response = current_app.response_class(body, headers=headers)
+        response.headers['X-Page-Cache'] = 'hit'
+        if response.headers.get('ETag'):
+            # A client with the current page gets a 304, as it would from the view
+            etag, weak = response.get_etag()
+            if request.if_none_match.contains_weak(etag):
+                response.status_code = 304
+                response.set_data(b'')
+        return response
+
+    def _store(self, response):
+        """
+        Store a freshly rendered page for anonymous readers.
+
+        Pages rendered while a purge was happening may already be stale, so they are
+        not stored.
+        """
+        cached = request.environ.get('blog.page_cache')
+        if cached is None or response.headers.get('X-Page-Cache') == 'hit':
+            return response
+        (group, key), started = cached
+        if response.status_code != 200 or response.direct_passthrough or session.modified:
+            return response
+        if started <= self._purged_at(current_app):
+            return response
+        if self._stored_sidebar(current_app) is None:
+            self._record_sidebar(current_app, sidebar_fingerprint())
+        headers = [(name, response.headers[name]) for name in STORED_HEADERS
+                   if name in response.headers]
+        self._save(current_app, group, key, headers, response.get_data())
+        response.headers['X-Page-Cache'] = 'miss'
+        return response
+
+    def _load(self, app, group, key):
+        """
+        Look up a page, first in memory and then in the shared directory.
+
+        :return tuple(list, bytes): The page's headers and body, or None.
+        """
+        memory = app.extensions['page_cache_memory']
+        directory = self._directory(app)
+        entry = memory.get((group, key))
+        if directory is None:
+            return entry and entry[:2]
+        path = os.path.join(directory, group, key)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            if entry is not None:
+                memory.delete((group, key))
+            return None
+        if time.time() - mtime > app.config['BLOG_PAGE_CACHE_TTL']:
+            return None
+        if entry is not None and entry[2] == mtime:
+            return entry[:2]
+        try:
+            with open(path, 'rb') as f:
+                headers = json.loads(f.readline().decode('utf-8'))
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        memory.set((group, key), (headers, body, mtime))
+        return headers, body
+
+    def _save(self, app, group, key, headers, body):
+        """
+        Store a page in memory and, if there is one, in the shared directory.
+        """
+        memory = app.extensions['page_cache_memory']
+        directory = self._directory(app)
+        mtime = None
+        if directory is not None:
+            group_dir = os.path.join(directory, group)
+            os.makedirs(group_dir, exist_ok=True)
+            # Write to a temporary file and rename it, so readers never see half a page
+            fd, tmp = tempfile.mkstemp(dir=group_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(headers).encode('utf-8') + b'\n')
+                f.write(body)
+            path = os.path.join(group_dir, key)
+            os.replace(tmp, path)
+            mtime = os.stat(path).st_mtime
+        memory.set((group, key), (headers, body, mtime))
+
+    def _purged_at(self, app):
+        """
+        Get the time pages were last purged by any worker.
+        """
+        purged_at = app.extensions['page_cache_state']['purged_at']
+        directory = self._directory(app)
+        if directory is not None:
+            try:
+                purged_at = max(purged_at, os.stat(os.path.join(directory, PURGED_FILE)).st_mtime)
+            except OSError:
+                pass
+        return purged_at
+
+    def _mark_purged(self, app):
+        app.extensions['page_cache_state']['purged_at'] = time.time()
+        directory = self._directory(app)
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, PURGED_FILE), 'a'):
+                os.utime(os.path.join(directory, PURGED_FILE))
+
+    def purge(self, app, groups):
+        """
+        Drop the cached pages in some groups.
+
+        :param Flask app: The application instance.
+        :param iterable(str) groups: The names of the groups.
+        :return: None
+        """
+        groups = set(groups)
+        self._mark_purged(app)
+        memory = app.extensions['page_cache_memory']
+        for key in memory.keys():
+            if key[0] in groups:
+                memory.delete(key)
+        directory = self._directory(app)
+        if directory is not None:
+            for group in groups:
+                shutil.rmtree(os.path.join(directory, group), ignore_errors=True)
+
+    def clear(self, app):
+        """
+        Drop every cached page.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        self._mark_purged(app)
+        app.extensions['page_cache_memory'].clear()
+        directory = self._directory(app)
+        if directory is not None and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def _stored_sidebar(self, app):
+        """
+        Get the fingerprint of the sidebar shown on the cached pages, shared through
+        the cache directory if there is one.
+        """
+        directory = self._directory(app)
+        if directory is None:
+            return app.extensions['page_cache_state']['sidebar']
+        try:
+            with open(os.path.join(directory, SIDEBAR_FILE)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _record_sidebar(self, app, fingerprint):
+        app.extensions['page_cache_state']['sidebar'] = fingerprint
+        directory = self._directory(app)
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, SIDEBAR_FILE), 'w') as f:
+                f.write(fingerprint)
+
+
+@content_changed.connect
+def _invalidate_pages(app, changes):
+    """
+    Purge the cached pages showing changed posts and tags.
+
+    Any post change may reorder the home page, so it is always purged, along with the
+    pages of the changed posts and of their tags and authors.
+    """
+    cache = app.extensions.get('page_cache')
+    if cache is None or not app.config['BLOG_PAGE_CACHE']:
+        return
+    fingerprint = sidebar_fingerprint()
+    if fingerprint != cache._stored_sidebar(app):
+        cache._record_sidebar(app, fingerprint)
+        cache.clear(app)
+        return
+    groups = [_group_name('index')]
+    groups += [_group_name('post', id) for id in changes.post_ids]
+    groups += [_group_name('tag', name) for name in changes.tags]
+    groups += [_group_name('author', name) for name in changes.authors]
+    cache.purge(app, groups)
@@ -0,0 +1,263 @@
+"""
+Keyset (cursor) pagination for post listings.
+
+Offset pagination has to skip over every row before the requested page and count
+every matching row to draw the pagination widget, so deep pages get slower as the
+blog grows. Keyset pagination instead remembers the sort key of the last post shown
+and asks the database for the posts that sort after it, which costs the same no
+matter how deep the page is.
+
+Listings are ordered newest first on (time, id). The id breaks ties between posts
+created at the same moment so that no post is skipped or repeated between pages.
+
+Classes
+-------
+KeysetPagination
+    A single page of results and the cursors needed to reach its neighbours.
+ListingTotals
+    Recent counts of the listings' posts.
+
+Methods
+-------
+encode_token(*values)
+    Encode a sort key of any shape as an opaque URL-safe token.
+decode_token(token, *types)
+    Decode a token created by encode_token.
+encode_cursor(time, id)
+    Encode a sort key as an opaque URL-safe token.
+decode_cursor(token)
+    Decode a token created by encode_cursor.
+paginate(query, per_page, after, before, time_column, id_column, total_key)
+    Fetch one page of a query using keyset pagination.
+"""
+
+import base64
+from datetime import datetime
+from flask import abort, current_app
+from sqlalchemy import and_, or_
+from .cache import LRUCache, content_changed
+
+
+def encode_token(*values):
+    """
+    Encode a sort key of any shape as an opaque, URL-safe token.
+
+    :param values: The parts of the sort key, converted to strings.
+    :return str: The encoded token.
+    """
+
+    raw = '|'.join(str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token, *types):
+    """
+    Decode a token created by encode_token back into a sort key.
+
+    Tokens come straight from the query string, so a malformed token is treated as
+    a bad request rather than an internal error.
+
+    :param str token: The encoded token.
+    :param types: A function converting each part of the key back from a string.
+    :raises HTTPException: 400 if the token cannot be decoded.
+    :return tuple: The parts of the sort key.
+    """
+
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        if len(parts) != len(types):
+            raise ValueError(token)
+        return tuple(convert(part) for convert, part in zip(types, parts))
+    except (ValueError, UnicodeError):
+        abort(400)
+
+
+def encode_cursor(time, id):
+    """
+    Encode a post's sort key as an opaque, URL-safe token.
+
+    :param DateTime time: The post's time of creation.
+    :param int id: The post's ID.
+    :return str: The encoded cursor.
+    """
+
+    return encode_token(time.isoformat(), id)
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor created by encode_cursor back into a sort key.
+
+    :param str token: The encoded cursor.
+    :raises HTTPException: 400 if the token cannot be decoded.
+    :return tuple(DateTime, int): The time and ID encoded in the cursor.
+    """
+
+    return decode_token(token, datetime.fromisoformat, int)
+
+
+class KeysetPagination:
+    """
+    A single page of a keyset-paginated listing.
+
+    Mirrors the parts of flask-sqlalchemy's Pagination object that templates use,
+    but exposes cursors instead of page numbers.
+
+    Attributes
+    ----------
+    items : list
+        The posts on this page, newest first.
+    per_page : int
+        The maximum number of posts on a page.
+    has_next : bool
+        True if there are older posts after this page.
+    has_prev : bool
+        True if there are newer posts before this page.
+    total : int
+        The approximate number of posts in the listing, or None if totals are disabled.
+    key : func
+        Returns the sort key of an item as a tuple to encode in cursors. By default,
+        the item's time and ID.
+
+    Properties
+    ----------
+    next_cursor
+        The cursor for the page of older posts.
+    prev_cursor
+        The cursor for the page of newer posts.
+    """
+
+    def __init__(self, items, per_page, has_next, has_prev, total=None, key=None):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self.key = key or (lambda item: (item.time.isoformat(), item.id))
+
+    @property
+    def next_cursor(self):
+        """
+        The cursor for the page of older posts, used as the ?after= argument.
+        """
+        if not self.has_next or not self.items:
+            return None
+        return encode_token(*self.key(self.items[-1]))
+
+    @property
+    def prev_cursor(self):
+        """
+        The cursor for the page of newer posts, used as the ?before= argument.
+        """
+        if not self.has_prev or not self.items:
+            return None
+        return encode_token(*self.key(self.items[0]))
+
+
+def _approximate_total(query, key):
+    """
+    Count the rows of a listing, reusing a recent count if there is one.
+
+    A full COUNT(*) is the other half of what makes offset pagination expensive,
+    so counts are cached per listing for BLOG_TOTALS_TTL seconds, or until posts or
+    tags change in this process. The result is only used for display and may briefly
+    lag behind posts written by other processes.
+
+    :param BaseQuery query: The unpaginated listing query.
+    :param tuple key: A hashable key identifying the listing.
+    :return int: The (possibly slightly stale) number of rows in the listing.
+    """
+
+    totals = current_app.extensions['totals_cache']
+    total = totals.get(key)
+    if total is None:
+        total = query.order_by(None).count()
+        totals.set(key, total)
+    return total
+
+
+class ListingTotals:
+    """
+    Recent counts of the listings' posts.
+
+    Each application gets its own cache of up to BLOG_TOTALS_CACHE_SIZE counts, kept
+    for at most BLOG_TOTALS_TTL seconds. Listings are keyed by values taken from the
+    URL, such as an author's name, so the cache is bounded like the others.
+
+    Methods
+    -------
+    init_app(app)
+        Create the application's cache of listing totals.
+    """
+
+    def init_app(self, app):
+        """
+        Create the application's cache of listing totals.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        app.extensions['totals_cache'] = LRUCache(maxsize=app.config['BLOG_TOTALS_CACHE_SIZE'],
+                                                  ttl=app.config['BLOG_TOTALS_TTL'])
+
+
+@content_changed.connect
+def _invalidate_totals(app, changes):
+    """
+    Forget cached listing totals once posts or tags change.
+    """
+    totals = app.extensions.get('totals_cache')
+    if totals is not None:
+        totals.clear()
+
+
+def paginate(query, per_page, after=None, before=None, time_column=None,
+             id_column=None, total_key=None):
+    """
+    Fetch one page of a listing using keyset pagination.
+
+    With no cursor, the newest per_page rows are returned. With an after cursor,
+    the rows that sort immediately after it (older posts) are returned; with a before
+    cursor, the rows immediately before it (newer posts). One extra row is fetched
+    to find out whether another page exists in the direction of travel, so no count
+    is needed.
+
+    :param BaseQuery query: The unordered, unpaginated listing query.
+    :param int per_page: The number of posts per page.
+    :param str after: A cursor; return the page of posts older than it.
+    :param str before: A cursor; return the page of posts newer than it.
+    :param Column time_column: The column holding each row's time. Post.time by default.
+    :param Column id_column: The column holding each row's ID. Post.id by default.
+    :param tuple total_key: If given and BLOG_APPROXIMATE_TOTALS is set, a key under
+                            which to cache the listing's total.
+    :return KeysetPagination: The requested page.
+    """
+
+    if time_column is None or id_column is None:
+        from .models import Post
+        time_column = Post.time if time_column is None else time_column
+        id_column = Post.id if id_column is None else id_column
+
+    total = None
+    if total_key is not None and current_app.config['BLOG_APPROXIMATE_TOTALS']:
+        total = _approximate_total(query, total_key)
+
+    if before is not None:
+        time, id = decode_cursor(before)
+        rows = query.filter(or_(time_column > time,
+                                and_(time_column == time, id_column > id))) \
+            .order_by(time_column.asc(), id_column.asc()) \
+            .limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        return KeysetPagination(items, per_page, has_next=True, has_prev=has_prev, total=total)
+
+    if after is not None:
+        time, id = decode_cursor(after)
+        query = query.filter(or_(time_column < time,
+                                 and_(time_column == time, id_column < id)))
+    rows = query.order_by(time_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    return KeysetPagination(rows[:per_page], per_page, has_next=has_next,
+                            has_prev=after is not None, total=total)
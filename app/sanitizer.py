@@ -0,0 +1,214 @@
+"""
+Sanitization of post bodies.
+
+Post bodies are HTML written in CKEditor, and only the tags its formatting options
+produce are kept. Markdown bodies are sanitized with a policy of their own, which
+keeps everything Markdown produces: headings, code, line breaks, rules, table
+headers and images. Building a bleach Cleaner compiles the policy and sets up an
+HTML parser, so each thread builds one Cleaner and reuses it; Cleaners are not
+safe to share between threads.
+
+Sanitizing takes time proportional to the body's size, so bodies larger than
+BLOG_SANITIZE_POOL_THRESHOLD characters are sanitized by a pool of
+BLOG_SANITIZE_WORKERS worker processes instead, and given up on after
+BLOG_SANITIZE_TIMEOUT seconds. The workers are started together on first use and
+kept running, so saving a large body does not pay for starting an interpreter.
+Each worker sanitizes one body at a time, so one huge or pathological body fails
+with SanitizeTimeout instead of stalling the request worker that saves it, and
+only its own worker is killed and replaced; anyone else's save is unaffected.
+
+Classes
+-------
+SanitizeTimeout
+    Raised when a body takes too long to sanitize.
+Sanitizer
+    A reusable sanitizer for one policy.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+from bleach.sanitizer import ALLOWED_ATTRIBUTES, Cleaner
+
+# The HTML tags kept in post bodies: the tags used by CKEditor's formatting options
+ALLOWED_TAGS = frozenset(['a', 'em', 'strong', 'h1', 'h2', 'h3', 'pre',
+                          'table', 'tbody', 'tr', 'td', 'img', 'anchor',
+                          'li', 'ol', 'ul', 'p', 'blockquote', 's',
+                          'cite', 'span', 'div', 'big', 'samp', 'kbd',
+                          'q', 'ins', 'del', 'tt', 'small', 'var'])
+
+# The HTML tags kept in Markdown bodies: the above and the tags Markdown produces
+MARKDOWN_TAGS = ALLOWED_TAGS | frozenset(['h4', 'h5', 'h6', 'code', 'br', 'hr',
+                                          'thead', 'th'])
+
+# The attributes kept in Markdown bodies, by tag
+MARKDOWN_ATTRIBUTES = {'a': ['href', 'title'], 'img': ['src', 'alt', 'title']}
+
+
+class SanitizeTimeout(Exception):
+    """
+    Raised when a body takes too long to sanitize.
+    """
+
+
+class Sanitizer:
+    """
+    A reusable sanitizer for one policy.
+
+    Methods
+    -------
+    clean(html)
+        Sanitize HTML in the current thread.
+    clean_isolated(html, timeout, workers)
+        Sanitize HTML in a worker process, giving up after a timeout.
+    shutdown()
+        Stop the worker processes, if any are running.
+    """
+
+    def __init__(self, tags, attributes=None, strip=True):
+        self.tags = frozenset(tags)
+        # Kept as a tuple of (tag, attributes) pairs, so it can be sent to other processes
+        self.attributes = tuple(sorted((tag, tuple(names)) for tag, names in
+                                       (attributes or ALLOWED_ATTRIBUTES).items()))
+        self.strip = strip
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # The worker pool: the idle workers, every running worker, and the process
+        # that started them
+        self._idle = None
+        self._workers = set()
+        self._owner = None
+
+    def clean(self, html):
+        """
+        Sanitize HTML in the current thread, with the thread's own Cleaner.
+
+        :param str html: The HTML to sanitize.
+        :return str: The sanitized HTML.
+        """
+        cleaner = getattr(self._local, 'cleaner', None)
+        if cleaner is None:
+            cleaner = self._local.cleaner = Cleaner(tags=self.tags, strip=self.strip,
+                                                    attributes={tag: list(names) for tag, names
+                                                                in self.attributes})
+        return cleaner.clean(html)
+
+    def clean_isolated(self, html, timeout, workers=2):
+        """
+        Sanitize HTML in a worker process, giving up after a timeout.
+
+        The pool of worker processes is started on first use. A body waits for an
+        idle worker before its timeout starts. A worker that runs out of time is
+        killed and replaced, so a runaway body never disturbs the others being
+        sanitized.
+
+        :param str html: The HTML to sanitize.
+        :param float timeout: The number of seconds to wait for the result.
+        :param int workers: The number of worker processes.
+        :raises SanitizeTimeout: If the body was not sanitized in time.
+        :return str: The sanitized HTML.
+        """
+        idle = self._pool(workers)
+        worker = idle.get()
+        process, connection = worker
+        try:
+            connection.send(html)
+            if not connection.poll(timeout):
+                self._replace(worker, idle)
+                worker = None
+                raise SanitizeTimeout('Sanitizing a body of %d characters took longer than '
+                                      '%s seconds.' % (len(html), timeout))
+            ok, result = connection.recv()
+        except (EOFError, OSError):
+            self._replace(worker, idle)
+            worker = None
+            raise RuntimeError('The process sanitizing a body exited without a result.')
+        finally:
+            if worker is not None:
+                idle.put(worker)
+        if not ok:
+            raise result
+        return result
+
+    def _pool(self, workers):
+        """
+        Get the queue of idle workers, starting the pool if this process has none.
+        """
+        with self._lock:
+            # A forked child must not share its parent's workers
+            if self._idle is None or self._owner != os.getpid():
+                self._idle = queue.Queue()
+                self._workers = set()
+                self._owner = os.getpid()
+                for _ in range(workers):
+                    self._idle.put(self._start_worker())
+            return self._idle
+
+    def _start_worker(self):
+        """
+        Start a worker process. Called with the lock held.
+        """
+        # Processes are spawned, since forking a threaded server is unsafe
+        context = multiprocessing.get_context('spawn')
+        connection, child = context.Pipe()
+        process = context.Process(target=_serve, daemon=True,
+                                  args=(child, self.tags, self.attributes, self.strip))
+        process.start()
+        child.close()
+        worker = (process, connection)
+        self._workers.add(worker)
+        return worker
+
+    def _replace(self, worker, idle):
+        """
+        Kill a worker and put a new one in its place.
+        """
+        process, connection = worker
+        process.kill()
+        process.join()
+        connection.close()
+        with self._lock:
+            self._workers.discard(worker)
+            if idle is self._idle:
+                idle.put(self._start_worker())
+
+    def shutdown(self):
+        """
+        Stop the worker processes, if any are running. A later call starts a new pool.
+
+        :return: None
+        """
+        with self._lock:
+            workers = list(self._workers)
+            self._idle = None
+            self._workers = set()
+        for process, connection in workers:
+            if process.is_alive():
+                process.kill()
+            process.join()
+            connection.close()
+
+
+def _serve(connection, tags, attributes, strip):
+    """
+    Sanitize the bodies sent by the parent process until it closes the connection.
+    """
+    sanitizer = Sanitizer(tags, dict(attributes), strip)
+    while True:
+        try:
+            html = connection.recv()
+        except EOFError:
+            break
+        try:
+            result = True, sanitizer.clean(html)
+        except Exception as e:
+            result = False, e
+        connection.send(result)
+
+
+# The sanitizer for HTML post bodies
+post_sanitizer = Sanitizer(ALLOWED_TAGS)
+
+# The sanitizer for Markdown post bodies, once converted to HTML
+markdown_sanitizer = Sanitizer(MARKDOWN_TAGS, MARKDOWN_ATTRIBUTES)
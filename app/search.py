@@ -0,0 +1,228 @@
+"""
+Full-text search over posts.
+
+On SQLite, posts are indexed in an FTS5 virtual table, posts_fts, whose rowid is the
+post's ID and whose columns hold the post's title and the text of its sanitized body.
+The table is created and dropped along with the posts table and kept in sync by
+mapper events whenever a post is inserted, updated or deleted. Writes that bypass
+the ORM call index_posts() themselves. Results are ranked with BM25, weighting the
+title above the body, and paginated with cursors on (score, id).
+
+Other databases have no FTS5, so search falls back to matching post titles.
+
+Classes
+-------
+SearchResult
+    A post matching a search, with a highlighted snippet of its body.
+
+Methods
+-------
+index_posts(connection, posts)
+    Add or replace posts in the search index.
+rebuild_index(batch_size)
+    Rebuild the search index from the posts table.
+find_posts(q, per_page, after, before)
+    Search posts and return one page of results.
+"""
+
+from collections import namedtuple
+from markupsafe import Markup, escape
+from sqlalchemy import event, inspect, text
+from . import db
+from .models import Post
+from .pagination import KeysetPagination, decode_token, paginate
+from .text import html_to_text
+
+FTS_TABLE = 'posts_fts'
+
+# BM25 weights for the title and body columns
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+# Markers placed around matches by snippet(); replaced with <mark> after escaping
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+
+
+def _is_sqlite(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+@event.listens_for(Post.__table__, 'after_create')
+def _create_index(target, connection, **kw):
+    """
+    Create the search index whenever the posts table is created.
+    """
+    if _is_sqlite(connection):
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(title, body, "
+            "tokenize='porter unicode61')" % FTS_TABLE)
+
+
+@event.listens_for(Post.__table__, 'before_drop')
+def _drop_index(target, connection, **kw):
+    """
+    Drop the search index whenever the posts table is dropped.
+    """
+    if _is_sqlite(connection):
+        connection.exec_driver_sql('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+
+
+def index_posts(connection, posts):
+    """
+    Add or replace posts in the search index.
+
+    :param Connection connection: The connection to write the index with.
+    :param iterable(tuple) posts: (id, title, body_html) for each post.
+    :return: None
+    """
+    if not _is_sqlite(connection):
+        return
+    rows = [{'id': id, 'title': title or '', 'body': html_to_text(body_html)}
+            for id, title, body_html in posts]
+    if not rows:
+        return
+    connection.execute(text('DELETE FROM %s WHERE rowid = :id' % FTS_TABLE), rows)
+    connection.execute(text('INSERT INTO %s (rowid, title, body) VALUES (:id, :title, :body)'
+                            % FTS_TABLE), rows)
+
+
+@event.listens_for(Post, 'after_insert')
+def _index_new_post(mapper, connection, target):
+    index_posts(connection, [(target.id, target.title, target.body_html)])
+
+
+@event.listens_for(Post, 'after_update')
+def _reindex_post(mapper, connection, target):
+    """
+    Update a post's index entry if its title or body changed.
+
+    Only loaded attributes are inspected, so a post whose deferred body was never
+    loaded only has its title updated.
+    """
+    if not _is_sqlite(connection):
+        return
+    state = inspect(target)
+    if state.attrs.body_html.history.has_changes():
+        index_posts(connection, [(target.id, target.title, target.body_html)])
+    elif state.attrs.title.history.has_changes():
+        connection.execute(text('UPDATE %s SET title = :title WHERE rowid = :id' % FTS_TABLE),
+                           {'id': target.id, 'title': target.title or ''})
+
+
+@event.listens_for(Post, 'after_delete')
+def _unindex_post(mapper, connection, target):
+    if _is_sqlite(connection):
+        connection.execute(text('DELETE FROM %s WHERE rowid = :id' % FTS_TABLE),
+                           {'id': target.id})
+
+
+def rebuild_index(batch_size=500):
+    """
+    Rebuild the search index from the posts table.
+
+    Needed once for posts written before the index existed. Posts are read and
+    indexed in batches of batch_size, walking the posts table in ID order. The
+    caller commits.
+
+    :param int batch_size: The number of posts to index at a time.
+    :return int: The number of posts indexed.
+    """
+    connection = db.session.connection()
+    if not _is_sqlite(connection):
+        return 0
+    _create_index(None, connection)
+    connection.exec_driver_sql('DELETE FROM %s' % FTS_TABLE)
+    last_id = 0
+    indexed = 0
+    while True:
+        rows = db.session.query(Post.id, Post.title, Post.body_html) \
+            .filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+        if not rows:
+            return indexed
+        index_posts(connection, rows)
+        last_id = rows[-1].id
+        indexed += len(rows)
+
+
+# A post matching a search; score is None for title matches on databases without FTS5
+SearchResult = namedtuple('SearchResult', ['post', 'snippet', 'score'])
+
+
+def _match_expression(q):
+    """
+    Turn a search string into an FTS5 MATCH expression.
+
+    Each word is quoted, so the operators and punctuation of the FTS5 query syntax
+    are searched for literally, and all words must match.
+
+    :param str q: The search string.
+    :return str: The MATCH expression.
+    """
+    return ' '.join('"%s"' % word.replace('"', '""') for word in q.split())
+
+
+def _highlight(snippet):
+    """
+    Escape a snippet and wrap the matched words in <mark> elements.
+
+    snippet() gives NULL when the body has nothing to show, e.g. an empty body, and
+    the snippet is then empty so that the page shows the post's preview instead.
+    """
+    if snippet is None:
+        return Markup()
+    return Markup(str(escape(snippet)).replace(_MATCH_START, '<mark>')
+                  .replace(_MATCH_END, '</mark>'))
+
+
+def find_posts(q, per_page, after=None, before=None):
+    """
+    Search posts and return one page of results.
+
+    On SQLite, the search index is queried with the words in q and results are
+    ranked with BM25. Each result has a snippet of the post's body with the matching
+    words highlighted. Elsewhere, posts whose titles contain q are returned newest
+    first.
+
+    :param str q: The search string.
+    :param int per_page: The number of results per page.
+    :param str after: A cursor; return the page of results after it.
+    :param str before: A cursor; return the page of results before it.
+    :return KeysetPagination: The requested page of SearchResults.
+    """
+    if not _is_sqlite(db.session.connection()):
+        matches = Post.listing().filter(db.func.lower(Post.title).contains(q.lower(), autoescape=True))
+        page = paginate(matches, per_page, after=after, before=before)
+        page.items = [SearchResult(post, None, None) for post in page.items]
+        page.key = lambda result: (result.post.time.isoformat(), result.post.id)
+        return page
+
+    # Auxiliary functions are only allowed in the result set, so filter on them outside
+    ranked = ('SELECT rowid AS id, bm25({fts}, {title}, {body}) AS score, '
+              "snippet({fts}, 1, char(2), char(3), '...', 32) AS snippet "
+              'FROM {fts} WHERE {fts} MATCH :match').format(
+        fts=FTS_TABLE, title=TITLE_WEIGHT, body=BODY_WEIGHT)
+    params = {'match': _match_expression(q), 'limit': per_page + 1}
+    if before is not None:
+        params['score'], params['id'] = decode_token(before, float, int)
+        sql = ('SELECT * FROM (%s) WHERE score < :score OR (score = :score AND id < :id) '
+               'ORDER BY score DESC, id DESC LIMIT :limit' % ranked)
+    elif after is not None:
+        params['score'], params['id'] = decode_token(after, float, int)
+        sql = ('SELECT * FROM (%s) WHERE score > :score OR (score = :score AND id > :id) '
+               'ORDER BY score, id LIMIT :limit' % ranked)
+    else:
+        sql = 'SELECT * FROM (%s) ORDER BY score, id LIMIT :limit' % ranked
+    rows = db.session.execute(text(sql), params).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+    posts = {post.id: post for post in Post.from_keys(rows)}
+    items = [SearchResult(posts[row.id], _highlight(row.snippet), row.score)
+             for row in rows if row.id in posts]
+    key = lambda result: (repr(result.score), result.post.id)
+    if before is not None:
+        return KeysetPagination(items, per_page, has_next=True, has_prev=more, key=key)
+    return KeysetPagination(items, per_page, has_next=more, has_prev=after is not None, key=key)
@@ -0,0 +1,268 @@
+"""
+A log of slow SQL statements, with their query plans.
+
+When BLOG_SLOW_QUERY_LOG names a file, every statement taking at least
+BLOG_SLOW_QUERY_THRESHOLD seconds is written to it as one JSON line holding the
+statement, its parameters, the time it took, the endpoint and URL of the request
+that ran it, the line of the application's code that ran it (e.g. a view or the
+sidebar functions of inject_globals()) and, for SELECT statements, the plan the
+database chose for it. On SQLite that is the output of EXPLAIN QUERY PLAN, which
+shows full table scans such as 'SCAN posts' where an index is missing. The log is
+rotated by size.
+
+summarize() groups the logged statements by fingerprint - the statement with its
+literals and the lengths of its IN lists removed - so the worst offenders stand
+out. Run it with `flask slow-queries`.
+
+Classes
+-------
+SlowQueryLog
+    The application's slow-query log.
+QuerySummary
+    The logged runs of one statement fingerprint.
+
+Methods
+-------
+fingerprint(statement)
+    Normalize a statement so runs with different literals group together.
+read_log(path)
+    Read the entries of a slow-query log and its rotated files.
+summarize(entries, limit)
+    Group slow queries by fingerprint, worst first.
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from collections import namedtuple
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import current_app, has_request_context, request
+from .instrumentation import on_query
+
+# The logged runs of one statement fingerprint: number of runs, total and longest time in
+# milliseconds, the statement and plan of the longest run, and the endpoints that ran it
+QuerySummary = namedtuple('QuerySummary', ['fingerprint', 'count', 'total_ms', 'max_ms',
+                                           'statement', 'plan', 'endpoints'])
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The loggers writing to each log file, by absolute path, shared by the applications
+# logging to the same file so each file is opened once
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+# The files of the statement timing itself, never reported as a statement's caller
+_TIMING_FILES = (__file__, on_query.__code__.co_filename)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """
+    Normalize a statement so runs with different literals group together.
+
+    String and number literals become ?, IN lists of any length become (?...), and
+    whitespace is collapsed.
+
+    :param str statement: The SQL statement.
+    :return str: The statement's fingerprint.
+    """
+    normalized = _STRING.sub('?', statement)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _PLACEHOLDER_LIST.sub('(?...)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+
+def _caller():
+    """
+    Find the line of the application's code that ran the current statement.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename not in _TIMING_FILES:
+            return '%s:%d (%s)' % (os.path.relpath(filename, os.path.dirname(_APP_DIR)),
+                                   frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+def _explain(conn, statement, parameters):
+    """
+    Get the plan of a SELECT statement.
+
+    The plan is read with a cursor of its own straight from the DB-API connection, so
+    no events are fired and the statement's own results are left alone.
+
+    :return list(str): The lines of the plan, or None if it could not be read.
+    """
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    try:
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as e:
+        return ['EXPLAIN failed: %s' % e]
+    # SQLite's plan rows are (id, parent, notused, detail); other databases return text rows
+    return [str(row[-1]) for row in rows]
+
+
+def _jsonable(parameters):
+    if isinstance(parameters, dict):
+        return {key: _jsonable(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_jsonable(value) for value in parameters]
+    if parameters is None or isinstance(parameters, (bool, int, float)):
+        return parameters
+    text = str(parameters)
+    return text if len(text) <= 200 else text[:200] + '...'
+
+
+class SlowQueryLog:
+    """
+    The application's slow-query log.
+
+    Methods
+    -------
+    init_app(app)
+        Open the application's log and listen to every statement.
+    record(conn, statement, parameters, executemany, elapsed)
+        Write a slow statement to the current application's log.
+    """
+
+    def init_app(self, app):
+        """
+        Open the application's log and listen to every statement.
+
+        Nothing is logged unless BLOG_SLOW_QUERY_LOG is set. The log's logger is kept
+        in the application's extensions, so each application writes to its own file.
+        Applications logging to the same file share its logger and open file, which
+        is closed when the interpreter exits.
+
+        :param Flask app: The application instance.
+        :return: None
+        """
+        path = app.config['BLOG_SLOW_QUERY_LOG']
+        if not path:
+            return
+        path = os.path.abspath(path)
+        with _loggers_lock:
+            logger = _loggers.get(path)
+            if logger is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # A logger of its own, so slow queries never reach the application's
+                # log handlers
+                logger = logging.Logger('app.slow_queries', logging.INFO)
+                logger.addHandler(RotatingFileHandler(
+                    path, maxBytes=app.config['BLOG_SLOW_QUERY_LOG_SIZE'],
+                    backupCount=app.config['BLOG_SLOW_QUERY_LOG_BACKUPS'], encoding='utf-8'))
+                _loggers[path] = logger
+        app.extensions['slow_query_log'] = logger
+        on_query(self._record_query)
+
+    def _record_query(self, conn, statement, parameters, executemany, elapsed):
+        if 'slow_query_log' in current_app.extensions \
+                and elapsed >= current_app.config['BLOG_SLOW_QUERY_THRESHOLD']:
+            self.record(conn, statement, parameters, executemany, elapsed)
+
+    def record(self, conn, statement, parameters, executemany, elapsed):
+        """
+        Write a slow statement to the current application's log.
+
+        :param Connection conn: The connection the statement ran on.
+        :param str statement: The statement.
+        :param parameters: The statement's DB-API parameters.
+        :param bool executemany: Whether the statement ran once per set of parameters.
+        :param float elapsed: The seconds it took.
+        :return: None
+        """
+        entry = {'time': datetime.utcnow().isoformat(), 'ms': round(elapsed * 1000, 3),
+                 'statement': statement,
+                 'parameters': '<%d sets>' % len(parameters) if executemany else _jsonable(parameters),
+                 'endpoint': None, 'url': None, 'caller': _caller(),
+                 'plan': None if executemany else _explain(conn, statement, parameters)}
+        if has_request_context():
+            entry.update(endpoint=request.endpoint, url=request.full_path.rstrip('?'))
+        current_app.extensions['slow_query_log'].info(json.dumps(entry))
+
+
+@atexit.register
+def _close_logs():
+    """
+    Close every open slow-query log file.
+    """
+    with _loggers_lock:
+        for logger in _loggers.values():
+            for handler in logger.handlers:
+                handler.close()
+        _loggers.clear()
+
+
+def read_log(path):
+    """
+    Read the entries of a slow-query log and its rotated files, oldest first.
+
+    Lines that are not valid entries, e.g. one cut short by a crash, are skipped.
+
+    :param str path: The path of the log.
+    :return generator(dict): The logged entries.
+    """
+    paths = [path]
+    n = 1
+    while os.path.exists('%s.%d' % (path, n)):
+        paths.append('%s.%d' % (path, n))
+        n += 1
+    for name in reversed(paths):
+        try:
+            f = open(name, encoding='utf-8')
+        except OSError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and 'statement' in entry:
+                    yield entry
+
+
+def summarize(entries, limit=10):
+    """
+    Group slow queries by fingerprint, worst first.
+
+    Fingerprints are ranked by the total time their runs took, so a statement that
+    is a little slow on every page outranks one that was very slow once.
+
+    :param iterable(dict) entries: Entries read with read_log().
+    :param int limit: The number of fingerprints to return.
+    :return list(QuerySummary): The worst fingerprints.
+    """
+    groups = {}
+    for entry in entries:
+        key = fingerprint(entry['statement'])
+        group = groups.setdefault(key, {'count': 0, 'total': 0.0, 'worst': entry,
+                                        'endpoints': set()})
+        group['count'] += 1
+        group['total'] += entry['ms']
+        if entry['ms'] > group['worst']['ms']:
+            group['worst'] = entry
+        group['endpoints'].add(entry.get('endpoint') or entry.get('caller') or '-')
+    ranked = sorted(groups.items(), key=lambda item: item[1]['total'], reverse=True)
+    return [QuerySummary(key, group['count'], round(group['total'], 3), group['worst']['ms'],
+                         group['worst']['statement'], group['worst'].get('plan'),
+                         sorted(group['endpoints']))
+            for key, group in ranked[:limit]]
@@ -0,0 +1,25 @@
+// Switch the post editor between CKEditor, for rich text, and a plain text area, for Markdown
+(function () {
+    var select = document.getElementById('body_format');
+    if (!select || typeof CKEDITOR === 'undefined') {
+        return;
+    }
+
+    function update() {
+        var editor = CKEDITOR.instances.body;
+        if (select.value === 'markdown') {
+            if (editor) {
+                editor.destroy();   // Copies the editor's content back into the text area
+            }
+        } else if (!editor) {
+            CKEDITOR.replace('body');
+        }
+    }
+
+    select.addEventListener('change', update);
+    CKEDITOR.on('instanceReady', function (event) {
+        if (event.editor.name === 'body' && select.value === 'markdown') {
+            event.editor.destroy();
+        }
+    });
+})();
@@ -0,0 +1,158 @@
+"""
+Helpers for working with the HTML of post bodies.
+
+Methods
+-------
+truncate_html(html, length)
+    Cut an HTML fragment down to a number of visible characters without splitting tags.
+html_to_text(html)
+    Extract the text of an HTML fragment.
+"""
+
+from html import escape
+from html.parser import HTMLParser
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                 'link', 'meta', 'source', 'track', 'wbr'}
+
+
+class _Truncator(HTMLParser):
+    """
+    An HTML parser that copies its input until a number of text characters has been seen.
+
+    Tags are copied verbatim and only text counts towards the limit. Once the limit is
+    reached, the remaining input is ignored and every element that is still open is
+    closed, so the output is always well-formed.
+
+    Attributes
+    ----------
+    length : int
+        The number of text characters to keep.
+    remaining : int
+        The number of text characters that can still be copied.
+    truncated : bool
+        True once any input has been dropped.
+    out : list(str)
+        The pieces of the output.
+    open_tags : list(str)
+        The stack of elements that are currently open.
+    """
+
+    def __init__(self, length):
+        super().__init__(convert_charrefs=True)
+        self.length = length
+        self.remaining = length
+        self.truncated = False
+        self.out = []
+        self.open_tags = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.truncated:
+            return
+        self.out.append(self.get_starttag_text())
+        if tag not in VOID_ELEMENTS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.truncated:
+            self.out.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if self.truncated or tag not in self.open_tags:
+            return
+        # Close any elements left open inside this one
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.out.append('</%s>' % open_tag)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.truncated:
+            return
+        if len(data) > self.remaining:
+            # Cut at the last word boundary that fits, if there is one
+            cut = data[:self.remaining]
+            if not data[self.remaining].isspace() and ' ' in cut:
+                cut = cut[:cut.rindex(' ')]
+            self.out.append(escape(cut, quote=False) + '...')
+            self.truncated = True
+        else:
+            self.out.append(escape(data, quote=False))
+            self.remaining -= len(data)
+
+    def result(self):
+        """
+        Close any open elements and return the output.
+
+        :return str: The truncated HTML.
+        """
+        self.close()
+        return ''.join(self.out) + ''.join('</%s>' % tag for tag in reversed(self.open_tags))
+
+
+def truncate_html(html, length):
+    """
+    Cut an HTML fragment down to a number of visible characters without splitting tags.
+
+    Only text counts towards the length; markup is kept intact and any element left
+    open at the cut is closed. If the fragment is cut, an ellipsis is added after the
+    last word that fits.
+
+    :param str html: The HTML to truncate, e.g. a post's sanitized body.
+    :param int length: The maximum number of text characters to keep.
+    :return str: The truncated HTML, or the input unchanged if it was short enough.
+    """
+
+    if html is None:
+        return None
+    if len(html) <= length:
+        # Text is never longer than the markup containing it
+        return html
+    truncator = _Truncator(length)
+    truncator.feed(html)
+    return truncator.result()
+
+
+class _TextExtractor(HTMLParser):
+    """
+    An HTML parser that keeps only the text of its input.
+
+    Attributes
+    ----------
+    out : list(str)
+        The pieces of text seen so far.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+
+    def handle_starttag(self, tag, attrs):
+        # Keep words in neighbouring elements apart
+        self.out.append(' ')
+
+    def handle_endtag(self, tag):
+        self.out.append(' ')
+
+    def handle_data(self, data):
+        self.out.append(data)
+
+
+def html_to_text(html):
+    """
+    Extract the text of an HTML fragment, e.g. for indexing it for search.
+
+    Tags are dropped, entities are decoded and runs of whitespace are collapsed.
+
+    :param str html: The HTML fragment.
+    :return str: The fragment's text.
+    """
+
+    if not html:
+        return ''
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return ' '.join(''.join(extractor.out).split())
@@ -0,0 +1,199 @@
+"""
+Column types.
+
+Post bodies are stored twice, as written and as sanitized HTML, and long posts make
+up most of the database. CompressedText stores text as a BLOB with a one-byte header
+telling how the rest is encoded: values shorter than a threshold are kept as UTF-8,
+longer ones are compressed with zstd if the zstandard package is installed, or
+zlib otherwise. Compression is transparent: the column is read and written as
+str, and rows written before the column was compressed, which are still TEXT,
+are read as they are.
+
+Classes
+-------
+CompressedText
+    Text stored compressed once it is longer than a threshold.
+
+Methods
+-------
+compress_text(value, threshold)
+    Encode text for a CompressedText column.
+decompress_text(value)
+    Decode a value read from a CompressedText column.
+compress_columns(connection, table, columns, batch_size, threshold, progress, encoded)
+    Re-encode the stored values of CompressedText columns.
+stored_bytes(connection, table, columns)
+    Measure the bytes the values of some columns take up.
+"""
+
+import zlib
+import sqlalchemy as sa
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:     # zlib is always available
+    zstandard = None
+
+# The header byte of each encoding
+RAW = b'\x00'
+ZLIB = b'\x01'
+ZSTD = b'\x02'
+
+# The number of bytes of UTF-8 below which text is not worth compressing
+DEFAULT_THRESHOLD = 512
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def compress_text(value, threshold=DEFAULT_THRESHOLD):
+    """
+    Encode text for a CompressedText column.
+
+    Text is compressed if it is at least threshold bytes long and compression
+    makes it smaller.
+
+    :param str value: The text.
+    :param int threshold: The number of bytes of UTF-8 from which text is compressed.
+    :return bytes: The encoded value, starting with its header byte.
+    """
+    data = value.encode('utf-8')
+    if len(data) >= threshold:
+        if zstandard is not None:
+            packed = ZSTD + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        else:
+            packed = ZLIB + zlib.compress(data, ZLIB_LEVEL)
+        if len(packed) < len(data) + 1:
+            return packed
+    return RAW + data
+
+
+def decompress_text(value):
+    """
+    Decode a value read from a CompressedText column.
+
+    :param value: The stored value: bytes with a header byte, or str for rows
+        written before the column was compressed.
+    :raises ValueError: If the value is zstd-compressed and zstandard is not installed,
+        or its header is unknown.
+    :return str: The text.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    header, data = value[:1], value[1:]
+    if header == RAW:
+        return data.decode('utf-8')
+    if header == ZLIB:
+        return zlib.decompress(data).decode('utf-8')
+    if header == ZSTD:
+        if zstandard is None:
+            raise ValueError('A value is compressed with zstd, but zstandard is not installed.')
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    raise ValueError('Unknown compressed text header %r.' % header)
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text stored compressed once it is longer than a threshold.
+
+    Attributes
+    ----------
+    threshold : int
+        The number of bytes of UTF-8 from which values are compressed.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        super().__init__()
+        self.threshold = threshold
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_text(value, self.threshold)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
+def compress_columns(connection, table, columns, batch_size=500, threshold=DEFAULT_THRESHOLD,
+                     progress=None, encoded=True):
+    """
+    Re-encode the stored values of CompressedText columns.
+
+    Rows are walked in batches in ID order. Values stored as TEXT, before their
+    column was compressed, or encoded differently from how compress_text() would
+    encode them now, e.g. after the threshold changed or zstandard was installed,
+    are rewritten. Works on any connection, so migrations can use it.
+
+    A TEXT column whose type was just changed to a binary one holds its values as
+    UTF-8 without a header byte; pass encoded=False to compress such values.
+
+    :param Connection connection: The connection to use.
+    :param str table: The name of the table, which must have an integer id column.
+    :param list(str) columns: The names of the columns.
+    :param int batch_size: The number of rows to read and write at a time.
+    :param int threshold: The number of bytes of UTF-8 from which values are compressed.
+    :param func progress: Called with the number of rows read so far after every batch.
+    :param bool encoded: Flag indicating that stored bytes start with a header byte,
+        rather than being plain UTF-8.
+    :return int: The number of rows rewritten.
+    """
+    # Untyped columns, so the stored values are read and written as they are
+    rows = sa.table(table, sa.column('id'), *[sa.column(name) for name in columns])
+    update = rows.update().where(rows.c.id == sa.bindparam('row_id')) \
+        .values({name: sa.bindparam('new_' + name) for name in columns})
+    last_id = 0
+    read = 0
+    rewritten = 0
+    while True:
+        batch = connection.execute(sa.select(rows).where(rows.c.id > last_id)
+                                   .order_by(rows.c.id).limit(batch_size)).all()
+        if not batch:
+            break
+        changes = []
+        for row in batch:
+            values = {'row_id': row.id}
+            for name in columns:
+                stored = getattr(row, name)
+                if stored is None:
+                    text = None
+                elif encoded or isinstance(stored, str):
+                    text = decompress_text(stored)
+                else:
+                    text = bytes(stored).decode('utf-8')
+                new = None if text is None else compress_text(text, threshold)
+                values['new_' + name] = new
+                if new != stored:
+                    values['changed'] = True
+            if values.pop('changed', False):
+                changes.append(values)
+        if changes:
+            connection.execute(update, changes)
+        rewritten += len(changes)
+        read += len(batch)
+        last_id = batch[-1].id
+        if progress is not None:
+            progress(read)
+    return rewritten
+
+
+def stored_bytes(connection, table, columns):
+    """
+    Measure the bytes the values of some columns take up.
+
+    :param Connection connection: The connection to use.
+    :param str table: The name of the table.
+    :param list(str) columns: The names of the columns.
+    :return int: The total size of the values, in bytes.
+    """
+    rows = sa.table(table, *[sa.column(name) for name in columns])
+    total = sa.func.coalesce(sa.func.sum(sum(
+        sa.func.coalesce(sa.func.length(sa.cast(rows.c[name], LargeBinary)), 0) for name in columns)), 0)
+    return connection.execute(sa.select(total)).scalar()
+
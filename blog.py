@@ -19,6 +19,28 @@ The script does the following:
         A Jinja template filter for previewing long text.
     tests(str, str)
         Run unit tests.
+    backfill_previews(int, bool)
+        Create the stored previews of existing posts.
+    recount_tags()
+        Recompute every tag's post count.
+    gc_tags()
+        Delete tags that no longer have any posts.
+    reindex_search(int)
+        Rebuild the full-text search index.
+    export(str, int, bool)
+        Render the blog to a directory as a static site.
+    import_posts(str, str, int, int, str, bool)
+        Import posts from a JSON Lines file or a directory of files.
+    seed(int, int, int, int, int)
+        Fill the database with a large, repeatable set of fake users and posts.
+    bench(str, int, str, str, float, float, str)
+        Benchmark the blog's routes on seeded datasets of several sizes.
+    slow_queries(str, int)
+        Summarize the slow-query log by statement fingerprint.
+    compress_bodies(int, bool)
+        Compress the stored bodies of existing posts.
+    build_assets(str, bool)
+        Write fingerprinted, precompressed copies of the static files.
 """
 
 import os
@@ -26,6 +48,7 @@ import sys
 import click
 from app import create_app, db
 from app.models import *
+from app.text import truncate_html
 from flask_migrate import Migrate
 
 # Start coverage when testing if necessary
@@ -37,7 +60,19 @@ if os.environ.get('FLASK_COVERAGE'):
     COV.start()
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
-migrate = Migrate(app, db)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """
+    Leave the full-text search index out of autogenerated migrations.
+
+    The posts_fts virtual table and its shadow tables are created by app.search,
+    not by the models, so they would otherwise be detected as tables to drop.
+    """
+    return not (type_ == 'table' and name.startswith('posts_fts'))
+
+
+migrate = Migrate(app, db, include_object=include_object)
 
 
 # Shell context processor
@@ -77,16 +112,15 @@ def text_preview(text):
     """
     Create a preview of a post's body.
 
-    Outside of the post's permalink page, only the first 2000 characters should be
+    Outside of the post's permalink page, only the first 2000 characters of text should be
     displayed. If a post is shorter than 2000 characters, then the entire post can be returned.
+    The text is cut without splitting HTML tags. Posts store a precomputed preview, so this
+    is only needed for posts saved before the body_preview column existed.
     :param str text: The entire body of a post.
     :return str: The first 2000 characters of a post, plus an ellipses to indicate continuation
     """
 
-    if len(text) < 2000:
-        return text
-    else:
-        return text[0:2000] + '...'
+    return truncate_html(text, app.config['BLOG_PREVIEW_LENGTH'])
 
 
 app.jinja_env.filters['time'] = time_filter
@@ -128,3 +162,367 @@ def test(coverage, selenium):
         COV.html_report(directory=covdir)
         print('HTML version: file://%s/index.html' % covdir)
         COV.erase()
+
+
+@app.cli.command('backfill-previews')
+@click.option('--batch-size', default=500, show_default=True,
+              help='Number of posts to update per transaction.')
+@click.option('--all', 'rebuild_all', is_flag=True, default=False,
+              help='Rebuild every preview, not only missing ones.')
+def backfill_previews(batch_size, rebuild_all):
+    """
+    Create the stored previews of existing posts.
+
+    Posts saved before the body_preview column existed have no preview. Posts are
+    walked in ID order and updated in batches, committing after each batch so the
+    command can be interrupted and run again. Each batch reads only the IDs and
+    bodies of its posts in one query and writes their previews with one UPDATE. With
+    --all, every preview is rebuilt, e.g. after changing BLOG_PREVIEW_LENGTH.
+
+    :arg batch_size: The number of posts to update per transaction.
+    :arg rebuild_all: Flag indicating that existing previews should be rebuilt.
+    """
+    from app.cache import mark_changed
+
+    posts = Post.__table__
+    update = posts.update().where(posts.c.id == db.bindparam('post_id')) \
+        .values(body_preview=db.bindparam('preview'))
+    last_id = 0
+    updated = 0
+    while True:
+        query = db.session.query(Post.id, Post.body_html).filter(Post.id > last_id)
+        if not rebuild_all:
+            query = query.filter(Post.body_preview.is_(None))
+        batch = query.order_by(Post.id).limit(batch_size).all()
+        if not batch:
+            break
+        db.session.execute(update, [{'post_id': id, 'preview': Post.make_preview(body_html)}
+                                    for id, body_html in batch])
+        mark_changed(db.session, post_ids=[id for id, _ in batch])
+        db.session.commit()
+        last_id = batch[-1].id
+        updated += len(batch)
+        click.echo('Updated %d posts' % updated)
+    click.echo('Done.')
+
+
+@app.cli.command('recount-tags')
+def recount_tags():
+    """
+    Recompute every tag's post count from the post_tags table.
+
+    Post counts are kept up to date as posts are written, so this is only needed to
+    repair counts after post_tags has been changed outside of the application.
+    """
+    fixed = Tag.recount()
+    db.session.commit()
+    click.echo('Fixed the post counts of %d tags.' % fixed)
+
+
+@app.cli.command('gc-tags')
+def gc_tags():
+    """
+    Delete tags that no longer have any posts.
+
+    Deleting and editing posts already removes the tags they orphan, so this is only
+    needed for periodic cleanup, e.g. after post_tags has been changed outside of
+    the application.
+    """
+    deleted = Tag.delete_orphans()
+    db.session.commit()
+    click.echo('Deleted %d orphaned tags.' % deleted)
+
+
+@app.cli.command('reindex-search')
+@click.option('--batch-size', default=500, show_default=True,
+              help='Number of posts to index at a time.')
+def reindex_search(batch_size):
+    """
+    Rebuild the full-text search index from the posts table.
+
+    Posts are indexed as they are written, so this is only needed once for posts
+    written before the index existed, or to repair the index.
+
+    :arg batch_size: The number of posts to index at a time.
+    """
+    from app.search import rebuild_index
+    indexed = rebuild_index(batch_size)
+    db.session.commit()
+    click.echo('Indexed %d posts.' % indexed)
+
+
+@app.cli.command('export')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True,
+              help='Number of processes to render pages with.')
+@click.option('--incremental', is_flag=True, default=False,
+              help='Only render the pages of posts changed since the last export.')
+def export(directory, workers, incremental):
+    """
+    Render the blog to a directory as a static site.
+
+    Every page of the home page, every post and every page of each tag and author
+    listing is rendered through the templates to <directory>/<path>/index.html, with
+    links rewritten to the exported pages. With --incremental, the manifest left by
+    the last export is used to only render the pages affected by posts changed since.
+    Run a full export after changing templates or settings.
+
+    :arg directory: The directory to write the site to.
+    :arg workers: The number of processes to render pages with.
+    :arg incremental: Flag indicating that only changed pages should be rendered.
+    """
+    import time
+    from app.export import export_site
+    start = time.perf_counter()
+    result = export_site(directory, os.getenv('FLASK_CONFIG') or 'default',
+                         workers=workers, incremental=incremental)
+    click.echo('Rendered %d pages in %.1fs: %d written, %d removed.'
+               % (result.rendered, time.perf_counter() - start, result.written, result.removed))
+
+
+@app.cli.command('import-posts')
+@click.argument('source', type=click.Path(exists=True))
+@click.option('--checkpoint', default=None,
+              help='File recording how far the import got. Defaults to SOURCE.checkpoint.')
+@click.option('--batch-size', default=500, show_default=True,
+              help='Number of posts to insert per transaction.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True,
+              help='Number of processes to sanitize post bodies with.')
+@click.option('--author', default='Anonymous Blogger', show_default=True,
+              help='Author of posts that do not name one.')
+@click.option('--restart', is_flag=True, default=False,
+              help='Ignore the checkpoint and import the whole source again.')
+def import_posts(source, checkpoint, batch_size, workers, author, restart):
+    """
+    Import posts from a JSON Lines file or a directory of HTML and Markdown files.
+
+    Posts are inserted in chunks, each committed in its own transaction, while the
+    bodies of the next chunk are sanitized by a pool of worker processes. The position
+    reached is saved in a checkpoint file after every chunk, so an interrupted import
+    continues where it stopped when the command is run again.
+
+    :arg source: The JSON Lines file or directory to import.
+    :arg checkpoint: The path of the checkpoint file.
+    :arg batch_size: The number of posts to insert per transaction.
+    :arg workers: The number of processes to sanitize post bodies with.
+    :arg author: The author of posts that do not name one.
+    :arg restart: Flag indicating that the checkpoint should be ignored.
+    """
+    from app.importer import import_posts as run_import
+
+    def progress(imported, seconds):
+        click.echo('Imported %d posts (%.0f posts/s)' % (imported, imported / max(seconds, 1e-6)))
+
+    try:
+        result = run_import(source, checkpoint or source.rstrip('/\\') + '.checkpoint',
+                            batch_size=batch_size, workers=workers, restart=restart,
+                            author=author, progress=progress)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if result.skipped:
+        click.echo('Skipped %d posts imported by an earlier run.' % result.skipped)
+    click.echo('Imported %d posts in %.1fs (%.0f posts/s).'
+               % (result.imported, result.seconds, result.imported / max(result.seconds, 1e-6)))
+
+
+@app.cli.command('seed')
+@click.option('--posts', default=1000, show_default=True, help='Number of posts to create.')
+@click.option('--users', default=10, show_default=True, help='Number of users to create.')
+@click.option('--tags', default=500, show_default=True, help='Number of distinct tags to use.')
+@click.option('--seed', 'random_seed', default=0, show_default=True,
+              help='Seed for the random data; the same seed creates the same data.')
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Number of posts to insert per transaction.')
+def seed(posts, users, tags, random_seed, batch_size):
+    """
+    Fill the database with a large, repeatable set of fake users and posts.
+
+    Tags and authors follow Zipf distributions, like a real blog's. Users are created
+    with the password 'password'. Posts are inserted in chunks with bulk statements,
+    so millions of posts can be created in minutes.
+
+    :arg posts: The number of posts to create.
+    :arg users: The number of users to create.
+    :arg tags: The number of distinct tags to use.
+    :arg random_seed: The seed of the random data.
+    :arg batch_size: The number of posts to insert per transaction.
+    """
+    from app import fake
+
+    def progress(created, seconds):
+        click.echo('Created %d posts (%.0f posts/s)' % (created, created / max(seconds, 1e-6)))
+
+    fake.seed(posts=posts, users=users, tags=tags, seed=random_seed, batch_size=batch_size,
+              progress=progress)
+
+
+@app.cli.command('bench')
+@click.option('--sizes', default='1000', show_default=True,
+              help='Comma-separated numbers of posts in the datasets, e.g. 1000,100000,1000000.')
+@click.option('--repeat', default=20, show_default=True, help='Number of timed requests per route.')
+@click.option('--output', default=None, help='File to write the results to as JSON.')
+@click.option('--baseline', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Results of an earlier run to compare with.')
+@click.option('--threshold', default=0.25, show_default=True,
+              help='Allowed growth in median latency over the baseline, e.g. 0.25 for 25%.')
+@click.option('--memory-threshold', default=0.25, show_default=True,
+              help='Allowed growth in peak memory over the baseline.')
+@click.option('--data-dir', default='tmp/benchmarks', show_default=True,
+              help='Directory to keep the seeded databases in.')
+def bench(sizes, repeat, output, baseline, threshold, memory_threshold, data_dir):
+    """
+    Benchmark the blog's routes on seeded datasets of several sizes.
+
+    For each size, a database is seeded with fake posts (once; it is reused by later
+    runs) and the home page, a deep page of it, a tag, an author, a post, and creating,
+    editing and deleting a post are requested through the test client. The latency,
+    queries per request and peak memory of each route are printed and can be saved as
+    JSON. With --baseline, the command fails if any route regressed.
+
+    :arg sizes: The numbers of posts in the datasets, comma-separated.
+    :arg repeat: The number of timed requests per route.
+    :arg output: The file to write the results to.
+    :arg baseline: The results of an earlier run to compare with.
+    :arg threshold: The allowed growth in median latency.
+    :arg memory_threshold: The allowed growth in peak memory.
+    :arg data_dir: The directory to keep the seeded databases in.
+    """
+    import json
+    from app import benchmarks
+
+    try:
+        sizes = [int(size) for size in sizes.split(',')]
+    except ValueError:
+        raise click.BadParameter('must be comma-separated numbers', param_hint='--sizes')
+    results = benchmarks.run(sizes, repeat=repeat, data_dir=data_dir, progress=click.echo)
+    for size, measured in results['sizes'].items():
+        click.echo('\n%s posts' % size)
+        click.echo('%-12s %10s %10s %8s %10s' % ('route', 'median ms', 'p95 ms', 'queries', 'peak KiB'))
+        for route, m in measured.items():
+            click.echo('%-12s %10.2f %10.2f %8d %10.1f'
+                       % (route, m['median_ms'], m['p95_ms'], m['queries'], m['peak_kib']))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            regressions = benchmarks.compare(results, json.load(f), threshold, memory_threshold)
+        for regression in regressions:
+            click.echo('Regression: ' + regression, err=True)
+        if regressions:
+            sys.exit(1)
+        click.echo('\nNo regressions against %s.' % baseline)
+
+
+@app.cli.command('slow-queries')
+@click.option('--log', 'path', default=None,
+              help='Slow-query log to read. Defaults to BLOG_SLOW_QUERY_LOG.')
+@click.option('--limit', default=10, show_default=True, help='Number of statements to show.')
+def slow_queries(path, limit):
+    """
+    Summarize the slow-query log by statement fingerprint, worst first.
+
+    Statements that differ only in their literals are grouped together and ranked by
+    their total time. The plan of each group's slowest run is shown, so full table
+    scans ('SCAN <table>') that call for an index are easy to spot.
+
+    :arg path: The slow-query log to read.
+    :arg limit: The number of statements to show.
+    """
+    from app.slow_queries import read_log, summarize
+    path = path or app.config['BLOG_SLOW_QUERY_LOG']
+    if not path:
+        raise click.ClickException('No log given and BLOG_SLOW_QUERY_LOG is not set.')
+    summaries = summarize(read_log(path), limit)
+    if not summaries:
+        click.echo('No slow queries logged in %s.' % path)
+    for n, summary in enumerate(summaries, 1):
+        click.echo('%d. %d runs, %.1fms total, %.1fms mean, %.1fms max'
+                   % (n, summary.count, summary.total_ms, summary.total_ms / summary.count,
+                      summary.max_ms))
+        click.echo('   From: ' + ', '.join(summary.endpoints))
+        click.echo('   ' + summary.fingerprint)
+        for line in summary.plan or []:
+            click.echo('   | ' + line)
+        click.echo()
+
+
+@app.cli.command('compress-bodies')
+@click.option('--batch-size', default=500, show_default=True,
+              help='Number of posts to rewrite per transaction.')
+@click.option('--vacuum', is_flag=True, default=False,
+              help='Rebuild the database file afterwards to give the freed space back.')
+def compress_bodies(batch_size, vacuum):
+    """
+    Compress the stored bodies of existing posts.
+
+    The migration that made Post.body and Post.body_html compressed already
+    compresses existing rows, so this is only needed for rows written outside of the
+    application, or to re-encode bodies after the compression threshold changed or
+    zstandard was installed. Posts are walked in ID order, committing after each
+    batch so the command can be interrupted and run again.
+
+    SQLite keeps the pages freed by compression in the database file for reuse.
+    With --vacuum, the file is rebuilt so it shrinks, which locks the database
+    while it runs.
+
+    :arg batch_size: The number of posts to rewrite per transaction.
+    :arg vacuum: Flag indicating that the database file should be rebuilt afterwards.
+    """
+    from app.types import compress_columns, stored_bytes
+    columns = ['body', 'body_html']
+    threshold = Post.__table__.c.body.type.threshold
+
+    def file_size(connection):
+        if connection.dialect.name != 'sqlite':
+            return None
+        page_size = connection.exec_driver_sql('PRAGMA page_size').scalar()
+        pages = connection.exec_driver_sql('PRAGMA page_count').scalar()
+        free = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+        return pages * page_size, free * page_size
+
+    with db.engine.connect() as connection:
+        before = stored_bytes(connection, 'posts', columns)
+
+        def progress(read):
+            connection.commit()
+            click.echo('Checked %d posts' % read)
+
+        rewritten = compress_columns(connection, 'posts', columns, batch_size, threshold, progress)
+        connection.commit()
+        after = stored_bytes(connection, 'posts', columns)
+        click.echo('Rewrote %d posts. Bodies take up %d bytes, down from %d (%.0f%% saved).'
+                   % (rewritten, after, before, 100.0 * (before - after) / before if before else 0))
+        if vacuum and connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql('VACUUM')
+        size = file_size(connection)
+        if size is not None:
+            click.echo('The database file is %d bytes, %d of them free.' % size)
+            if size[1] and not vacuum:
+                click.echo('Run again with --vacuum to give the free space back.')
+
+
+@app.cli.command('build-assets')
+@click.option('--output', default=None,
+              help='Directory to write the copies to. Defaults to BLOG_ASSETS_DIR.')
+@click.option('--clean', is_flag=True, default=False,
+              help='Delete copies left over from earlier builds.')
+def build_assets(output, clean):
+    """
+    Write fingerprinted, precompressed copies of the static files.
+
+    Each file is copied under a name containing a hash of its content, with gzip
+    (and brotli, if installed) versions next to it, and manifest.json maps the
+    files to their copies. Run it whenever a static file changes, and restart the
+    application so templates link the new copies. Copies from earlier builds are
+    kept unless --clean is given, since browsers may still have pages linking them.
+
+    :arg output: The directory to write the copies to.
+    :arg clean: Flag indicating that copies from earlier builds should be deleted.
+    """
+    from app.assets import build_assets as run_build
+    output = output or app.config['BLOG_ASSETS_DIR']
+    manifest = run_build(app.static_folder, output, clean)
+    for name, fingerprinted in sorted(manifest.items()):
+        click.echo('%s -> %s' % (name, fingerprinted))
+    click.echo('Built %d assets in %s.' % (len(manifest), output))
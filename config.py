@@ -1,3 +1,4 @@
+import logging
 import os
 
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -10,24 +11,64 @@ class Config:
     Methods
     -------
     init_app(app)
-        Run application.
+        Configure the application's logging.
     """
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False      # Don't track database modifications to save memory
     BLOG_POSTS_PER_PAGE = 5     # Number of posts to display per pagination page
     SECRET_KEY = 'csrf'         # Key for CSRF on forms
     BLOG_ADMIN = 'admin'        # Username for blog administrator
+    BLOG_TITLE = 'Blog Title'   # Title of the blog, used in feeds
+    BLOG_APPROXIMATE_TOTALS = True  # Show an approximate post count in the pagination widget
+    BLOG_TOTALS_TTL = 300       # Seconds to reuse a listing's post count before recounting
+    BLOG_TOTALS_CACHE_SIZE = 256    # Maximum number of listing post counts to keep
+    BLOG_PREVIEW_LENGTH = 2000  # Number of characters of text in a post's preview
+    BLOG_FRAGMENT_CACHE_TTL = 300   # Seconds to reuse a rendered sidebar box; writes invalidate it sooner
+    BLOG_FRAGMENT_CACHE_SIZE = 32   # Maximum number of rendered fragments to keep
+    BLOG_SIDEBAR_TAG_ORDER = 'name'     # Sort sidebar categories by 'name' or 'popularity'
+    BLOG_FEED_SIZE = 20         # Number of posts in an Atom feed
+    BLOG_FEED_CACHE_SIZE = 64   # Maximum number of serialized feeds to keep
+    BLOG_FEED_CACHE_TTL = 300   # Seconds to reuse a serialized feed; writes in the same process invalidate it sooner
+    BLOG_FEED_MAX_AGE = 300     # Seconds clients may reuse a feed before checking for changes
+    BLOG_PAGE_CACHE = False     # Serve whole pages to anonymous readers from a cache
+    BLOG_PAGE_CACHE_DIR = os.environ.get('BLOG_PAGE_CACHE_DIR')  # Directory sharing cached pages between workers
+    BLOG_PAGE_CACHE_SIZE = 256  # Maximum number of cached pages each worker keeps in memory
+    BLOG_PAGE_CACHE_TTL = 3600  # Seconds to keep a cached page; writes purge it sooner
+    BLOG_INSTRUMENTATION = os.environ.get('BLOG_INSTRUMENTATION') == '1'  # Time each request's SQL and templates
+    BLOG_INSTRUMENTATION_SLOWEST = 3    # Number of slowest statements logged per request
+    BLOG_INSTRUMENTATION_LOG_LEVEL = logging.INFO   # Level of the logger request timings are written to
+    BLOG_METRICS = True         # Collect request latency metrics for the /metrics page
+    BLOG_METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # Histogram bucket bounds in seconds
+    BLOG_SLOW_QUERY_LOG = os.environ.get('BLOG_SLOW_QUERY_LOG')  # File to log slow SQL statements and their plans to
+    BLOG_SLOW_QUERY_THRESHOLD = 0.1     # Seconds a statement must take to be logged as slow
+    BLOG_SLOW_QUERY_LOG_SIZE = 10 * 1024 * 1024     # Bytes the slow-query log may grow to before it is rotated
+    BLOG_SLOW_QUERY_LOG_BACKUPS = 5     # Number of rotated slow-query logs to keep
+    BLOG_SANITIZE_POOL_THRESHOLD = 256 * 1024   # Characters above which a body is sanitized in a worker process
+    BLOG_SANITIZE_TIMEOUT = 10  # Seconds to wait for a worker process to sanitize a body
+    BLOG_SANITIZE_WORKERS = 2   # Number of worker processes kept running to sanitize large bodies
+    BLOG_COMPRESSION = True     # Compress responses with gzip or brotli when clients accept it
+    BLOG_COMPRESSION_MIN_SIZE = 500     # Bytes a response must have to be compressed
+    BLOG_COMPRESSION_CACHE_SIZE = 128   # Maximum number of compressed bodies to keep, by URL and ETag
+    BLOG_ASSETS_DIR = os.environ.get('BLOG_ASSETS_DIR') or os.path.join(basedir, 'assets')  # Directory flask build-assets writes fingerprinted static files to
+    BLOG_ASSETS_URL = '/assets'     # URL prefix of the fingerprinted static files
+    BLOG_ASSETS_MAX_AGE = 365 * 24 * 3600   # Seconds browsers may keep a fingerprinted file without checking it
+    CKEDITOR_SERVE_LOCAL = True     # Serve CKEditor from the copy bundled with flask-ckeditor instead of a CDN
+    CKEDITOR_PKG_TYPE = 'standard'  # The CKEditor package to serve
 
     @staticmethod
     def init_app(app):
         """
-        Empty init_app method.
+        Configure the application's logging.
+
+        Request timings are logged at INFO by the 'app.instrumentation' logger, a child
+        of the application's logger, which only passes on warnings unless a level is
+        set for it.
 
         :param Flask app: The application instance.
         :return: None
         """
 
-        pass
+        app.logger.getChild('instrumentation').setLevel(app.config['BLOG_INSTRUMENTATION_LOG_LEVEL'])
 
 
 class DevelopmentConfig(Config):
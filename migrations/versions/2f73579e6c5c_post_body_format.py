@@ -0,0 +1,30 @@
+"""post body format
+
+Adds Post.body_format, recording whether a post's body is HTML or Markdown.
+Existing posts were all written in CKEditor, so they are HTML.
+
+Revision ID: 2f73579e6c5c
+Revises: 68bdbf9e8fae
+Create Date: 2026-10-17 07:24:16.220600
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f73579e6c5c'
+down_revision = '68bdbf9e8fae'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('body_format', sa.String(length=16), server_default='html',
+                                      nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('body_format')
@@ -0,0 +1,65 @@
+"""compress post bodies
+
+Post.body and Post.body_html become BLOBs holding CompressedText values: the
+columns' type is changed first, which leaves each value as plain UTF-8 bytes, and
+the rows are then compressed in batches. On downgrade they are decompressed to
+plain UTF-8 bytes, and the columns' type is changed back to TEXT.
+
+Revision ID: 54bacdb32123
+Revises: 2f73579e6c5c
+Create Date: 2026-10-17 07:34:23.910974
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.types import compress_columns, decompress_text
+
+
+# revision identifiers, used by Alembic.
+revision = '54bacdb32123'
+down_revision = '2f73579e6c5c'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['body', 'body_html']
+BATCH_SIZE = 500
+
+
+def upgrade():
+    # Binary values can only be written once the columns are binary; PostgreSQL needs
+    # to be told how to convert the text
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        for name in COLUMNS:
+            batch_op.alter_column(name, existing_type=sa.Text(), type_=sa.LargeBinary(),
+                                  existing_nullable=True,
+                                  postgresql_using="convert_to(%s, 'UTF8')" % name)
+    compress_columns(op.get_bind(), 'posts', COLUMNS, batch_size=BATCH_SIZE, encoded=False)
+
+
+def _plain(value):
+    # Text values are still written as bytes, since the columns are still binary
+    text = decompress_text(value)
+    return None if text is None else text.encode('utf-8')
+
+
+def downgrade():
+    connection = op.get_bind()
+    posts = sa.table('posts', sa.column('id'), *[sa.column(name) for name in COLUMNS])
+    update = posts.update().where(posts.c.id == sa.bindparam('row_id')) \
+        .values({name: sa.bindparam('new_' + name) for name in COLUMNS})
+    last_id = 0
+    while True:
+        batch = connection.execute(sa.select(posts).where(posts.c.id > last_id)
+                                   .order_by(posts.c.id).limit(BATCH_SIZE)).all()
+        if not batch:
+            break
+        changes = [dict({'row_id': row.id},
+                        **{'new_' + name: _plain(getattr(row, name)) for name in COLUMNS})
+                   for row in batch]
+        connection.execute(update, changes)
+        last_id = batch[-1].id
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        for name in COLUMNS:
+            batch_op.alter_column(name, existing_type=sa.LargeBinary(), type_=sa.Text(),
+                                  existing_nullable=True,
+                                  postgresql_using="convert_from(%s, 'UTF8')" % name)
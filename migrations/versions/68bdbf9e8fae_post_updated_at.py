@@ -0,0 +1,31 @@
+"""post updated_at
+
+Adds Post.updated_at, used to validate cached copies of post pages and listings.
+Existing posts are treated as last updated when they were created.
+
+Revision ID: 68bdbf9e8fae
+Revises: 78ed8024733a
+Create Date: 2026-10-17 07:00:49.842730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '68bdbf9e8fae'
+down_revision = '78ed8024733a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute('UPDATE posts SET updated_at = time')
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,31 @@
+"""post search index
+
+Creates the posts_fts full-text index on SQLite. Other databases have no FTS5
+and search post titles instead. Run `flask reindex-search` after upgrading to
+index existing posts.
+
+Revision ID: 78ed8024733a
+Revises: 9420bfedd1a2
+Create Date: 2026-10-17 06:56:51.750936
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '78ed8024733a'
+down_revision = '9420bfedd1a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, body, "
+                   "tokenize='porter unicode61')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS posts_fts')
@@ -0,0 +1,43 @@
+"""post previews and tag counts
+
+Adds Post.body_preview, the (time, id) index used by keyset pagination, and
+Tag.post_count. Existing tag counts are computed here; existing previews are
+filled in by running `flask backfill-previews` after upgrading.
+
+Revision ID: 8ddeedffdf9a
+Revises: fa6775101a70
+Create Date: 2026-10-17 06:54:17.062178
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8ddeedffdf9a'
+down_revision = 'fa6775101a70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('body_preview', sa.Text(), nullable=True))
+        batch_op.create_index('ix_posts_time_id', ['time', 'id'], unique=False)
+
+    with op.batch_alter_table('tag', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_tag_post_count'), ['post_count'], unique=False)
+
+    op.execute('UPDATE tag SET post_count = '
+               '(SELECT count(*) FROM post_tags WHERE post_tags.tag_id = tag.name)')
+
+
+def downgrade():
+    with op.batch_alter_table('tag', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tag_post_count'))
+        batch_op.drop_column('post_count')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_time_id')
+        batch_op.drop_column('body_preview')
@@ -0,0 +1,56 @@
+"""post_tags keys and indexes
+
+Gives post_tags a (tag_id, post_id) primary key, a reverse (post_id, tag_id)
+index, and a post_time column copied from posts.time with a (tag_id, post_time,
+post_id) index for listing a tag's posts in time order. The table is rebuilt so
+duplicate rows are dropped on the way, and tag counts are recomputed afterwards.
+
+Revision ID: 9420bfedd1a2
+Revises: 8ddeedffdf9a
+Create Date: 2026-10-17 06:54:51.001804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9420bfedd1a2'
+down_revision = '8ddeedffdf9a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('_post_tags_new',
+    sa.Column('tag_id', sa.String(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('post_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.name'], ),
+    sa.PrimaryKeyConstraint('tag_id', 'post_id')
+    )
+    op.execute('INSERT INTO _post_tags_new (tag_id, post_id, post_time) '
+               'SELECT DISTINCT post_tags.tag_id, post_tags.post_id, posts.time '
+               'FROM post_tags JOIN posts ON posts.id = post_tags.post_id '
+               'WHERE post_tags.tag_id IS NOT NULL')
+    op.drop_table('post_tags')
+    op.rename_table('_post_tags_new', 'post_tags')
+    with op.batch_alter_table('post_tags', schema=None) as batch_op:
+        batch_op.create_index('ix_post_tags_post_id_tag_id', ['post_id', 'tag_id'], unique=False)
+        batch_op.create_index('ix_post_tags_tag_time', ['tag_id', 'post_time', 'post_id'], unique=False)
+
+    op.execute('UPDATE tag SET post_count = '
+               '(SELECT count(*) FROM post_tags WHERE post_tags.tag_id = tag.name)')
+
+
+def downgrade():
+    op.create_table('_post_tags_old',
+    sa.Column('tag_id', sa.String(), nullable=True),
+    sa.Column('post_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.name'], )
+    )
+    op.execute('INSERT INTO _post_tags_old (tag_id, post_id) SELECT tag_id, post_id FROM post_tags')
+    op.drop_table('post_tags')
+    op.rename_table('_post_tags_old', 'post_tags')
@@ -0,0 +1,89 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from app import assets, create_app, db
+from app.assets import build_assets
+from app.models import *
+
+class AssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.directory = tempfile.mkdtemp()
+        self.app.config['BLOG_ASSETS_DIR'] = self.directory
+        self.app.extensions['assets'] = assets.load(self.app)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def build(self, clean=False):
+        manifest = build_assets(self.app.static_folder, self.directory, clean)
+        self.app.extensions['assets'] = assets.load(self.app)
+        return manifest
+
+    def test_unbuilt_assets_use_static_urls(self):
+        response = self.client.get('/')
+        self.assertIn('href="/static/styles.css"', response.get_data(as_text=True))
+
+    def test_build(self):
+        manifest = self.build()
+        self.assertRegex(manifest['styles.css'], r'^styles\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            self.assertEqual(json.load(f), manifest)
+        with self.app.open_resource('static/styles.css') as f:
+            css = f.read()
+        with open(os.path.join(self.directory, manifest['styles.css'] + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), css)
+        # Building again changes nothing
+        self.assertEqual(self.build(), manifest)
+
+    def test_fingerprinted_urls(self):
+        manifest = self.build()
+        html = self.client.get('/').get_data(as_text=True)
+        self.assertIn('href="/assets/%s"' % manifest['styles.css'], html)
+        self.assertNotIn('/static/styles.css', html)
+
+    def test_serve_precompressed(self):
+        name = self.build()['styles.css']
+        response = self.client.get('/assets/' + name, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        cache_control = response.cache_control
+        self.assertTrue(cache_control.immutable)
+        self.assertEqual(cache_control.max_age, self.app.config['BLOG_ASSETS_MAX_AGE'])
+        response.close()
+        with self.app.open_resource('static/styles.css') as f:
+            css = f.read()
+        plain = self.client.get('/assets/' + name)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.data, css)
+        plain.close()
+
+    def test_clean(self):
+        stale = os.path.join(self.directory, 'styles.000000000000.css')
+        with open(stale, 'w') as f:
+            f.write('old')
+        self.build()
+        self.assertTrue(os.path.exists(stale))
+        self.build(clean=True)
+        self.assertFalse(os.path.exists(stale))
+
+    def test_ckeditor_served_locally(self):
+        from flask_ckeditor import _CKEditor
+        with self.app.test_request_context():
+            script = _CKEditor.load()
+        self.assertNotIn('cdn.ckeditor.com', script)
+        response = self.client.get('/ckeditor/static/standard/ckeditor.js')
+        self.assertEqual(response.status_code, 200)
+        response.close()
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import benchmarks
+
+class BenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_run(self):
+        results = benchmarks.run([60], repeat=2, data_dir=self.data_dir)
+        measured = results['sizes']['60']
+        self.assertEqual(list(measured), ['index', 'index_deep', 'tagged', 'by_author', 'post',
+                                          'new_post', 'edit', 'delete'])
+        for m in measured.values():
+            self.assertGreater(m['median_ms'], 0)
+            self.assertGreater(m['queries'], 0)
+            self.assertGreater(m['peak_kib'], 0)
+        # The dataset is reused, and deleting the benchmark posts left it unchanged
+        database = os.path.join(self.data_dir, 'bench-60.sqlite')
+        modified = os.path.getmtime(database + '.json')
+        again = benchmarks.run([60], repeat=2, data_dir=self.data_dir)
+        self.assertEqual(os.path.getmtime(database + '.json'), modified)
+        self.assertEqual(again['sizes']['60']['post']['queries'], measured['post']['queries'])
+
+    def test_compare(self):
+        baseline = {'sizes': {'1000': {
+            'index': {'median_ms': 10.0, 'queries': 3, 'peak_kib': 100.0},
+            'post': {'median_ms': 10.0, 'queries': 3, 'peak_kib': 100.0}}}}
+        results = {'sizes': {'1000': {
+            'index': {'median_ms': 12.0, 'queries': 3, 'peak_kib': 110.0},
+            'post': {'median_ms': 15.0, 'queries': 4, 'peak_kib': 200.0},
+            'edit': {'median_ms': 50.0, 'queries': 9, 'peak_kib': 500.0}}}}
+        self.assertEqual(benchmarks.compare(results, baseline), [
+            'post (1000 posts): median latency 10.00ms -> 15.00ms',
+            'post (1000 posts): queries 3 -> 4',
+            'post (1000 posts): peak memory 100.0KiB -> 200.0KiB'])
+        self.assertEqual(benchmarks.compare(results, baseline, latency_threshold=0.1,
+                                        memory_threshold=1.5),
+                         ['index (1000 posts): median latency 10.00ms -> 12.00ms',
+                          'post (1000 posts): median latency 10.00ms -> 15.00ms',
+                          'post (1000 posts): queries 3 -> 4'])
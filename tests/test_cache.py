@@ -0,0 +1,64 @@
+import time
+import unittest
+from app import create_app, db
+from app.cache import LRUCache
+from app.models import *
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_entries_expire(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.misses, 1)
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_sidebar_is_cached(self):
+        self.client.get('/')
+        cache = self.app.extensions['fragment_cache']
+        self.assertEqual(len(cache), 2)
+        hits, misses = cache.hits, cache.misses
+        self.client.get('/')
+        self.assertGreater(cache.hits, hits)
+        self.assertEqual(cache.misses, misses)
+
+    def test_commit_invalidates_sidebar(self):
+        self.client.get('/')
+        p = Post(body='Body', title='A brand new post')
+        p.tag('fresh')
+        db.session.add(p)
+        db.session.commit()
+        self.assertEqual(len(self.app.extensions['fragment_cache']), 0)
+        page = self.client.get('/').get_data(as_text=True)
+        self.assertIn('A brand new post', page)
+        self.assertIn('fresh', page)
+
+    def test_rollback_does_not_invalidate(self):
+        self.client.get('/')
+        db.session.add(Post(body='Body', title='Rolled back'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(len(self.app.extensions['fragment_cache']), 2)
@@ -0,0 +1,83 @@
+import gzip
+import unittest
+from app import create_app, db
+from app.models import *
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.post = Post(title='t', body='<p>%s</p>' % ('A compressible sentence. ' * 200))
+        db.session.add(self.post)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_gzip_page(self):
+        plain = self.client.get('/post/%d' % self.post.id)
+        response = self.client.get('/post/%d' % self.post.id, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+    def test_compressed_once_per_etag(self):
+        cache = self.app.extensions['compression_cache']
+        first = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        second = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(cache.hits, 1)
+        self.assertTrue(first.headers['ETag'].startswith('W/'))
+
+    def test_unsupported_encoding(self):
+        response = self.client.get('/', headers={'Accept-Encoding': 'compress, gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_small_responses(self):
+        self.app.config['BLOG_COMPRESSION_MIN_SIZE'] = 10 ** 6
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Accept-Encoding', response.headers.get('Vary', ''))
+
+    def test_static_file(self):
+        with self.app.open_resource('static/styles.css') as f:
+            css = f.read()
+        response = self.client.get('/static/styles.css', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data), css)
+        self.assertTrue(response.headers['ETag'].startswith('W/'))
+        self.assertNotIn('Accept-Ranges', response.headers)
+        cached = self.client.get('/static/styles.css', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(cached.data, response.data)
+        revalidated = self.client.get('/static/styles.css', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_page_cache_stores_uncompressed(self):
+        self.app.config['BLOG_PAGE_CACHE'] = True
+        compressed = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(compressed.headers['X-Page-Cache'], 'miss')
+        plain = self.client.get('/')
+        self.assertEqual(plain.headers['X-Page-Cache'], 'hit')
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+
+    def test_flashed_messages_are_not_cached(self):
+        Role.insert_roles()
+        db.session.add(User(name='Admin', username=self.app.config['BLOG_ADMIN'], password='cat'))
+        db.session.commit()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client.post('/auth/login', data={'username': 'admin', 'password': 'cat'})
+        response = self.client.get('/auth/logout', headers={'Accept-Encoding': 'gzip'},
+                                   follow_redirects=True)
+        self.assertIn(b'You have been logged out.', gzip.decompress(response.data))
+        other = self.app.test_client().get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn(b'You have been logged out.', gzip.decompress(other.data))
+
@@ -0,0 +1,64 @@
+import unittest
+from app import create_app, db
+from app.models import *
+
+class ConditionalGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.post = Post(title='first', body='<p>first</p>', author='admin')
+        self.post.set_tags(['news'])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def revalidate(self, url):
+        etag = self.client.get(url).headers['ETag']
+        return lambda: self.client.get(url, headers={'If-None-Match': etag}).status_code
+
+    def test_post_not_modified(self):
+        response = self.client.get('/post/%d' % self.post.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.last_modified)
+        status = self.revalidate('/post/%d' % self.post.id)
+        self.assertEqual(status(), 304)
+
+    def test_post_modified_by_edit(self):
+        status = self.revalidate('/post/%d' % self.post.id)
+        updated_at = self.post.updated_at
+        self.post.body = '<p>changed</p>'
+        db.session.commit()
+        self.assertGreater(self.post.updated_at, updated_at)
+        self.assertEqual(status(), 200)
+
+    def test_post_modified_by_tags(self):
+        status = self.revalidate('/post/%d' % self.post.id)
+        self.post.set_tags(['news', 'more'])
+        db.session.commit()
+        self.assertEqual(status(), 200)
+
+    def test_missing_post(self):
+        self.assertEqual(self.client.get('/post/1000').status_code, 404)
+
+    def test_listings_not_modified(self):
+        for url in ('/', '/tagged/news', '/author/admin'):
+            self.assertEqual(self.revalidate(url)(), 304)
+
+    def test_listings_modified_by_new_post(self):
+        statuses = [self.revalidate(url) for url in ('/', '/tagged/news', '/author/admin')]
+        post = Post(title='second', body='<p>second</p>', author='admin')
+        post.set_tags(['news'])
+        db.session.commit()
+        self.assertEqual([status() for status in statuses], [200, 200, 200])
+
+    def test_flashed_messages_are_shown(self):
+        status = self.revalidate('/')
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('message', 'Post successfully deleted.')]
+        self.assertEqual(status(), 200)
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from app import assets, create_app, db
+from app.assets import build_assets
+from app.export import export_site
+from app.models import *
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['BLOG_POSTS_PER_PAGE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.directory = tempfile.mkdtemp()
+        self.posts = [self.add_post('post %d' % i, ['even' if i % 2 == 0 else 'odd'])
+                      for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        if os.path.exists(self.directory + '.manifest.json'):
+            os.remove(self.directory + '.manifest.json')
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_post(self, title, tags):
+        post = Post(title=title, body='<p>%s</p>' % title, author='admin')
+        post.set_tags(tags)
+        db.session.commit()
+        return post
+
+    def read(self, path):
+        with open(os.path.join(self.directory, path, 'index.html')) as f:
+            return f.read()
+
+    def test_full_export(self):
+        result = export_site(self.directory, 'testing')
+        # 3 index pages, 5 posts, 2 + 1 tag pages and 3 author pages
+        self.assertEqual(result.rendered, 14)
+        self.assertEqual(result.written, 14)
+        self.assertIn('post 4', self.read(''))
+        self.assertIn('post 0', self.read('page/3'))
+        self.assertIn('post 1', self.read('tagged/odd'))
+        self.assertIn('post 0', self.read('author/admin/page/3'))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'static', 'styles.css')))
+
+    def test_built_assets(self):
+        assets_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, assets_dir)
+        self.app.config['BLOG_ASSETS_DIR'] = assets_dir
+        stylesheet = build_assets(self.app.static_folder, assets_dir)['styles.css']
+        self.app.extensions['assets'] = assets.load(self.app)
+        export_site(self.directory, 'testing')
+        self.assertIn('href="/assets/%s"' % stylesheet, self.read(''))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'assets', stylesheet)))
+
+    def test_links_are_rewritten(self):
+        export_site(self.directory, 'testing')
+        page = self.read('page/2')
+        self.assertIn('href="/page/3/"', page)
+        self.assertIn('href="/"', page)
+        self.assertIn('href="/post/%d/"' % self.posts[0].id, self.read('page/3'))
+        self.assertIn('href="/tagged/even/"', page)
+        self.assertNotIn('?after=', page)
+        self.assertNotIn('?before=', page)
+
+    def test_unchanged_pages_are_not_written(self):
+        export_site(self.directory, 'testing')
+        result = export_site(self.directory, 'testing')
+        self.assertEqual(result.rendered, 14)
+        self.assertEqual(result.written, 0)
+
+    def test_incremental_export(self):
+        export_site(self.directory, 'testing')
+        self.posts[1].body = '<p>changed</p>'
+        db.session.commit()
+        result = export_site(self.directory, 'testing', incremental=True)
+        # The index, the post, the odd tag and the author are rendered again
+        self.assertEqual(result.rendered, 3 + 1 + 1 + 3)
+        self.assertIn('changed', self.read('post/%d' % self.posts[1].id))
+        self.assertEqual(export_site(self.directory, 'testing', incremental=True).rendered, 0)
+
+    def test_removed_pages_are_deleted(self):
+        export_site(self.directory, 'testing')
+        self.posts[0].remove()
+        db.session.commit()
+        result = export_site(self.directory, 'testing', incremental=True)
+        self.assertGreater(result.removed, 0)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'post', str(self.posts[0].id))))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'page', '3')))
+        with open(self.directory + '.manifest.json') as f:
+            self.assertNotIn('page/3/index.html', json.load(f)['pages'])
+
+    def test_manifest_is_not_published(self):
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as f:
+            f.write('{"mine": true}')
+        export_site(self.directory, 'testing')
+        self.assertTrue(os.path.exists(self.directory + '.manifest.json'))
+        # A file of the same name in the export directory is the site's own
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            self.assertEqual(f.read(), '{"mine": true}')
+
+    def test_tags_with_slashes_are_skipped(self):
+        self.add_post('post 5', ['CI/CD'])
+        with self.assertLogs('app.export', 'WARNING'):
+            result = export_site(self.directory, 'testing')
+        self.assertIn('post 5', self.read(''))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'tagged', 'CI')))
+        self.assertGreater(result.written, 0)
+
+    def test_worker_processes(self):
+        result = export_site(self.directory, 'testing', workers=2)
+        self.assertEqual(result.written, 14)
+        self.assertIn('post 4', self.read(''))
+        self.assertIn('post 0', self.read('page/3'))
+        self.assertIn('href="/page/2/"', self.read(''))
@@ -0,0 +1,103 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, feed_cache
+from app.models import *
+
+class FeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_post(self, title, tags):
+        post = Post(title=title, body='<p>%s & more</p>' % title, author='admin')
+        post.set_tags(tags)
+        db.session.commit()
+        return post
+
+    def test_feed(self):
+        self.add_post('first', ['news'])
+        response = self.client.get('/feed.atom')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/atom+xml')
+        self.assertIsNotNone(response.headers.get('ETag'))
+        data = response.get_data(as_text=True)
+        self.assertIn('<title>first</title>', data)
+        self.assertIn('<category term="news"/>', data)
+        self.assertIn('&lt;p&gt;first &amp;amp; more&lt;/p&gt;', data)
+
+    def test_conditional_get(self):
+        self.add_post('first', ['news'])
+        etag = self.client.get('/feed.atom').headers['ETag']
+        response = self.client.get('/feed.atom', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+
+    def test_new_post_invalidates_feeds(self):
+        self.add_post('first', ['news'])
+        self.add_post('second', ['other'])
+        feed_etag = self.client.get('/feed.atom').headers['ETag']
+        news_etag = self.client.get('/feed/tag/news.atom').headers['ETag']
+        other_etag = self.client.get('/feed/tag/other.atom').headers['ETag']
+        self.add_post('third', ['news'])
+        response = self.client.get('/feed.atom', headers={'If-None-Match': feed_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('third', response.get_data(as_text=True))
+        response = self.client.get('/feed/tag/news.atom', headers={'If-None-Match': news_etag})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/feed/tag/other.atom', headers={'If-None-Match': other_etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_edits_and_deletes_change_last_modified(self):
+        hour_ago = datetime.utcnow() - timedelta(hours=1)
+        for title in ('first', 'second'):
+            post = self.add_post(title, ['news'])
+            post.time = post.updated_at = hour_ago
+            db.session.commit()
+        self.app.extensions['feed_cache'].clear()
+        self.app.extensions.pop('feed_changed', None)
+        last_modified = self.client.get('/feed.atom').headers['Last-Modified']
+        response = self.client.get('/feed.atom', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        Post.query.filter_by(title='first').one().body = '<p>edited</p>'
+        db.session.commit()
+        response = self.client.get('/feed.atom', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('edited', response.get_data(as_text=True))
+
+        last_modified = response.headers['Last-Modified']
+        time.sleep(1)
+        db.session.delete(Post.query.filter_by(title='first').one())
+        db.session.commit()
+        response = self.client.get('/feed.atom', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('edited', response.get_data(as_text=True))
+
+    def test_feeds_expire(self):
+        self.app.config['BLOG_FEED_CACHE_TTL'] = 0.05
+        feed_cache.init_app(self.app)
+        self.add_post('first', ['news'])
+        self.client.get('/feed.atom')
+        # A post written by another process does not invalidate this process's feeds
+        db.session.execute(db.text("INSERT INTO posts (title, body_format, time) "
+                                   "VALUES ('second', 'html', CURRENT_TIMESTAMP)"))
+        db.session.commit()
+        time.sleep(0.1)
+        self.assertIn('second', self.client.get('/feed.atom').get_data(as_text=True))
+
+    def test_tag_feed(self):
+        self.add_post('first', ['news'])
+        self.add_post('second', ['other'])
+        data = self.client.get('/feed/tag/news.atom').get_data(as_text=True)
+        self.assertIn('first', data)
+        self.assertNotIn('second', data)
+        self.assertEqual(self.client.get('/feed/tag/missing.atom').status_code, 404)
@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.importer import Checkpoint, import_posts
+from app.models import *
+from app.search import find_posts
+
+class ImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'import.checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def write_jsonl(self, count):
+        path = os.path.join(self.directory, 'posts.jsonl')
+        with open(path, 'w') as f:
+            for i in range(count):
+                f.write(json.dumps({'title': 'post %d' % i, 'author': 'ann',
+                                    'body': '<p>body %d</p><script>alert(1)</script>' % i,
+                                    'time': '2020-01-01T00:00:%02dZ' % i,
+                                    'tags': ['all', 'even' if i % 2 == 0 else 'odd']}) + '\n')
+                if i == 2:
+                    f.write('\n')
+        return path
+
+    def test_import_jsonl(self):
+        result = import_posts(self.write_jsonl(5), self.checkpoint, batch_size=2)
+        self.assertEqual(result.imported, 5)
+        self.assertEqual(Post.query.count(), 5)
+        post = Post.with_body().filter_by(title='post 3').one()
+        self.assertEqual(post.body_html, '<p>body 3</p>alert(1)')
+        self.assertEqual(post.body_preview, '<p>body 3</p>alert(1)')
+        self.assertEqual(post.time, datetime(2020, 1, 1, 0, 0, 3))
+        self.assertEqual([t.name for t in post.get_tags()], ['all', 'odd'])
+        self.assertEqual(db.session.get(Tag, 'all').post_count, 5)
+        self.assertEqual(db.session.get(Tag, 'even').post_count, 3)
+        self.assertEqual(len(find_posts('body', per_page=10).items), 5)
+
+    def test_resume(self):
+        source = self.write_jsonl(5)
+        import_posts(source, self.checkpoint, batch_size=2)
+        result = import_posts(source, self.checkpoint, batch_size=2)
+        self.assertEqual((result.imported, result.skipped), (0, 5))
+        self.assertEqual(Post.query.count(), 5)
+
+    def test_resume_after_interrupted_chunk(self):
+        source = self.write_jsonl(5)
+        checkpoint = Checkpoint(self.checkpoint, source)
+        # The first two posts were committed, but the import stopped before the
+        # checkpoint recorded it
+        import_posts(source, self.checkpoint, batch_size=2)
+        last = Post.query.filter_by(title='post 1').one()
+        db.session.query(post_tags).filter(post_tags.c.post_id > last.id).delete()
+        Post.query.filter(Post.id > last.id).delete()
+        db.session.commit()
+        checkpoint.begin(1, 2, last.id, last.title)
+        result = import_posts(source, self.checkpoint, batch_size=2)
+        self.assertEqual((result.imported, result.skipped), (3, 2))
+        self.assertEqual(Post.query.count(), 5)
+
+    def test_restart_without_committed_chunk(self):
+        source = self.write_jsonl(3)
+        Checkpoint(self.checkpoint, source).begin(1, 2, 1000, 'post 1')
+        result = import_posts(source, self.checkpoint, batch_size=2)
+        self.assertEqual(result.imported, 3)
+
+    def test_import_directory(self):
+        with open(os.path.join(self.directory, 'first.md'), 'w') as f:
+            f.write('---\ntitle: From Markdown\ndate: 2019-05-01\ntags: md, notes\n---\n'
+                    'Some *emphasis*.\n')
+        with open(os.path.join(self.directory, 'second.html'), 'w') as f:
+            f.write('<p>Plain HTML</p>')
+        result = import_posts(self.directory, self.checkpoint, author='bob')
+        self.assertEqual(result.imported, 2)
+        post = Post.with_body().filter_by(title='From Markdown').one()
+        self.assertEqual(post.body_html, '<p>Some <em>emphasis</em>.</p>')
+        self.assertEqual((post.body_format, post.body), ('markdown', 'Some *emphasis*.\n'))
+        self.assertEqual(post.time, datetime(2019, 5, 1))
+        self.assertEqual(sorted(t.name for t in post.get_tags()), ['md', 'notes'])
+        post = Post.query.filter_by(title='second').one()
+        self.assertEqual(post.author, 'bob')
+        self.assertEqual([t.name for t in post.get_tags()], ['uncategorized'])
+
+    def test_resume_directory_after_new_files(self):
+        source = os.path.join(self.directory, 'posts')
+        os.makedirs(os.path.join(source, 'b'))
+        for name in ('a.html', os.path.join('b', 'c.html'), 'd.html'):
+            with open(os.path.join(source, name), 'w') as f:
+                f.write('<p>%s</p>' % name)
+        self.assertEqual(import_posts(source, self.checkpoint).imported, 3)
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)['position'], 'd.html')
+        # Files added before the checkpoint do not make the next run import any twice
+        for name in ('b.html', os.path.join('b', 'a.html'), 'e.html'):
+            with open(os.path.join(source, name), 'w') as f:
+                f.write('<p>%s</p>' % name)
+        result = import_posts(source, self.checkpoint)
+        self.assertEqual((result.imported, result.skipped), (1, 3))
+        self.assertEqual(sorted(p.title for p in Post.query), ['a', 'c', 'd', 'e'])
+
+    def test_worker_processes(self):
+        result = import_posts(self.write_jsonl(6), self.checkpoint, batch_size=2, workers=2)
+        self.assertEqual(result.imported, 6)
+        self.assertEqual(db.session.get(Tag, 'odd').post_count, 3)
+
+    def test_invalid_json(self):
+        path = os.path.join(self.directory, 'bad.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"title": "ok"}\nnot json\n')
+        with self.assertRaises(ValueError):
+            import_posts(path, self.checkpoint)
@@ -0,0 +1,85 @@
+import json
+import logging
+import unittest
+from flask import render_template_string
+from app import create_app, db
+from app.instrumentation import timer
+from app.models import *
+
+class InstrumentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['BLOG_INSTRUMENTATION'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.post = Post(title='first', body='<p>first</p>', author='admin')
+        self.post.set_tags(['news'])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def timings(self, response):
+        timings = {}
+        for part in response.headers['Server-Timing'].split(', '):
+            name, *params = part.split(';')
+            timings[name] = dict(param.split('=', 1) for param in params)
+        return timings
+
+    def test_server_timing(self):
+        with self.assertLogs('app.instrumentation', 'INFO') as logs:
+            response = self.client.get('/post/%d' % self.post.id)
+        self.assertEqual(response.status_code, 200)
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'sql', 'render', 'total'})
+        self.assertGreater(float(timings['total']['dur']), 0)
+        queries = int(timings['sql']['desc'].strip('"').split()[0])
+        self.assertGreater(queries, 0)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['endpoint'], 'main.post')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['queries'], queries)
+        self.assertGreaterEqual(line['templates'], 1)
+        slowest = line['slowest']
+        self.assertEqual(len(slowest), min(queries, self.app.config['BLOG_INSTRUMENTATION_SLOWEST']))
+        self.assertEqual([s['ms'] for s in slowest], sorted((s['ms'] for s in slowest), reverse=True))
+        self.assertTrue(all(s['statement'].startswith('SELECT') for s in slowest))
+
+    def test_nested_templates(self):
+        with self.app.test_request_context('/'):
+            self.app.preprocess_request()
+            render_template_string('{{ inner() }}', inner=lambda: render_template_string('x'))
+            response = self.app.process_response(self.app.response_class('ok'))
+        self.assertEqual(self.timings(response)['render']['desc'], '"2 templates"')
+
+    def test_timer(self):
+        with self.app.test_request_context('/'):
+            self.app.preprocess_request()
+            self.post.body = '<p>changed</p><script>x</script>'
+            with timer('other'):
+                pass
+            response = self.app.process_response(self.app.response_class('ok'))
+        self.assertIn('sanitize', self.timings(response))
+        self.assertIn('other', self.timings(response))
+        # Outside a request, timed code just runs
+        with timer('sanitize'):
+            self.post.body = '<p>again</p>'
+        self.assertEqual(self.post.body_html, '<p>again</p>')
+
+    def test_disabled(self):
+        self.app.config['BLOG_INSTRUMENTATION'] = False
+        response = self.client.get('/post/%d' % self.post.id)
+        self.assertNotIn('Server-Timing', response.headers)
+
+    def test_log_level(self):
+        logger = logging.getLogger('app.instrumentation')
+        self.assertEqual(logger.level, logging.INFO)
+        create_app('testing', BLOG_INSTRUMENTATION_LOG_LEVEL=logging.WARNING)
+        self.assertEqual(logger.level, logging.WARNING)
+        create_app('testing')
+        self.assertTrue(logger.isEnabledFor(logging.INFO))
@@ -0,0 +1,111 @@
+import re
+import threading
+import unittest
+from app import create_app, db
+from app.metrics import Histogram
+from app.models import *
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.admin = User(name='Admin', username=self.app.config['BLOG_ADMIN'], password='cat')
+        self.guest = User(name='Guest', username='guest', password='dog')
+        db.session.add_all([self.admin, self.guest])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, username, password):
+        self.client.get('/auth/logout')
+        self.client.post('/auth/login', data={'username': username, 'password': password})
+
+    def scrape(self):
+        self.login('admin', 'cat')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.get_data(as_text=True).splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_admin_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 302)
+        self.login('guest', 'dog')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.login('admin', 'cat')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+
+    def test_request_histograms(self):
+        for _ in range(3):
+            self.client.get('/')
+        samples = self.scrape()
+        self.assertEqual(samples['blog_request_duration_seconds_count{endpoint="main.index"}'], 3)
+        self.assertEqual(
+            samples['blog_request_duration_seconds_bucket{endpoint="main.index",le="+Inf"}'], 3)
+        self.assertGreater(samples['blog_request_duration_seconds_sum{endpoint="main.index"}'], 0)
+        self.assertEqual(samples['blog_request_sql_seconds_count{endpoint="main.index"}'], 3)
+        self.assertGreater(samples['blog_request_sql_seconds_sum{endpoint="main.index"}'], 0)
+        self.assertEqual(samples['blog_request_duration_seconds_count{endpoint="auth.login"}'], 1)
+        self.assertEqual(samples['blog_request_duration_seconds_count{endpoint="auth.logout"}'], 1)
+        # Buckets are cumulative
+        buckets = [value for name, value in samples.items()
+                   if name.startswith('blog_request_duration_seconds_bucket{endpoint="main.index"')]
+        self.assertEqual(buckets, sorted(buckets))
+        # Only the scrape itself is in flight
+        self.assertEqual(samples['blog_requests_in_flight{blueprint="main"}'], 1)
+        self.assertEqual(samples['blog_requests_in_flight{blueprint="auth"}'], 0)
+
+    def test_failed_requests(self):
+        self.assertEqual(self.client.get('/post/999').status_code, 404)
+        samples = self.scrape()
+        self.assertEqual(samples['blog_request_duration_seconds_count{endpoint="main.post"}'], 1)
+        self.assertEqual(samples['blog_requests_in_flight{blueprint="main"}'], 1)
+
+    def test_cache_ratios(self):
+        self.client.get('/')
+        self.client.get('/')
+        samples = self.scrape()
+        hits = samples['blog_cache_hits_total{cache="fragment_cache"}']
+        misses = samples['blog_cache_misses_total{cache="fragment_cache"}']
+        self.assertGreater(hits, 0)
+        self.assertAlmostEqual(samples['blog_cache_hit_ratio{cache="fragment_cache"}'],
+                               hits / (hits + misses))
+        self.assertIn('blog_cache_hits_total{cache="feed_cache"}', samples)
+
+    def test_disabled(self):
+        self.app.config['BLOG_METRICS'] = False
+        self.client.get('/')
+        self.app.config['BLOG_METRICS'] = True
+        samples = self.scrape()
+        self.assertFalse(any('main.index' in name for name in samples))
+
+    def test_histogram_threads(self):
+        histogram = Histogram([0.5, 1.0])
+
+        def observe():
+            for i in range(5000):
+                histogram.observe(i % 3 * 0.5)
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counts, total = histogram.snapshot()
+        self.assertEqual(sum(counts), 20000)
+        # Bucket bounds are inclusive, as Prometheus expects
+        self.assertEqual(counts, [4 * (1667 + 1667), 4 * 1666, 0])
+        self.assertAlmostEqual(total, 4 * (1667 * 0.5 + 1666 * 1.0))
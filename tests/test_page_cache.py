@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import *
+
+class PageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['BLOG_PAGE_CACHE'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.first = self.add_post('first', ['news'])
+        self.second = self.add_post('second', ['other'])
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_post(self, title, tags):
+        post = Post(title=title, body='<p>%s</p>' % title, author='admin')
+        post.set_tags(tags)
+        db.session.commit()
+        return post
+
+    def cache_status(self, url, client=None):
+        return (client or self.client).get(url).headers.get('X-Page-Cache')
+
+    def test_hit_runs_no_queries(self):
+        self.assertEqual(self.cache_status('/'), 'miss')
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get('/')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(response.headers['X-Page-Cache'], 'hit')
+        self.assertIn('first', response.get_data(as_text=True))
+        self.assertEqual(statements, [])
+
+    def test_hit_is_conditional(self):
+        etag = self.client.get('/post/%d' % self.first.id).headers['ETag']
+        response = self.client.get('/post/%d' % self.first.id, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['X-Page-Cache'], 'hit')
+
+    def test_query_string_is_part_of_key(self):
+        self.cache_status('/')
+        self.assertEqual(self.cache_status('/?after=bad'), None)
+        self.assertEqual(self.client.get('/?after=bad').status_code, 400)
+
+    def test_edit_purges_only_affected_pages(self):
+        urls = ['/', '/post/%d' % self.first.id, '/post/%d' % self.second.id,
+                '/tagged/news', '/tagged/other']
+        for url in urls:
+            self.cache_status(url)
+        self.first.body = '<p>changed</p>'
+        db.session.commit()
+        self.assertEqual([self.cache_status(url) for url in urls],
+                         ['miss', 'miss', 'hit', 'miss', 'hit'])
+        self.assertIn('changed', self.client.get('/post/%d' % self.first.id).get_data(as_text=True))
+
+    def test_sidebar_change_purges_everything(self):
+        self.cache_status('/tagged/other')
+        self.add_post('third', ['fresh'])
+        self.assertEqual(self.cache_status('/tagged/other'), 'miss')
+
+    def test_logged_in_users_are_not_cached(self):
+        u = User(name='Ann', username='ann', password='pw')
+        db.session.add(u)
+        db.session.commit()
+        self.cache_status('/')
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(u.id)
+        self.assertIsNone(self.cache_status('/'))
+
+    def test_disabled(self):
+        self.app.config['BLOG_PAGE_CACHE'] = False
+        self.assertIsNone(self.cache_status('/'))
+        self.assertIsNone(self.cache_status('/'))
+
+    def test_directory_is_shared_between_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.app.config['BLOG_PAGE_CACHE_DIR'] = directory
+        other = create_app('testing')
+        other.config.update(BLOG_PAGE_CACHE=True, BLOG_PAGE_CACHE_DIR=directory)
+        url = '/post/%d' % self.first.id
+        self.assertEqual(self.cache_status(url), 'miss')
+        self.assertEqual(self.cache_status(url, other.test_client()), 'hit')
+        self.first.title = 'renamed'
+        db.session.commit()
+        self.assertEqual(self.cache_status(url, other.test_client()), 'miss')
@@ -0,0 +1,100 @@
+import unittest
+from datetime import datetime, timedelta
+from werkzeug.exceptions import BadRequest
+from app import create_app, db, listing_totals
+from app.models import *
+from app.pagination import paginate, encode_cursor, decode_cursor
+
+class PaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        # Twelve posts, the last two sharing a timestamp to exercise the id tie-breaker
+        start = datetime(2020, 1, 1)
+        self.posts = []
+        for i in range(12):
+            p = Post(body="Post %d" % i, title="Post %d" % i,
+                     time=start + timedelta(days=min(i, 10)))
+            self.posts.append(p)
+        db.session.add_all(self.posts)
+        db.session.commit()
+        self.newest_first = sorted(self.posts, key=lambda p: (p.time, p.id), reverse=True)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cursor_round_trip(self):
+        p = self.posts[3]
+        self.assertEqual(decode_cursor(encode_cursor(p.time, p.id)), (p.time, p.id))
+
+    def test_bad_cursor(self):
+        with self.app.test_request_context():
+            with self.assertRaises(BadRequest):
+                decode_cursor('not-a-cursor')
+
+    def test_first_page(self):
+        page = paginate(Post.query, per_page=5)
+        self.assertEqual(page.items, self.newest_first[:5])
+        self.assertTrue(page.has_next)
+        self.assertFalse(page.has_prev)
+
+    def test_walk_forward_and_back(self):
+        seen = []
+        page = paginate(Post.query, per_page=5)
+        seen.extend(page.items)
+        while page.has_next:
+            page = paginate(Post.query, per_page=5, after=page.next_cursor)
+            seen.extend(page.items)
+        self.assertEqual(seen, self.newest_first)
+        self.assertTrue(page.has_prev)
+
+        page = paginate(Post.query, per_page=5, before=page.prev_cursor)
+        self.assertEqual(page.items, self.newest_first[5:10])
+        self.assertTrue(page.has_prev)
+        page = paginate(Post.query, per_page=5, before=page.prev_cursor)
+        self.assertEqual(page.items, self.newest_first[:5])
+        self.assertFalse(page.has_prev)
+
+    def test_approximate_total(self):
+        page = paginate(Post.query, per_page=5, total_key=('index',))
+        self.assertEqual(page.total, 12)
+        db.session.add(Post(body="Another post"))
+        db.session.commit()
+        # The cached count is dropped when a post is committed
+        page = paginate(Post.query, per_page=5, total_key=('index',))
+        self.assertEqual(page.total, 13)
+
+    def test_totals_cache_is_bounded(self):
+        self.app.config['BLOG_TOTALS_CACHE_SIZE'] = 10
+        listing_totals.init_app(self.app)
+        client = self.app.test_client()
+        for i in range(30):
+            client.get('/author/x%d' % i)
+        self.assertEqual(len(self.app.extensions['totals_cache'].keys()), 10)
+
+    def test_index_renders_cursor_links(self):
+        client = self.app.test_client()
+        response = client.get('/')
+        self.assertEqual(response.status_code, 200)
+        cursor = encode_cursor(self.newest_first[4].time, self.newest_first[4].id)
+        self.assertIn('after=%s' % cursor, response.get_data(as_text=True))
+        response = client.get('/?after=%s' % cursor)
+        self.assertIn(self.newest_first[5].title, response.get_data(as_text=True))
+
+    def test_tagged_listing_uses_post_time(self):
+        for p in self.posts[:7]:
+            p.set_tags(["paged"])
+        db.session.commit()
+        tag = Tag.query.get("paged")
+        tagged = sorted(self.posts[:7], key=lambda p: (p.time, p.id), reverse=True)
+        page = paginate(tag.get_post_keys(), per_page=5,
+                        time_column=post_tags.c.post_time, id_column=post_tags.c.post_id)
+        self.assertEqual(Post.from_keys(page.items), tagged[:5])
+        page = paginate(tag.get_post_keys(), per_page=5, after=page.next_cursor,
+                        time_column=post_tags.c.post_time, id_column=post_tags.c.post_id)
+        self.assertEqual(Post.from_keys(page.items), tagged[5:])
+        self.assertFalse(page.has_next)
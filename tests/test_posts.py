@@ -0,0 +1,142 @@
+import unittest
+from app import create_app, db
+from app.models import *
+from app.text import truncate_html
+
+class PostTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_short_html_is_not_truncated(self):
+        html = '<p>A short post.</p>'
+        self.assertEqual(truncate_html(html, 100), html)
+
+    def test_truncate_html_closes_tags(self):
+        html = '<p>One <strong>two three</strong> four</p><p>five</p>'
+        self.assertEqual(truncate_html(html, 12), '<p>One <strong>two...</strong></p>')
+
+    def test_truncate_html_counts_only_text(self):
+        html = '<p><a href="https://example.com/a/very/long/link">link</a> text</p>'
+        self.assertEqual(truncate_html(html, 9), html)
+
+    def test_preview_is_stored_with_body(self):
+        self.app.config['BLOG_PREVIEW_LENGTH'] = 10
+        p = Post(body='<p>Some words in a <em>longer</em> post</p>')
+        db.session.add(p)
+        db.session.commit()
+        self.assertEqual(p.body_preview, '<p>Some words...</p>')
+        p.body = '<p>Short</p>'
+        self.assertEqual(p.body_preview, '<p>Short</p>')
+
+    def test_listing_does_not_load_body(self):
+        p = Post(body='<p>A long body</p>', title='Deferred')
+        db.session.add(p)
+        db.session.commit()
+        db.session.expunge_all()
+        listed = Post.listing().first()
+        self.assertNotIn('body', listed.__dict__)
+        self.assertNotIn('body_html', listed.__dict__)
+        self.assertEqual(listed.body_preview, '<p>A long body</p>')
+        db.session.expunge_all()
+        full = Post.with_body().first()
+        self.assertIn('body', full.__dict__)
+        self.assertIn('body_html', full.__dict__)
+
+    def test_markdown_body(self):
+        p = Post(body_format='markdown', body='Some *emphasis* and <script>x</script>')
+        db.session.add(p)
+        db.session.commit()
+        self.assertEqual(p.body_html, '<p>Some <em>emphasis</em> and x</p>')
+        self.assertEqual(p.body_preview, p.body_html)
+        self.assertEqual(Post(body='Some *emphasis*').body_html, 'Some *emphasis*')
+
+    def test_changing_format_renders_body_again(self):
+        p = Post(body='A *post*')
+        db.session.add(p)
+        db.session.commit()
+        db.session.expunge_all()
+        p = Post.with_body().first()
+        p.body_format = 'markdown'
+        self.assertEqual(p.body_html, '<p>A <em>post</em></p>')
+        p.body_format = 'html'
+        self.assertEqual(p.body_html, 'A *post*')
+
+    def test_rendered_bodies_are_reused(self):
+        calls = []
+
+        def sanitize(html):
+            calls.append(html)
+            return html
+
+        body = 'A body rendered *once*, %s' % id(calls)
+        first = Post.render_body(body, 'markdown', sanitize)
+        self.assertEqual(Post.render_body(body, 'markdown', sanitize), first)
+        self.assertEqual(len(calls), 1)
+        Post.render_body(body, 'html', sanitize)
+        self.assertEqual(len(calls), 2)
+
+    def test_markdown_keeps_markdown_elements(self):
+        html = Post.render_body('### Head\n\n`x`  \nline\n\n---\n\n![a](http://e/x.png)\n\n'
+                                '<h6>small</h6><script>x</script>', 'markdown')
+        for element in ['<h3>Head</h3>', '<code>x</code>', '<br>', '<hr>',
+                        '<img alt="a" src="http://e/x.png">', '<h6>small</h6>']:
+            self.assertIn(element, html)
+        self.assertNotIn('<script>', html)
+        self.assertEqual(Post.render_body('<h3>Head</h3><h6>x</h6>'), '<h3>Head</h3>\nx')
+
+    def test_large_bodies_are_not_remembered(self):
+        calls = []
+
+        def sanitize(html):
+            calls.append(html)
+            return html
+
+        self.app.config['BLOG_SANITIZE_POOL_THRESHOLD'] = 20
+        body = 'A body too large to keep, %s' % id(calls)
+        Post.render_body(body, 'html', sanitize)
+        Post.render_body(body, 'html', sanitize)
+        self.assertEqual(len(calls), 2)
+
+    def test_set_body_renders_once(self):
+        p = Post(body='A *post*')
+        db.session.add(p)
+        db.session.commit()
+        calls = []
+        render = Post._render
+        Post._render = lambda self, body, body_format: (calls.append(body_format),
+                                                        render(self, body, body_format))
+        try:
+            p.set_body('A *new* post', 'markdown')
+        finally:
+            Post._render = render
+        self.assertEqual(calls, ['markdown'])
+        self.assertEqual(p.body_html, '<p>A <em>new</em> post</p>')
+        p.set_body('A *new* post', 'html')
+        self.assertEqual(p.body_html, 'A *new* post')
+
+    def test_markdown_from_form(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        Role.insert_roles()
+        db.session.add(User(name='Admin', username=self.app.config['BLOG_ADMIN'], password='cat'))
+        db.session.commit()
+        client = self.app.test_client()
+        client.post('/auth/login', data={'username': 'admin', 'password': 'cat'})
+        client.post('/new_post', data={'title': 't', 'body': '# Hi\n\n*there*', 'tags': '',
+                                       'body_format': 'markdown'})
+        post = Post.with_body().one()
+        self.assertEqual(post.body_format, 'markdown')
+        self.assertEqual(post.body_html, '<h1>Hi</h1>\n<p><em>there</em></p>')
+        response = client.get('/edit/%d' % post.id)
+        self.assertIn('<option selected value="markdown">', response.get_data(as_text=True))
+        client.post('/edit/%d' % post.id, data={'title': 't', 'body': '# Hi\n\n*there*',
+                                                 'tags': '', 'body_format': 'html'})
+        db.session.expire_all()
+        self.assertEqual(Post.with_body().one().body_html, '# Hi\n\n*there*')
@@ -0,0 +1,105 @@
+import threading
+import unittest
+from app import create_app, db
+from app.models import *
+from app.sanitizer import SanitizeTimeout, Sanitizer, post_sanitizer
+
+class SanitizerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        post_sanitizer.shutdown()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_clean(self):
+        self.assertEqual(post_sanitizer.clean('<p>hi <script>x</script><b>there</b></p>'),
+                         '<p>hi xthere</p>')
+        self.assertEqual(Post.sanitize('<em>a</em><iframe>b</iframe>'), '<em>a</em>b')
+
+    def test_cleaner_per_thread(self):
+        sanitizer = Sanitizer(['p'])
+        cleaners = []
+
+        def clean():
+            sanitizer.clean('<p>x</p>')
+            cleaners.append(sanitizer._local.cleaner)
+
+        threads = [threading.Thread(target=clean) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        clean()
+        clean()
+        self.assertIsNot(cleaners[0], cleaners[1])
+        self.assertIs(cleaners[2], cleaners[3])
+
+    def test_unchanged_body_is_not_sanitized(self):
+        post = Post(title='t', body='<p>body</p>')
+        db.session.add(post)
+        db.session.commit()
+        db.session.remove()
+        post = Post.with_body().filter_by(title='t').one()
+        post.body_html = '<p>stored</p>'
+        post.body = '<p>body</p>'
+        self.assertEqual(post.body_html, '<p>stored</p>')
+        post.body = '<p>changed</p>'
+        self.assertEqual(post.body_html, '<p>changed</p>')
+
+    def test_large_body_in_worker(self):
+        self.app.config['BLOG_SANITIZE_POOL_THRESHOLD'] = 20
+        body = '<p>%s</p><script>x</script>' % ('word ' * 100)
+        post = Post(title='t', body=body)
+        self.assertEqual(post.body_html, post_sanitizer.clean(body))
+
+    def test_timeout(self):
+        self.app.config['BLOG_SANITIZE_POOL_THRESHOLD'] = 20
+        self.app.config['BLOG_SANITIZE_TIMEOUT'] = 0.001
+        body = '<p>%s</p>' % ('<em>word</em> ' * 50000)
+        with self.assertRaises(SanitizeTimeout):
+            Post(title='t', body=body)
+        # The form is shown again, and nothing is saved
+        Role.insert_roles()
+        db.session.add(User(name='Admin', username=self.app.config['BLOG_ADMIN'], password='cat'))
+        db.session.commit()
+        client = self.app.test_client()
+        client.post('/auth/login', data={'username': 'admin', 'password': 'cat'})
+        response = client.post('/new_post', data={'title': 't', 'body': body, 'tags': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('too large', response.get_data(as_text=True))
+        self.assertEqual(Post.query.count(), 0)
+
+    def test_workers_are_reused(self):
+        body = '<p>%s</p><script>x</script>' % ('word ' * 100)
+        post_sanitizer.clean_isolated(body, 60, workers=1)
+        pids = {process.pid for process, _ in post_sanitizer._workers}
+        self.assertEqual(len(pids), 1)
+        post_sanitizer.clean_isolated(body, 60, workers=1)
+        self.assertEqual({process.pid for process, _ in post_sanitizer._workers}, pids)
+        # Only a worker that times out is replaced
+        with self.assertRaises(SanitizeTimeout):
+            post_sanitizer.clean_isolated('<p>%s</p>' % ('<em>word</em> ' * 50000), 0.001)
+        self.assertEqual(len(post_sanitizer._workers), 1)
+        self.assertNotEqual({process.pid for process, _ in post_sanitizer._workers}, pids)
+        self.assertEqual(post_sanitizer.clean_isolated(body, 60), post_sanitizer.clean(body))
+
+    def test_timeout_does_not_affect_other_bodies(self):
+        body = '<p>%s</p><script>x</script>' % ('word ' * 100)
+        results = []
+
+        def clean():
+            results.append(post_sanitizer.clean_isolated(body, 60))
+
+        thread = threading.Thread(target=clean)
+        thread.start()
+        with self.assertRaises(SanitizeTimeout):
+            post_sanitizer.clean_isolated('<p>%s</p>' % ('<em>word</em> ' * 50000), 0.001)
+        thread.join()
+        self.assertEqual(results, [post_sanitizer.clean(body)])
+
@@ -0,0 +1,75 @@
+import unittest
+from app import create_app, db
+from app.models import *
+from app.search import find_posts
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([
+            Post(title='Baking bread', body='<p>Knead the <b>dough</b> for ten minutes.</p>'),
+            Post(title='Sourdough starters', body='<p>Feed the starter daily.</p>'),
+            Post(title='Gardening', body='<p>Nothing about baking at all.</p>'),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_title_matches_rank_first(self):
+        page = find_posts('baking', per_page=5)
+        self.assertEqual([r.post.title for r in page.items], ['Baking bread', 'Gardening'])
+        self.assertIn('<mark>baking</mark>', page.items[1].snippet)
+
+    def test_stemming(self):
+        page = find_posts('kneading', per_page=5)
+        self.assertEqual([r.post.title for r in page.items], ['Baking bread'])
+
+    def test_query_syntax_is_literal(self):
+        page = find_posts('dough" OR "nothing', per_page=5)
+        self.assertEqual(page.items, [])
+
+    def test_index_follows_edits_and_deletes(self):
+        p = Post.query.filter_by(title='Gardening').first()
+        p.body = '<p>Weeding the beds.</p>'
+        db.session.commit()
+        self.assertEqual([r.post.title for r in find_posts('weeding', per_page=5).items], ['Gardening'])
+        self.assertEqual(len(find_posts('baking', per_page=5).items), 1)
+        p.remove()
+        db.session.commit()
+        self.assertEqual(find_posts('weeding', per_page=5).items, [])
+
+    def test_pagination(self):
+        # "the" appears in two of the posts
+        page = find_posts('the', per_page=1)
+        self.assertTrue(page.has_next)
+        rest = find_posts('the', per_page=1, after=page.next_cursor)
+        self.assertFalse(rest.has_next)
+        self.assertNotEqual(rest.items[0].post.id, page.items[0].post.id)
+        back = find_posts('the', per_page=1, before=rest.prev_cursor)
+        self.assertFalse(back.has_prev)
+        self.assertEqual([r.post.id for r in back.items], [r.post.id for r in page.items])
+
+    def test_title_match_without_body(self):
+        post = Post(title='Empty pantry', body='')
+        db.session.add(post)
+        db.session.commit()
+        # snippet() gives NULL for an index entry without a body
+        db.session.execute(db.text('UPDATE posts_fts SET body = NULL WHERE rowid = :id'),
+                           {'id': post.id})
+        db.session.commit()
+        page = find_posts('pantry', per_page=5)
+        self.assertEqual(page.items[0].snippet, '')
+        response = self.app.test_client().get('/search?q=pantry')
+        self.assertIn('Empty pantry', response.get_data(as_text=True))
+        self.assertNotIn('None', response.get_data(as_text=True))
+
+    def test_search_route(self):
+        response = self.app.test_client().get('/search?q=starter')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Sourdough starters', response.get_data(as_text=True))
@@ -0,0 +1,52 @@
+import unittest
+from datetime import timedelta
+from app import create_app, db, fake
+from app.models import *
+
+class SeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def snapshot(self):
+        posts = [(p.title, p.author, p.time, [t.name for t in p.tags])
+                 for p in Post.query.order_by(Post.id)]
+        return posts, [u.name for u in User.query.order_by(User.id)]
+
+    def test_seed(self):
+        created = fake.seed(posts=120, users=5, tags=30, batch_size=50)
+        self.assertEqual(created, 120)
+        self.assertEqual(Post.query.count(), 120)
+        self.assertEqual(User.query.count(), 5)
+        self.assertLessEqual(Tag.query.count(), 30)
+        # Counts written in bulk match the post_tags table
+        self.assertEqual(Tag.recount(), 0)
+        times = [p.time for p in Post.query.order_by(Post.id)]
+        self.assertEqual(times, sorted(times))
+        self.assertLess(times[-1], fake.SEED_END + timedelta(days=365))
+        self.assertGreater(times[0], fake.SEED_END - timedelta(days=3 * 365))
+        self.assertTrue(all(1 <= len(p.tags) <= 4 for p in Post.query))
+
+    def test_popular_tags(self):
+        fake.seed(posts=300, users=3, tags=50)
+        counts = [t.post_count for t in Tag.query.order_by(Tag.post_count.desc())]
+        self.assertGreater(counts[0], 5 * counts[len(counts) // 2])
+
+    def test_same_seed_same_data(self):
+        fake.seed(posts=20, users=3, tags=10, seed=7)
+        first = self.snapshot()
+        db.drop_all()
+        db.create_all()
+        fake.seed(posts=20, users=3, tags=10, seed=7)
+        self.assertEqual(self.snapshot(), first)
+        db.drop_all()
+        db.create_all()
+        fake.seed(posts=20, users=3, tags=10, seed=8)
+        self.assertNotEqual(self.snapshot(), first)
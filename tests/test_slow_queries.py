@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, slow_query_log
+from app.models import *
+from app.slow_queries import fingerprint, read_log, summarize
+
+class SlowQueryLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.log_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.log_dir, 'slow.log')
+        self.app.config['BLOG_SLOW_QUERY_LOG'] = self.path
+        self.app.config['BLOG_SLOW_QUERY_THRESHOLD'] = 0
+        slow_query_log.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        post = Post(title='first', body='<p>first</p>', author='Ann')
+        db.session.add(post)
+        post.set_tags(['news'])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for handler in self.app.extensions['slow_query_log'].handlers:
+            handler.close()
+        shutil.rmtree(self.log_dir)
+
+    def test_logs_request_queries(self):
+        self.client.get('/author/Ann')
+        entries = [e for e in read_log(self.path) if e['endpoint'] == 'main.author']
+        self.assertTrue(entries)
+        listing = [e for e in entries if 'posts.author = ?' in e['statement']][-1]
+        self.assertEqual(listing['url'], '/author/Ann')
+        self.assertIn('Ann', listing['parameters'])
+        self.assertTrue(listing['caller'].startswith('app/'))
+        self.assertNotIn('instrumentation', listing['caller'])
+        # posts.author has no index, so its listing scans the table
+        self.assertTrue(any(line.startswith('SCAN posts') for line in listing['plan']))
+        # Only SELECT statements are explained
+        writes = [e for e in read_log(self.path) if e['statement'].startswith('INSERT')]
+        self.assertTrue(writes)
+        self.assertTrue(all(e['plan'] is None for e in writes))
+
+    def test_threshold(self):
+        self.app.config['BLOG_SLOW_QUERY_THRESHOLD'] = 60
+        before = len(list(read_log(self.path)))
+        self.client.get('/')
+        self.assertEqual(len(list(read_log(self.path))), before)
+
+    def test_log_per_application(self):
+        other = create_app('testing', BLOG_SLOW_QUERY_LOG=os.path.join(self.log_dir, 'other.log'))
+        slow_query_log.init_app(other)
+        before = len(list(read_log(self.path)))
+        self.client.get('/')
+        self.assertGreater(len(list(read_log(self.path))), before)
+        self.assertEqual(list(read_log(os.path.join(self.log_dir, 'other.log'))), [])
+        for handler in other.extensions['slow_query_log'].handlers:
+            handler.close()
+
+    def test_log_file_opened_once(self):
+        logger = self.app.extensions['slow_query_log']
+        for _ in range(3):
+            app = create_app('testing', BLOG_SLOW_QUERY_LOG=self.path)
+            self.assertIs(app.extensions['slow_query_log'], logger)
+        self.assertEqual(len(logger.handlers), 1)
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint("SELECT * FROM posts\n WHERE id IN (?, ?, ?) AND author = 'O''Neil' LIMIT 5"),
+                         'SELECT * FROM posts WHERE id IN (?...) AND author = ? LIMIT ?')
+        self.assertEqual(fingerprint('SELECT * FROM posts WHERE id IN (?, ?)'),
+                         fingerprint('SELECT * FROM posts WHERE id IN (?, ?, ?, ?)'))
+
+    def test_summarize(self):
+        entries = [{'statement': 'SELECT a FROM t WHERE id = 1', 'ms': 5.0, 'endpoint': 'main.post'},
+                   {'statement': 'SELECT a FROM t WHERE id = 2', 'ms': 7.0, 'endpoint': 'main.index',
+                    'plan': ['SCAN t']},
+                   {'statement': 'SELECT b FROM u', 'ms': 10.0, 'endpoint': None, 'caller': 'x'}]
+        worst, other = summarize(entries)
+        self.assertEqual((worst.count, worst.total_ms, worst.max_ms), (2, 12.0, 7.0))
+        self.assertEqual(worst.fingerprint, 'SELECT a FROM t WHERE id = ?')
+        self.assertEqual(worst.plan, ['SCAN t'])
+        self.assertEqual(worst.endpoints, ['main.index', 'main.post'])
+        self.assertEqual(other.endpoints, ['x'])
+        self.assertEqual(len(summarize(entries, limit=1)), 1)
+
+    def test_read_rotated_logs(self):
+        with open(self.path + '.1', 'w') as f:
+            f.write('{"statement": "SELECT 1", "ms": 1}\nnot json\n')
+        self.client.get('/')
+        entries = list(read_log(self.path))
+        self.assertEqual(entries[0]['statement'], 'SELECT 1')
+        self.assertGreater(len(entries), 1)
+
+    def test_disabled(self):
+        app = create_app('testing')
+        self.assertNotIn('slow_query_log', app.extensions)
@@ -2,6 +2,7 @@ import unittest
 from flask import current_app
 from app import create_app, db
 from app.models import *
+from app.cache import content_changed
 
 class TagTestCase(unittest.TestCase):
     def setUp(self):
@@ -64,4 +65,99 @@ class TagTestCase(unittest.TestCase):
         self.assertTrue(len(post.tags) == 3)
         self.assertTrue(post.tags[0].name == "test_post_tag5")
         self.assertTrue(post.tags[1].name == "test_post_tag6")
-        self.assertTrue(post.tags[2].name == "test_post_tag7")
\ No newline at end of file
+        self.assertTrue(post.tags[2].name == "test_post_tag7")
+
+    def test_post_count(self):
+        p1 = Post(body="Test Post 7")
+        p2 = Post(body="Test Post 8")
+        db.session.add_all([p1, p2])
+        p1.tag("counted")
+        p2.tag("counted")
+        p2.tag("")
+        db.session.commit()
+        self.assertEqual(Tag.query.get("counted").post_count, 2)
+        self.assertEqual(Tag.query.get("uncategorized").post_count, 1)
+
+    def test_recount(self):
+        p = Post(body="Test Post 9")
+        db.session.add(p)
+        p.tag("drifted")
+        db.session.commit()
+        Tag.query.get("drifted").post_count = 5
+        db.session.commit()
+        self.assertEqual(Tag.recount(), 1)
+        db.session.commit()
+        self.assertEqual(Tag.query.get("drifted").post_count, 1)
+        self.assertEqual(Tag.recount(), 0)
+
+    def test_set_tags(self):
+        p = Post(body="Test Post 10")
+        p.set_tags(["  first ", "second", "first", ""])
+        db.session.commit()
+        self.assertEqual([t.name for t in p.tags], ["first", "second"])
+        p.set_tags(["second", "third"])
+        db.session.commit()
+        self.assertEqual(sorted(t.name for t in p.tags), ["second", "third"])
+        self.assertEqual(Tag.query.get("third").post_count, 1)
+        # "first" has no posts left, so it is deleted
+        self.assertIsNone(Tag.query.get("first"))
+
+    def test_set_tags_keeps_shared_tags(self):
+        p1 = Post(body="Test Post 12")
+        p2 = Post(body="Test Post 13")
+        p1.set_tags(["shared", "only_p1"])
+        p2.set_tags(["shared"])
+        db.session.commit()
+        p1.set_tags(["other"])
+        db.session.commit()
+        self.assertEqual(Tag.query.get("shared").post_count, 1)
+        self.assertIsNone(Tag.query.get("only_p1"))
+        self.assertEqual([t.name for t in p1.tags], ["other"])
+
+    def test_set_no_tags(self):
+        p = Post(body="Test Post 11")
+        p.set_tags(Tag.parse_names(""))
+        db.session.commit()
+        self.assertEqual([t.name for t in p.tags], ["uncategorized"])
+
+    def test_get_or_create_existing_tag(self):
+        db.session.add(Tag(name="exists", post_count=4))
+        db.session.commit()
+        tags = Tag.get_or_create(["new", "exists"])
+        self.assertEqual([t.name for t in tags], ["new", "exists"])
+        self.assertEqual(tags[1].post_count, 4)
+        self.assertEqual(Tag.query.count(), 2)
+
+    def test_remove_post(self):
+        p1 = Post(body="Test Post 14")
+        p2 = Post(body="Test Post 15")
+        p1.set_tags(["kept", "orphaned"])
+        p2.set_tags(["kept"])
+        db.session.commit()
+        p1.remove()
+        db.session.commit()
+        self.assertEqual(Post.query.count(), 1)
+        self.assertEqual(Tag.query.get("kept").post_count, 1)
+        self.assertIsNone(Tag.query.get("orphaned"))
+        self.assertEqual(db.session.query(post_tags).count(), 1)
+
+    def test_delete_orphans(self):
+        db.session.add_all([Tag(name="unused"), Tag(name="also_unused")])
+        p = Post(body="Test Post 16")
+        p.set_tags(["used"])
+        db.session.commit()
+        sent = []
+
+        def receiver(app, changes):
+            sent.append(changes)
+
+        content_changed.connect(receiver)
+        try:
+            self.assertEqual(Tag.delete_orphans(), 2)
+            db.session.commit()
+        finally:
+            content_changed.disconnect(receiver)
+        self.assertEqual([t.name for t in Tag.query.all()], ["used"])
+        # Caches listing the deleted tags are invalidated
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0].tags, {"unused", "also_unused"})
@@ -0,0 +1,79 @@
+import unittest
+from app import create_app, db
+from app.models import *
+from app.types import RAW, ZLIB, compress_columns, compress_text, decompress_text, stored_bytes
+
+class CompressedTextTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_round_trip(self):
+        for text in ['', 'short', 'é' * 2000, '<p>%s</p>' % ('words ' * 500)]:
+            self.assertEqual(decompress_text(compress_text(text)), text)
+
+    def test_threshold(self):
+        self.assertEqual(compress_text('x' * 100), RAW + b'x' * 100)
+        self.assertEqual(compress_text('x' * 100, threshold=10)[:1], ZLIB)
+        # Text that does not shrink is kept as it is
+        self.assertEqual(compress_text('ab', threshold=0), RAW + b'ab')
+
+    def test_unknown_header(self):
+        with self.assertRaises(ValueError):
+            decompress_text(b'\x7fdata')
+
+    def test_stored_compressed(self):
+        body = '<p>%s</p>' % ('A long paragraph. ' * 200)
+        db.session.add(Post(title='t', body=body))
+        db.session.commit()
+        stored = db.session.execute(db.text('SELECT body, body_html FROM posts')).one()
+        self.assertEqual(stored.body[:1], ZLIB)
+        self.assertLess(len(stored.body), len(body) // 10)
+        db.session.expire_all()
+        post = Post.with_body().one()
+        self.assertEqual(post.body, body)
+        self.assertEqual(post.body_html, body)
+
+    def test_legacy_text_rows(self):
+        body = '<p>%s</p>' % ('Written before compression. ' * 100)
+        db.session.execute(db.text("INSERT INTO posts (title, body, body_html, body_format) "
+                                   "VALUES ('t', :body, :body, 'html')"), {'body': body})
+        db.session.commit()
+        self.assertEqual(Post.with_body().one().body_html, body)
+        connection = db.session.connection()
+        before = stored_bytes(connection, 'posts', ['body', 'body_html'])
+        self.assertEqual(compress_columns(connection, 'posts', ['body', 'body_html']), 1)
+        self.assertLess(stored_bytes(connection, 'posts', ['body', 'body_html']), before // 10)
+        self.assertEqual(compress_columns(connection, 'posts', ['body', 'body_html']), 0)
+        db.session.commit()
+        db.session.expire_all()
+        self.assertEqual(Post.with_body().one().body_html, body)
+
+    def test_plain_bytes_rows(self):
+        # A TEXT column whose type was changed holds plain UTF-8, as the migration leaves it
+        body = '<p>%s</p>' % ('Ünïcode before compression. ' * 100)
+        db.session.execute(db.text("INSERT INTO posts (title, body, body_html, body_format) "
+                                   "VALUES ('t', :body, :body, 'html')"),
+                           {'body': body.encode('utf-8')})
+        db.session.commit()
+        connection = db.session.connection()
+        self.assertEqual(compress_columns(connection, 'posts', ['body', 'body_html'],
+                                          encoded=False), 1)
+        db.session.commit()
+        self.assertEqual(Post.with_body().one().body_html, body)
+
+    def test_post_page(self):
+        body = '<p>%s</p>' % ('Shown on the post page. ' * 100)
+        post = Post(title='t', body=body)
+        db.session.add(post)
+        db.session.commit()
+        response = self.app.test_client().get('/post/%d' % post.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(body, response.get_data(as_text=True))